@@ -0,0 +1,80 @@
+# audio_buffers.py
+import threading
+
+import numpy as np
+
+
+class Int16RingBuffer:
+    """
+    Buffer circolare preallocato di campioni int16, condiviso tra un produttore e un consumatore.
+
+    Scrittura e lettura copiano direttamente da/verso array esistenti (al massimo due
+    slice per operazione, quando si attraversa la fine del buffer): nessuna allocazione
+    dopo la costruzione. Se il buffer è pieno vengono scartati i campioni più vecchi e
+    contati in `dropped`. Il lock protegge solo gli indici ed è tenuto per pochi
+    microsecondi, quindi è sicuro usarlo dal callback di PortAudio.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("La capacità del buffer deve essere positiva.")
+        self.capacity = capacity
+        self.dropped = 0
+        self._buf = np.zeros(capacity, dtype=np.int16)
+        # Contatori assoluti di campioni scritti/letti: la posizione nel buffer è il modulo.
+        self._written = 0
+        self._read = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._written - self._read
+
+    @property
+    def free(self) -> int:
+        return self.capacity - len(self)
+
+    def write(self, samples: np.ndarray) -> int:
+        """Accoda i campioni; ritorna quanti campioni vecchi sono stati scartati per fare spazio."""
+        n = len(samples)
+        if n == 0:
+            return 0
+        with self._lock:
+            dropped = 0
+            if n > self.capacity:
+                dropped += n - self.capacity
+                samples = samples[-self.capacity:]
+                self._read = self._written
+                n = self.capacity
+            overflow = (self._written - self._read) + n - self.capacity
+            if overflow > 0:
+                self._read += overflow
+                dropped += overflow
+            start = self._written % self.capacity
+            first = min(n, self.capacity - start)
+            self._buf[start:start + first] = samples[:first]
+            if first < n:
+                self._buf[:n - first] = samples[first:]
+            self._written += n
+            self.dropped += dropped
+        return dropped
+
+    def read_into(self, out: np.ndarray) -> int:
+        """Copia in `out` fino a len(out) campioni; ritorna quanti ne sono stati letti."""
+        with self._lock:
+            n = min(len(out), self._written - self._read)
+            if n == 0:
+                return 0
+            start = self._read % self.capacity
+            first = min(n, self.capacity - start)
+            out[:first] = self._buf[start:start + first]
+            if first < n:
+                out[first:n] = self._buf[:n - first]
+            self._read += n
+        return n
+
+    def clear(self) -> int:
+        """Svuota il buffer; ritorna il numero di campioni eliminati."""
+        with self._lock:
+            discarded = self._written - self._read
+            self._read = self._written
+        return discarded
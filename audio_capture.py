@@ -0,0 +1,204 @@
+# audio_capture.py
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import sounddevice as sd
+
+logger = logging.getLogger("AudioCapture")
+
+
+class CaptureConsumer:
+    """
+    Lettore indipendente del bus di cattura, con frame della propria dimensione.
+
+    I frame restituiti sono viste sul buffer condiviso (nessuna copia): vanno usati
+    subito, prima che il produttore faccia il giro completo del buffer. Se il consumer
+    resta indietro oltre `max_lag` campioni, l'audio più vecchio viene saltato e
+    contato in `overrun_samples`.
+
+    `gate` (opzionale) viene valutato nel thread audio: quando ritorna False l'audio
+    di quel blocco viene scartato per questo consumer. Con `on_frame` i frame vengono
+    consegnati direttamente nel thread audio; altrimenti si leggono con `next_frame()`.
+    """
+
+    def __init__(self, bus: "CaptureBus", name: str, frame_samples: int, max_lag: int,
+                 gate: Optional[Callable[[], bool]] = None,
+                 on_frame: Optional[Callable[[np.ndarray], None]] = None):
+        self.bus = bus
+        self.name = name
+        self.frame_samples = frame_samples
+        self.max_lag = max_lag
+        self.gate = gate
+        self.on_frame = on_frame
+        self._cursor = bus.written
+        self._ready = asyncio.Event()
+        self._waiting = False
+        self.frames = 0
+        self.overrun_samples = 0
+        self.gated_samples = 0
+        self.max_lag_seen = 0
+
+    @property
+    def lag(self) -> int:
+        return self.bus.written - self._cursor
+
+    def skip_to_latest(self) -> int:
+        """Scarta tutto l'audio non ancora letto; ritorna i campioni saltati."""
+        skipped = self.lag
+        self._cursor += skipped
+        return skipped
+
+    def read_frame(self) -> Optional[np.ndarray]:
+        """Prossimo frame disponibile (vista sul buffer condiviso) o None."""
+        lag = self.bus.written - self._cursor
+        if lag > self.max_lag:
+            skipped = lag - self.max_lag
+            self._cursor += skipped
+            self.overrun_samples += skipped
+            lag = self.max_lag
+        if lag < self.frame_samples:
+            return None
+        self.max_lag_seen = max(self.max_lag_seen, lag)
+        frame = self.bus.view(self._cursor, self.frame_samples)
+        self._cursor += self.frame_samples
+        self.frames += 1
+        return frame
+
+    async def next_frame(self) -> np.ndarray:
+        """Attende il prossimo frame completo."""
+        while True:
+            frame = self.read_frame()
+            if frame is not None:
+                return frame
+            self._ready.clear()
+            self._waiting = True
+            try:
+                await self._ready.wait()
+            finally:
+                self._waiting = False
+
+    # --- Thread audio ---
+    def _on_block(self, frames: int):
+        if self.gate is not None and not self.gate():
+            self.gated_samples += frames
+            self._cursor = self.bus.written
+            return
+        if self.on_frame is not None:
+            while (frame := self.read_frame()) is not None:
+                self.on_frame(frame)
+        elif self._waiting and self.lag >= self.frame_samples:
+            self._waiting = False
+            self.bus.loop.call_soon_threadsafe(self._ready.set)
+
+    def stats(self) -> Dict[str, Any]:
+        sr = self.bus.samplerate
+        return {
+            "frame_ms": round(self.frame_samples * 1000 / sr, 1),
+            "frames": self.frames,
+            "lag_ms": round(self.lag * 1000 / sr),
+            "max_lag_ms": round(self.max_lag_seen * 1000 / sr),
+            "overrun_ms": round(self.overrun_samples * 1000 / sr),
+        }
+
+
+class CaptureBus:
+    """
+    Unico stream di ingresso dal microfono, condiviso da tutti i consumatori.
+
+    Il callback di PortAudio scrive ogni blocco in un buffer circolare int16 e poi
+    avvisa i consumer registrati (Porcupine, uplink verso ElevenLabs, VAD, misure),
+    ognuno dei quali legge con il proprio cursore e la propria dimensione di frame.
+    Il buffer è "specchiato" (ogni campione è scritto anche a +capacity), così
+    qualunque frame fino a `capacity` campioni è una vista contigua senza copie.
+    """
+
+    def __init__(self, samplerate: int = 16000, block_ms: float = 20.0, buffer_ms: float = 2000.0,
+                 device: Optional[Any] = None):
+        self.samplerate = samplerate
+        self.blocksize = int(samplerate * block_ms / 1000)
+        self.capacity = int(samplerate * buffer_ms / 1000)
+        self.device = device
+        self.written = 0
+        self.input_overflows = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._buf = np.zeros(self.capacity * 2, dtype=np.int16)
+        self._consumers: List[CaptureConsumer] = []
+        self._stream: Optional["sd.InputStream"] = None
+
+    def add_consumer(self, name: str, frame_samples: int, max_lag_ms: Optional[float] = None,
+                     gate: Optional[Callable[[], bool]] = None,
+                     on_frame: Optional[Callable[[np.ndarray], None]] = None) -> CaptureConsumer:
+        # Il margine di un blocco evita di leggere una zona che il callback sta riscrivendo.
+        limit = self.capacity - self.blocksize
+        max_lag = min(int(self.samplerate * max_lag_ms / 1000), limit) if max_lag_ms else limit
+        if frame_samples > max_lag:
+            raise ValueError(f"Frame di {frame_samples} campioni troppo grande per il bus di cattura.")
+        consumer = CaptureConsumer(self, name, frame_samples, max(max_lag, frame_samples), gate=gate, on_frame=on_frame)
+        self._consumers = self._consumers + [consumer]
+        logger.info(f"Consumer audio '{name}' registrato (frame da {frame_samples} campioni).")
+        return consumer
+
+    def remove_consumer(self, consumer: CaptureConsumer):
+        self._consumers = [c for c in self._consumers if c is not consumer]
+
+    def view(self, position: int, length: int) -> np.ndarray:
+        start = position % self.capacity
+        return self._buf[start:start + length]
+
+    # --- Ciclo di vita ---
+    def start(self):
+        """Apre lo stream del microfono. Va chiamato dall'interno dell'event loop."""
+        if self._stream:
+            return
+        import sounddevice as sd  # PortAudio viene caricato all'apertura dello stream
+        self.loop = asyncio.get_running_loop()
+        self._stream = sd.InputStream(
+            samplerate=self.samplerate, channels=1, dtype='int16', blocksize=self.blocksize,
+            device=self.device, callback=self._callback,
+        )
+        self._stream.start()
+        logger.info(f"🎙️ Bus di cattura attivo ({self.samplerate} Hz, blocchi da {self.blocksize} campioni).")
+
+    def close(self):
+        if not self._stream:
+            return
+        try:
+            self._stream.stop()
+            self._stream.close()
+        finally:
+            self._stream = None
+            logger.info(f"Bus di cattura chiuso. Statistiche: {self.stats()}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "input_overflows": self.input_overflows,
+            "consumers": {c.name: c.stats() for c in self._consumers},
+        }
+
+    # --- Callback PortAudio (thread audio) ---
+    def _write(self, samples: np.ndarray):
+        n = len(samples)
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        # Scrittura nella prima metà e nello specchio.
+        self._buf[start:start + first] = samples[:first]
+        self._buf[start + self.capacity:start + self.capacity + first] = samples[:first]
+        if first < n:
+            rest = samples[first:]
+            self._buf[:n - first] = rest
+            self._buf[self.capacity:self.capacity + n - first] = rest
+        self.written += n
+
+    def _callback(self, indata: np.ndarray, frames: int, time_info: Any, status: "sd.CallbackFlags"):
+        if status.input_overflow:
+            self.input_overflows += 1
+        self._write(indata[:, 0])
+        for consumer in self._consumers:
+            try:
+                consumer._on_block(frames)
+            except Exception as e:
+                self.loop.call_soon_threadsafe(logger.error, f"Errore nel consumer audio '{consumer.name}': {e}")
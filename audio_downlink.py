@@ -0,0 +1,54 @@
+# audio_downlink.py
+import binascii
+import re
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+
+# Un messaggio `audio` di ElevenLabs è {"audio_event": {"audio_base_64": "...", ...}, "type": "audio"}
+# (l'ordine delle chiavi non è garantito): basta trovare la chiave del payload e il tipo.
+_AUDIO_KEY = re.compile(rb'"audio_base_64"\s*:\s*"')
+_AUDIO_TYPE = re.compile(rb'"type"\s*:\s*"audio"')
+
+
+class AudioDownlink:
+    """
+    Percorso veloce per i messaggi `audio` ricevuti dal websocket dell'agente.
+
+    Il messaggio arriva come bytes (`recv(decode=False)`, senza decodifica UTF-8): il
+    base64 viene individuato con due ricerche sulle parti fuori dal payload e decodificato
+    da una memoryview, senza `json.loads` (che copierebbe il payload in una stringa) né
+    dizionari intermedi. Resta una sola allocazione per chunk, il PCM decodificato, che
+    `AudioOutput` copia subito nel suo ring buffer.
+
+    Tutto ciò che non ha la forma attesa (altri tipi, testo, escape nel payload) ritorna
+    None e va gestito dal percorso generico con `json.loads`.
+    """
+
+    def __init__(self):
+        self.fast_messages = 0
+        self.generic_messages = 0
+        self.bytes_received = 0
+
+    def parse_audio(self, message: Union[bytes, str]) -> Optional[np.ndarray]:
+        """Campioni int16 di un messaggio `audio`, oppure None se va usato il percorso generico."""
+        self.bytes_received += len(message)
+        if isinstance(message, bytes):
+            key = _AUDIO_KEY.search(message)
+            if key:
+                start = key.end()
+                end = message.find(b'"', start)
+                if end > 0 and message.find(b"\\", start, end) < 0 and (
+                        _AUDIO_TYPE.search(message, end + 1) or _AUDIO_TYPE.search(message, 0, key.start())):
+                    pcm = binascii.a2b_base64(memoryview(message)[start:end])
+                    self.fast_messages += 1
+                    return np.frombuffer(pcm, dtype=np.int16, count=len(pcm) // 2)
+        self.generic_messages += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "fast_messages": self.fast_messages,
+            "generic_messages": self.generic_messages,
+            "kbytes_received": round(self.bytes_received / 1024, 1),
+        }
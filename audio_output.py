@@ -0,0 +1,159 @@
+# audio_output.py
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+import numpy as np
+
+from audio_buffers import Int16RingBuffer
+
+if TYPE_CHECKING:
+    import sounddevice as sd
+
+logger = logging.getLogger("AudioOutput")
+
+
+class AudioOutput:
+    """
+    Riproduzione continua del parlato dell'agente su un unico `sd.OutputStream`.
+
+    Lo stream resta aperto per tutta la vita del processo: i chunk PCM ricevuti dal
+    websocket vengono solo accodati in un ring buffer int16 preallocato e il callback
+    di PortAudio li legge a blocchi fissi, senza pause tra un chunk e l'altro.
+
+    Jitter buffer: quando il buffer è vuoto la riproduzione riparte solo dopo aver
+    accumulato `preroll_ms` di audio (o dopo `preroll_ms` dal primo campione, per le
+    frasi più corte). Se il buffer si svuota a metà frase e l'audio riprende entro
+    `underrun_gap_s`, l'evento viene contato come underrun.
+    """
+
+    def __init__(self, samplerate: int = 16000, block_ms: float = 20.0, preroll_ms: float = 120.0,
+                 buffer_s: float = 60.0, underrun_gap_s: float = 0.5, latency: Any = "low",
+                 device: Optional[Any] = None):
+        self.samplerate = samplerate
+        self.blocksize = int(samplerate * block_ms / 1000)
+        self.preroll_samples = int(samplerate * preroll_ms / 1000)
+        self.preroll_s = preroll_ms / 1000
+        self.underrun_gap_s = underrun_gap_s
+        self.latency = latency
+        self.device = device
+        self._ring = Int16RingBuffer(int(samplerate * buffer_s))
+        self._stream: Optional["sd.OutputStream"] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._drained = asyncio.Event()
+        self._drained.set()
+        # Stato condiviso col callback (scritture atomiche di singoli attributi).
+        self._priming = True
+        self._first_sample_at = 0.0
+        self._starved_at: Optional[float] = None
+        # Contatori
+        self.chunks = 0
+        self.underruns = 0
+        self.output_underflows = 0
+        self.flushed_samples = 0
+        self.played_samples = 0
+
+    # --- Ciclo di vita ---
+    def start(self):
+        """Apre lo stream di uscita. Va chiamato dall'interno dell'event loop."""
+        if self._stream:
+            return
+        import sounddevice as sd  # PortAudio viene caricato all'apertura dello stream
+        self._loop = asyncio.get_running_loop()
+        self._stream = sd.OutputStream(
+            samplerate=self.samplerate, channels=1, dtype='int16', blocksize=self.blocksize,
+            latency=self.latency, device=self.device, callback=self._callback,
+        )
+        self._stream.start()
+        logger.info(f"🔊 Stream di uscita aperto ({self.samplerate} Hz, blocchi da {self.blocksize} campioni, "
+                    f"pre-roll {self.preroll_s * 1000:.0f} ms).")
+
+    def close(self):
+        if not self._stream:
+            return
+        try:
+            self._stream.stop()
+            self._stream.close()
+        finally:
+            self._stream = None
+            logger.info(f"Stream di uscita chiuso. Statistiche: {self.stats()}")
+
+    # --- API usata dall'agente ---
+    def enqueue(self, pcm: bytes):
+        """Accoda un chunk PCM int16 mono. Non blocca e non attende la riproduzione."""
+        self.enqueue_samples(np.frombuffer(pcm, dtype=np.int16))
+
+    def enqueue_samples(self, samples: np.ndarray):
+        """Come `enqueue`, per campioni già decodificati: vengono copiati nel ring buffer."""
+        if samples.size == 0:
+            return
+        now = time.monotonic()
+        if self._starved_at is not None:
+            if now - self._starved_at < self.underrun_gap_s:
+                self.underruns += 1
+                logger.debug(f"Underrun audio: buffer vuoto per {(now - self._starved_at) * 1000:.0f} ms.")
+            self._starved_at = None
+        if len(self._ring) == 0:
+            self._first_sample_at = now
+        self._ring.write(samples)
+        self.chunks += 1
+        self._drained.clear()
+
+    def flush(self) -> int:
+        """Interrompe subito il parlato: scarta l'audio ancora in coda. Ritorna i campioni scartati."""
+        discarded = self._ring.clear()
+        self._priming = True
+        self._starved_at = None
+        self.flushed_samples += discarded
+        self._drained.set()
+        if discarded:
+            logger.info(f"🔇 Audio agente interrotto ({discarded / self.samplerate:.2f}s scartati).")
+        return discarded
+
+    async def drain(self):
+        """Attende che tutto l'audio accodato sia stato riprodotto."""
+        await self._drained.wait()
+
+    @property
+    def is_playing(self) -> bool:
+        return not self._drained.is_set()
+
+    @property
+    def buffered_s(self) -> float:
+        return len(self._ring) / self.samplerate
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "chunks": self.chunks,
+            "played_s": round(self.played_samples / self.samplerate, 1),
+            "underruns": self.underruns,
+            "output_underflows": self.output_underflows,
+            "dropped_s": round(self._ring.dropped / self.samplerate, 2),
+            "flushed_s": round(self.flushed_samples / self.samplerate, 2),
+        }
+
+    # --- Callback PortAudio (thread audio) ---
+    def _mark_drained(self):
+        if len(self._ring) == 0:
+            self._drained.set()
+
+    def _callback(self, outdata: np.ndarray, frames: int, time_info: Any, status: "sd.CallbackFlags"):
+        if status.output_underflow:
+            self.output_underflows += 1
+        out = outdata[:, 0]
+        if self._priming:
+            buffered = len(self._ring)
+            if buffered == 0 or (buffered < self.preroll_samples
+                                 and time.monotonic() - self._first_sample_at < self.preroll_s):
+                out.fill(0)
+                return
+            self._priming = False
+
+        n = self._ring.read_into(out)
+        self.played_samples += n
+        if n < frames:
+            out[n:] = 0
+            self._priming = True
+            self._starved_at = time.monotonic()
+            self._loop.call_soon_threadsafe(self._mark_drained)
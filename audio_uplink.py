@@ -0,0 +1,102 @@
+# audio_uplink.py
+import asyncio
+import binascii
+import logging
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from audio_capture import CaptureBus, CaptureConsumer
+from audio_vad import EnergyVAD, VAD_SPEECH, VAD_KEEPALIVE, silence_frame
+
+logger = logging.getLogger("AudioUplink")
+
+_ENVELOPE_PREFIX = b'{"type":"user_audio_chunk","user_audio_chunk":"'
+_ENVELOPE_SUFFIX = b'"}'
+
+
+class MicUplink:
+    """
+    Invio dell'audio del microfono al websocket a frame di dimensione configurabile.
+
+    L'audio arriva da un consumer del `CaptureBus` (`attach`): `send_next` prende un
+    frame alla volta come vista sul buffer condiviso, lo codifica in base64 direttamente
+    dentro un envelope JSON già pronto e lo invia. Con frame da 100 ms i messaggi al
+    secondo passano da 50 a 10. Se l'invio resta indietro di oltre `max_buffer_ms` si
+    scarta l'audio più vecchio (contato in `stats()`), non quello appena arrivato.
+
+    Con un `EnergyVAD` i frame di silenzio non vengono inviati: al loro posto parte
+    ogni tanto un frame di silenzio precodificato (`silence_b64`).
+    """
+
+    def __init__(self, samplerate: int = 16000, frame_ms: float = 20.0, max_buffer_ms: float = 1000.0,
+                 vad: Optional[EnergyVAD] = None, silence_b64: str = ""):
+        self.samplerate = samplerate
+        self.frame_ms = frame_ms
+        self.frame_samples = int(samplerate * frame_ms / 1000)
+        self.max_buffer_ms = max_buffer_ms
+        self._consumer: Optional[CaptureConsumer] = None
+        b64_len = 4 * ((self.frame_samples * 2 + 2) // 3)
+        self._envelope = bytearray(_ENVELOPE_PREFIX + b"A" * b64_len + _ENVELOPE_SUFFIX)
+        self._payload = slice(len(_ENVELOPE_PREFIX), len(_ENVELOPE_PREFIX) + b64_len)
+        self.vad = vad
+        self._silence_message = self.encode_frame(silence_frame(silence_b64, self.frame_samples))
+        self.frames_sent = 0
+        self.frames_suppressed = 0
+        self.bytes_sent = 0
+
+    def attach(self, bus: CaptureBus, gate: Optional[Callable[[], bool]] = None):
+        """Registra l'uplink sul bus di cattura; `gate` decide (nel thread audio) se l'audio va tenuto."""
+        if bus.samplerate != self.samplerate:
+            raise ValueError(f"Il bus di cattura è a {bus.samplerate} Hz, l'uplink richiede {self.samplerate} Hz.")
+        self._consumer = bus.add_consumer("uplink", self.frame_samples, max_lag_ms=self.max_buffer_ms, gate=gate)
+
+    # --- Lato event loop ---
+    def reset(self):
+        """Scarta l'audio non ancora inviato (es. quando il microfono viene disattivato)."""
+        self._consumer.skip_to_latest()
+        if self.vad:
+            self.vad.reset()
+
+    def encode_frame(self, frame: np.ndarray) -> str:
+        """Messaggio JSON per un frame, scritto nell'envelope preallocato."""
+        self._envelope[self._payload] = binascii.b2a_base64(frame, newline=False)
+        return self._envelope.decode("ascii")
+
+    async def _send(self, websocket: Any, message: str):
+        await websocket.send(message)
+        self.frames_sent += 1
+        self.bytes_sent += len(message)
+
+    async def send_next(self, websocket: Any, timeout: Optional[float] = None) -> bool:
+        """
+        Attende il prossimo frame del microfono e lo invia (o lo sostituisce, se c'è il VAD).
+        Ritorna False se entro `timeout` non è arrivato nessun frame.
+        """
+        try:
+            frame = await asyncio.wait_for(self._consumer.next_frame(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        if not self.vad:
+            await self._send(websocket, self.encode_frame(frame))
+            return True
+        decision = self.vad.process(frame)
+        if decision == VAD_SPEECH:
+            for padding in self.vad.take_padding():
+                await self._send(websocket, self.encode_frame(padding))
+            await self._send(websocket, self.encode_frame(frame))
+        elif decision == VAD_KEEPALIVE:
+            await self._send(websocket, self._silence_message)
+        else:
+            self.frames_suppressed += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "frame_ms": self.frame_ms,
+            "frames_sent": self.frames_sent,
+            "frames_suppressed": self.frames_suppressed,
+            "kbytes_sent": round(self.bytes_sent / 1024, 1),
+            "dropped_ms": round(self._consumer.overrun_samples * 1000 / self.samplerate) if self._consumer else 0,
+            **({"vad": self.vad.stats()} if self.vad else {}),
+        }
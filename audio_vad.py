@@ -0,0 +1,168 @@
+# audio_vad.py
+import base64
+import logging
+from typing import Any, Dict, Iterator
+
+import numpy as np
+
+logger = logging.getLogger("AudioVAD")
+
+# Esiti di `EnergyVAD.process` per ogni frame.
+VAD_SPEECH = "speech"        # frame da inviare così com'è
+VAD_SILENCE = "silence"      # frame da non inviare
+VAD_KEEPALIVE = "keepalive"  # al posto del frame va inviato un frame di silenzio
+
+_SUBFRAME_MS = 10
+
+
+def silence_frame(b64_silence: str, frame_samples: int) -> np.ndarray:
+    """Frame di silenzio della lunghezza richiesta, ripetendo il silenzio base64 di config."""
+    base = np.frombuffer(base64.b64decode(b64_silence), dtype=np.int16)
+    if base.size == 0:
+        return np.zeros(frame_samples, dtype=np.int16)
+    return np.resize(base, frame_samples)
+
+
+class EnergyVAD:
+    """
+    Rilevatore di voce basato sull'energia (RMS) dei frame del microfono.
+
+    Ogni frame viene diviso in sotto-blocchi da 10 ms e l'RMS di tutti i sotto-blocchi
+    è calcolato in un'unica operazione NumPy; il frame è "voce" se almeno un
+    sotto-blocco supera la soglia. La soglia parte da `initial_threshold`
+    (SILENCE_THRESHOLD) e, dopo `calibration_ms` di audio, viene ricalcolata dal
+    rumore di fondo misurato (`noise_ratio` × rumore) e poi adattata lentamente sui
+    frame di silenzio.
+
+    Attorno al parlato:
+      - padding: gli ultimi `padding_ms` di audio prima della voce vengono inviati
+        all'inizio del parlato, così l'attacco delle parole non viene tagliato;
+      - hangover: dopo l'ultimo frame sopra soglia si continua a inviare audio reale
+        per `hangover_ms` (pause tra le parole);
+      - coda: per `trailing_silence_ms` si inviano frame di silenzio a piena cadenza,
+        perché il rilevamento di fine turno lato server veda il silenzio;
+      - keepalive: nel silenzio prolungato si invia un frame di silenzio ogni
+        `keepalive_ms`, per tenere viva la sessione.
+    """
+
+    def __init__(self, samplerate: int, frame_samples: int, initial_threshold: float = 200.0,
+                 min_threshold: float = 50.0, noise_ratio: float = 3.0, calibration_ms: float = 1000.0,
+                 hangover_ms: float = 300.0, padding_ms: float = 200.0, trailing_silence_ms: float = 1000.0,
+                 keepalive_ms: float = 1000.0):
+        frame_ms = frame_samples * 1000 / samplerate
+        self.frame_samples = frame_samples
+        self.subframe = max(1, samplerate * _SUBFRAME_MS // 1000)
+        if frame_samples % self.subframe:
+            self.subframe = frame_samples
+        self.threshold = float(initial_threshold)
+        self.min_threshold = min_threshold
+        self.noise_ratio = noise_ratio
+        self.noise_floor = None
+        self._hangover_frames = int(round(hangover_ms / frame_ms))
+        self._trailing_frames = int(round(trailing_silence_ms / frame_ms))
+        self._keepalive_frames = max(1, int(round(keepalive_ms / frame_ms)))
+        self._calibration = np.zeros(max(1, int(round(calibration_ms / frame_ms))), dtype=np.float32)
+        self._calibrated = 0
+        # Padding pre-voce: ring di frame preallocato.
+        self._padding = np.zeros((int(round(padding_ms / frame_ms)), frame_samples), dtype=np.int16)
+        self._padding_next = 0
+        self._padding_count = 0
+        self._sub_rms = np.zeros(frame_samples // self.subframe, dtype=np.float32)
+        self._square = np.zeros(frame_samples, dtype=np.float32)
+        self.reset()
+        # Contatori
+        self.speech_frames = 0
+        self.silent_frames = 0
+        self.keepalive_frames = 0
+        self.padding_frames = 0
+        self.segments = 0
+
+    def reset(self):
+        """Azzera lo stato del parlato (non la calibrazione), es. quando il microfono viene chiuso."""
+        self.in_speech = False
+        self._hangover_left = 0
+        self._trailing_left = 0
+        self._since_keepalive = 0
+        self._padding_count = 0
+
+    def rms(self, frame: np.ndarray) -> float:
+        np.multiply(frame, frame, out=self._square, dtype=np.float32)
+        np.sqrt(self._square.reshape(-1, self.subframe).mean(axis=1), out=self._sub_rms)
+        return float(self._sub_rms.max())
+
+    def _update_noise_floor(self, rms: float):
+        if self._calibrated < len(self._calibration):
+            self._calibration[self._calibrated] = rms
+            self._calibrated += 1
+            if self._calibrated == len(self._calibration):
+                # Il 20° percentile ignora le parole pronunciate durante la calibrazione.
+                self.noise_floor = float(np.percentile(self._calibration, 20))
+                self.threshold = max(self.min_threshold, self.noise_floor * self.noise_ratio)
+                logger.info(f"🎚️ VAD calibrato: rumore di fondo {self.noise_floor:.0f} RMS, soglia {self.threshold:.0f}.")
+        elif not self.in_speech:
+            self.noise_floor = 0.98 * self.noise_floor + 0.02 * rms
+            self.threshold = max(self.min_threshold, self.noise_floor * self.noise_ratio)
+
+    def _push_padding(self, frame: np.ndarray):
+        if not len(self._padding):
+            return
+        self._padding[self._padding_next] = frame
+        self._padding_next = (self._padding_next + 1) % len(self._padding)
+        self._padding_count = min(self._padding_count + 1, len(self._padding))
+
+    def take_padding(self) -> Iterator[np.ndarray]:
+        """Frame di audio precedenti all'inizio del parlato, dal più vecchio (viste, nessuna copia)."""
+        count, self._padding_count = self._padding_count, 0
+        start = self._padding_next - count
+        for i in range(start, self._padding_next):
+            self.padding_frames += 1
+            yield self._padding[i % len(self._padding)]
+
+    def process(self, frame: np.ndarray) -> str:
+        rms = self.rms(frame)
+        calibrating = self._calibrated < len(self._calibration)
+        if calibrating or rms < self.threshold:
+            self._update_noise_floor(rms)
+
+        if rms >= self.threshold:
+            if not self.in_speech:
+                self.in_speech = True
+                self.segments += 1
+            self._hangover_left = self._hangover_frames
+            self.speech_frames += 1
+            return VAD_SPEECH
+
+        if self.in_speech and self._hangover_left > 0:
+            self._hangover_left -= 1
+            self.speech_frames += 1
+            return VAD_SPEECH
+
+        if self.in_speech:
+            self.in_speech = False
+            self._trailing_left = self._trailing_frames
+            self._since_keepalive = 0
+            self._padding_count = 0
+        self._push_padding(frame)
+        if self._trailing_left > 0:
+            self._trailing_left -= 1
+            self.keepalive_frames += 1
+            return VAD_KEEPALIVE
+        self._since_keepalive += 1
+        if self._since_keepalive >= self._keepalive_frames:
+            self._since_keepalive = 0
+            self.keepalive_frames += 1
+            return VAD_KEEPALIVE
+        self.silent_frames += 1
+        return VAD_SILENCE
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.speech_frames + self.silent_frames + self.keepalive_frames
+        return {
+            "threshold": round(self.threshold),
+            "noise_floor": round(self.noise_floor) if self.noise_floor is not None else None,
+            "segments": self.segments,
+            "speech_frames": self.speech_frames,
+            "padding_frames": self.padding_frames,
+            "keepalive_frames": self.keepalive_frames,
+            "suppressed_ratio": round(self.silent_frames / total, 2) if total else 0.0,
+        }
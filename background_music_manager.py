@@ -1,74 +1,118 @@
 # background_music_manager.py (VERSIONE CON VOLUME FISSO)
 import asyncio
 import logging
-import subprocess
-import psutil
+import signal
+from typing import Optional
+
+from toggle_event import ToggleEvent
 
 logger = logging.getLogger("BackgroundMusicManager")
 
-def find_ffplay_process():
-    """Cerca un processo ffplay attivo."""
-    for proc in psutil.process_iter(['pid', 'name']):
-        if 'ffplay' in proc.info['name'].lower():
-            return proc
-    return None
+# Attesa prima di riprovare se ffplay non parte o termina da solo.
+_RESPAWN_DELAY_S = 5.0
 
 class BackgroundMusicManager:
     # Impostiamo il volume di default a 60
-    def __init__(self, track_path: str, spotify_playback_event: asyncio.Event, hotword_detected_event: asyncio.Event, user_can_speak_event: asyncio.Event, volume_percent: int = 60):
+    def __init__(self, track_path: str, spotify_playback_event: ToggleEvent, hotword_detected_event: asyncio.Event, user_can_speak_event: asyncio.Event, volume_percent: int = 60):
         self.track_path = track_path
+        # Serve un ToggleEvent: il manager attende sia l'avvio sia la fine della riproduzione Spotify.
         self.spotify_playback_event = spotify_playback_event
         self.hotword_detected_event = hotword_detected_event
         # L'evento user_can_speak viene ricevuto ma non più utilizzato in questa versione
         self.user_can_speak_event = user_can_speak_event
-        
+
         # L'unico livello di volume che ci interessa
         self.normal_volume = volume_percent
-        
-        self.process = None
+
+        # L'unico processo ffplay gestito: quello avviato da noi.
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.paused = False
         self.logger = logger
         self.running = True
 
-    async def _start_music_if_not_running(self):
-        # NUOVA LOGICA SEMPLIFICATA: se ffplay non è attivo, lo avvia. Altrimenti non fa nulla.
-        if not find_ffplay_process():
-            try:
-                self.logger.info(f"🎵 Avvio musica di sottofondo a volume fisso {self.normal_volume}%...")
-                self.process = await asyncio.create_subprocess_exec(
-                    "ffplay", "-nodisp", "-autoexit", "-loop", "0",
-                    "-volume", str(self.normal_volume), self.track_path,
-                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
-                )
-                self.logger.info(f"Processo 'ffplay' avviato con PID: {self.process.pid}")
-            except Exception as e:
-                self.logger.error(f"❌ Errore durante l'esecuzione di ffplay: {e}")
-                self.process = None
+    def _child_alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
 
-    def _force_kill_ffplay(self, log=True):
-        if log: self.logger.warning("Esecuzione di un comando di terminazione forzata tramite 'pkill'...")
+    async def _spawn_ffplay(self):
         try:
-            subprocess.run(["pkill", "-f", "ffplay"], capture_output=True, text=True, check=False)
-            if log: self.logger.info("✅ Comando 'pkill' eseguito.")
-            self.process = None
+            self.logger.info(f"🎵 Avvio musica di sottofondo a volume fisso {self.normal_volume}%...")
+            self.process = await asyncio.create_subprocess_exec(
+                "ffplay", "-nodisp", "-autoexit", "-loop", "0",
+                "-volume", str(self.normal_volume), self.track_path,
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+            )
+            self.paused = False
+            self.logger.info(f"Processo 'ffplay' avviato con PID: {self.process.pid}")
         except Exception as e:
-            self.logger.error(f"Errore imprevisto durante l'esecuzione di pkill: {e}")
+            self.logger.error(f"❌ Errore durante l'esecuzione di ffplay: {e}")
+            self.process = None
+
+    async def _play(self):
+        # Se il nostro ffplay è in pausa lo riprende dal punto in cui era, altrimenti lo avvia.
+        if self._child_alive():
+            if self.paused:
+                self.process.send_signal(signal.SIGCONT)
+                self.paused = False
+                self.logger.info("🎵 Ripresa musica di sottofondo.")
+            return
+        await self._spawn_ffplay()
+
+    def _pause(self):
+        if self._child_alive() and not self.paused:
+            self.logger.info("🎵 Pausa musica di sottofondo per Spotify...")
+            self.process.send_signal(signal.SIGSTOP)
+            self.paused = True
+
+    def _terminate_child(self):
+        if not self._child_alive():
+            self.process = None
+            return
+        try:
+            self.process.terminate()
+            # Un processo fermato con SIGSTOP riceve il SIGTERM solo dopo essere ripartito.
+            if self.paused:
+                self.process.send_signal(signal.SIGCONT)
+            self.logger.info(f"✅ Processo 'ffplay' (PID {self.process.pid}) terminato.")
+        except ProcessLookupError:
+            pass
+        self.process = None
+        self.paused = False
 
     def stop(self):
         self.running = False
-        self._force_kill_ffplay()
+        self._terminate_child()
+
+    async def _wait_for_spotify_or_exit(self):
+        """Attende che Spotify parta o che ffplay termini da solo (errore o file non valido)."""
+        waiters = [asyncio.create_task(self.spotify_playback_event.wait())]
+        if self._child_alive():
+            waiters.append(asyncio.create_task(self.process.wait()))
+        else:
+            waiters.append(asyncio.create_task(asyncio.sleep(_RESPAWN_DELAY_S)))
+        try:
+            done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        if waiters[0] not in done and self.process is not None and self.process.returncode is not None:
+            self.logger.warning(f"ffplay terminato inaspettatamente (codice {self.process.returncode}), nuovo avvio tra {_RESPAWN_DELAY_S:.0f}s.")
+            self.process = None
+            await asyncio.sleep(_RESPAWN_DELAY_S)
 
     async def start(self):
         await self.hotword_detected_event.wait()
         self.logger.info("Hotword rilevata! Avvio ciclo di gestione musica di sottofondo.")
 
-        while self.running:
-            # Se Spotify sta suonando, la musica di sottofondo deve essere spenta
-            if self.spotify_playback_event.is_set():
-                if find_ffplay_process():
-                    self.logger.info("🎵 Pausa musica di sottofondo per Spotify...")
-                    self._force_kill_ffplay()
-            # Altrimenti, assicurati che la musica sia in esecuzione
-            else:
-                await self._start_music_if_not_running()
-
-            await asyncio.sleep(1)
+        # Nessun polling: il ciclo si risveglia solo alle transizioni di spotify_playback_event.
+        try:
+            while self.running:
+                # Se Spotify sta suonando, la musica di sottofondo va in pausa (senza perdere la posizione)
+                if self.spotify_playback_event.is_set():
+                    self._pause()
+                    await self.spotify_playback_event.wait_cleared()
+                # Altrimenti, assicurati che la musica sia in esecuzione
+                else:
+                    await self._play()
+                    await self._wait_for_spotify_or_exit()
+        finally:
+            self._terminate_child()
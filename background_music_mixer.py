@@ -0,0 +1,178 @@
+# background_music_mixer.py
+import asyncio
+import logging
+import os
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import sounddevice as sd
+
+from toggle_event import ToggleEvent
+
+logger = logging.getLogger("BackgroundMusicMixer")
+
+
+def pcm_cache_path(track_path: str, cache_dir: str, samplerate: int, channels: int) -> str:
+    stem = os.path.splitext(os.path.basename(track_path))[0]
+    return os.path.join(cache_dir, f".{stem}.{samplerate}hz{channels}ch.s16le")
+
+
+async def decode_to_pcm_cache(track_path: str, cache_path: str, samplerate: int, channels: int) -> str:
+    """
+    Decodifica il brano in PCM int16 grezzo con ffmpeg, una sola volta: se la cache è
+    più recente del file sorgente viene riutilizzata anche tra un riavvio e l'altro.
+    """
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(track_path):
+        return cache_path
+    logger.info(f"🎼 Decodifica di '{track_path}' nella cache PCM '{cache_path}'...")
+    tmp_path = f"{cache_path}.tmp"
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-v", "error", "-y", "-i", track_path, "-f", "s16le", "-acodec", "pcm_s16le",
+        "-ac", str(channels), "-ar", str(samplerate), tmp_path,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+    )
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg ha restituito {process.returncode}: {stderr.decode(errors='replace').strip()}")
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+
+class BackgroundMusicMixer:
+    """
+    Musica di sottofondo riprodotta in-process, senza avviare processi a runtime.
+
+    Il brano viene decodificato una volta in un file PCM grezzo, letto tramite memory
+    map e riprodotto in loop da un `sd.OutputStream` sempre aperto. Il guadagno segue
+    una rampa lineare calcolata per blocco con NumPy:
+      - volume normale quando nessuno parla;
+      - `duck_volume` mentre il Capitano parla (rampa di `duck_ms`);
+      - silenzio mentre suona Spotify (dissolvenza di `fade_ms`). A guadagno zero la
+        posizione resta ferma, così la musica riprende da dove si era interrotta.
+    """
+
+    def __init__(self, track_path: str, spotify_playback_event: ToggleEvent, hotword_detected_event: asyncio.Event,
+                 user_can_speak_event: asyncio.Event, volume_percent: int = 60, duck_percent: int = 20,
+                 duck_ms: float = 300.0, fade_ms: float = 1500.0, samplerate: int = 44100, channels: int = 2,
+                 block_ms: float = 50.0, cache_dir: Optional[str] = None,
+                 agent_speaking: Optional[Callable[[], bool]] = None):
+        self.track_path = track_path
+        self.spotify_playback_event = spotify_playback_event
+        self.hotword_detected_event = hotword_detected_event
+        self.user_can_speak_event = user_can_speak_event
+        # Senza un indicatore esplicito, il Capitano "parla" quando il microfono dell'utente è chiuso.
+        self.agent_speaking = agent_speaking or (lambda: not user_can_speak_event.is_set())
+        self.volume = volume_percent / 100
+        self.duck_volume = duck_percent / 100
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocksize = int(samplerate * block_ms / 1000)
+        self.cache_dir = cache_dir or os.path.dirname(os.path.abspath(track_path))
+        # Variazione massima di guadagno per campione nelle due rampe.
+        self._duck_step = (self.volume - self.duck_volume) / max(1, samplerate * duck_ms / 1000)
+        self._fade_step = self.volume / max(1, samplerate * fade_ms / 1000)
+        self._pcm: Optional[np.memmap] = None
+        self._position = 0
+        self._gain = 0.0
+        self._ramp = np.arange(1, self.blocksize + 1, dtype=np.float32)
+        self._gains = np.zeros(self.blocksize, dtype=np.float32)
+        self._mix = np.zeros((self.blocksize, channels), dtype=np.float32)
+        self._stream: Optional[sd.OutputStream] = None
+        self._stopped = asyncio.Event()
+        self.running = True
+        self.output_underflows = 0
+
+    # --- Ciclo di vita ---
+    async def _prepare(self):
+        cache_path = pcm_cache_path(self.track_path, self.cache_dir, self.samplerate, self.channels)
+        await decode_to_pcm_cache(self.track_path, cache_path, self.samplerate, self.channels)
+        pcm = np.memmap(cache_path, dtype=np.int16, mode="r")
+        self._pcm = pcm[:len(pcm) - len(pcm) % self.channels].reshape(-1, self.channels)
+        logger.info(f"🎼 Cache PCM pronta: {len(self._pcm) / self.samplerate:.0f}s di musica in memory map.")
+
+    async def start(self):
+        await self.hotword_detected_event.wait()
+        try:
+            await self._prepare()
+        except Exception as e:
+            logger.error(f"❌ Impossibile preparare la musica di sottofondo: {e}")
+            return
+        if len(self._pcm) == 0 or not self.running:
+            return
+        self._stream = sd.OutputStream(
+            samplerate=self.samplerate, channels=self.channels, dtype='int16',
+            blocksize=self.blocksize, callback=self._callback,
+        )
+        self._stream.start()
+        logger.info(f"🎵 Mixer musica di sottofondo attivo (volume {self.volume:.0%}, ducking {self.duck_volume:.0%}).")
+        try:
+            await self._stopped.wait()
+        finally:
+            self._close_stream()
+
+    def _close_stream(self):
+        if self._stream:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+            logger.info(f"Mixer musica chiuso. Statistiche: {self.stats()}")
+
+    def stop(self):
+        self.running = False
+        self._stopped.set()
+        self._close_stream()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "position_s": round(self._position / self.samplerate, 1),
+            "gain": round(self._gain, 2),
+            "output_underflows": self.output_underflows,
+        }
+
+    # --- Callback PortAudio (thread audio) ---
+    def _target_gain(self) -> float:
+        if self.spotify_playback_event.is_set():
+            return 0.0
+        return self.duck_volume if self.agent_speaking() else self.volume
+
+    def _callback(self, outdata: np.ndarray, frames: int, time_info: Any, status: sd.CallbackFlags):
+        if status.output_underflow:
+            self.output_underflows += 1
+        target = self._target_gain()
+        start_gain = self._gain
+        if start_gain == 0.0 and target == 0.0:
+            # Musica ferma: silenzio e posizione congelata.
+            outdata.fill(0)
+            return
+
+        # Rampa lineare verso il guadagno obiettivo, limitata dalla velocità della dissolvenza.
+        step = self._fade_step if (target == 0.0 or start_gain < self.duck_volume) else self._duck_step
+        gains = self._gains[:frames]
+        delta = target - start_gain
+        max_delta = step * frames
+        if abs(delta) <= max_delta:
+            ramp_len = int(abs(delta) / step) if step else 0
+            np.multiply(self._ramp[:frames], np.float32(np.sign(delta) * step), out=gains)
+            gains += np.float32(start_gain)
+            gains[ramp_len:] = target
+            end_gain = target
+        else:
+            np.multiply(self._ramp[:frames], np.float32(np.sign(delta) * step), out=gains)
+            gains += np.float32(start_gain)
+            end_gain = float(gains[-1])
+        self._gain = end_gain
+
+        # Lettura in loop dal file memory-mapped: di solito una o due slice a cavallo della
+        # fine, di più solo se il brano è più corto di un blocco.
+        total = len(self._pcm)
+        mix = self._mix[:frames]
+        filled, position = 0, self._position
+        while filled < frames:
+            count = min(frames - filled, total - position)
+            mix[filled:filled + count] = self._pcm[position:position + count]
+            filled += count
+            position = (position + count) % total
+        self._position = position
+
+        mix *= gains[:, None]
+        outdata[:] = mix
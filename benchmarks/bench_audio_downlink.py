@@ -0,0 +1,123 @@
+# benchmarks/bench_audio_downlink.py
+"""
+Micro-benchmark della decodifica dei messaggi `audio` ricevuti dall'agente.
+
+Confronta, su messaggi con la stessa forma di quelli di ElevenLabs (PCM 16 kHz in base64),
+il vecchio percorso (testo UTF-8 → `json.loads` → `base64.b64decode` → `np.frombuffer`)
+con `AudioDownlink.parse_audio` sui bytes del websocket. In entrambi i casi i campioni
+finiscono nel ring buffer di `AudioOutput`, come nell'agente.
+
+Riporta la CPU spesa per secondo di parlato ricevuto e la memoria temporanea
+allocata per chunk (tracemalloc), per diverse durate dei chunk.
+
+Uso: python -m benchmarks.bench_audio_downlink [--chunk-ms 50 100 250] [--speech-s 600] [--repeat 3]
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_buffers import Int16RingBuffer  # noqa: E402
+from audio_downlink import AudioDownlink  # noqa: E402
+
+SAMPLERATE = 16000
+
+
+def make_messages(chunk_ms: float, count: int = 20, seed: int = 1) -> List[bytes]:
+    """Messaggi `audio` come arrivano dal websocket (bytes di un frame di testo)."""
+    rng = np.random.default_rng(seed)
+    samples = int(SAMPLERATE * chunk_ms / 1000)
+    messages = []
+    for event_id in range(count):
+        pcm = (rng.standard_normal(samples) * 3000).astype(np.int16).tobytes()
+        message = {"audio_event": {"audio_base_64": base64.b64encode(pcm).decode("ascii"), "event_id": event_id},
+                   "type": "audio"}
+        messages.append(json.dumps(message).encode("utf-8"))
+    return messages
+
+
+def generic_path(ring: Int16RingBuffer) -> Callable[[bytes], None]:
+    def handle(message: bytes):
+        data = json.loads(message.decode("utf-8"))
+        if data.get("type") == "audio":
+            ring.write(np.frombuffer(base64.b64decode(data["audio_event"]["audio_base_64"]), dtype=np.int16))
+    return handle
+
+
+def fast_path(ring: Int16RingBuffer) -> Callable[[bytes], None]:
+    downlink = AudioDownlink()
+
+    def handle(message: bytes):
+        samples = downlink.parse_audio(message)
+        if samples is not None:
+            ring.write(samples)
+    return handle
+
+
+def cpu_per_speech_s(make_handler, messages: List[bytes], chunk_ms: float, speech_s: float, repeat: int) -> float:
+    """ms di CPU per secondo di parlato (il migliore su `repeat` prove)."""
+    n = int(speech_s * 1000 / chunk_ms)
+    best = float("inf")
+    for _ in range(repeat):
+        ring = Int16RingBuffer(SAMPLERATE * 60)
+        handle = make_handler(ring)
+        start = time.process_time()
+        for i in range(n):
+            handle(messages[i % len(messages)])
+            if len(ring) > SAMPLERATE * 30:
+                ring.clear()  # lo svuota il callback audio, nell'agente
+        best = min(best, time.process_time() - start)
+    return best * 1000 / speech_s
+
+
+def peak_memory_per_chunk(make_handler, messages: List[bytes]) -> int:
+    """Memoria temporanea massima (byte) allocata per decodificare un chunk."""
+    ring = Int16RingBuffer(SAMPLERATE * 60)
+    handle = make_handler(ring)
+    handle(messages[0])  # riscaldamento (cache, import pigri)
+    tracemalloc.start()
+    for message in messages:
+        handle(message)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-ms", type=float, nargs="+", default=[50, 100, 250], help="durata dei chunk audio")
+    parser.add_argument("--speech-s", type=float, default=600, help="secondi di parlato decodificati per prova")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for chunk_ms in args.chunk_ms:
+        messages = make_messages(chunk_ms)
+        ring_a, ring_b = Int16RingBuffer(SAMPLERATE), Int16RingBuffer(SAMPLERATE)
+        generic_path(ring_a)(messages[0])
+        fast_path(ring_b)(messages[0])
+        out_a, out_b = np.zeros(len(ring_a), np.int16), np.zeros(len(ring_b), np.int16)
+        ring_a.read_into(out_a)
+        ring_b.read_into(out_b)
+        assert np.array_equal(out_a, out_b), "I due percorsi non producono gli stessi campioni"
+
+        print(f"\nChunk da {chunk_ms:.0f} ms ({len(messages[0]) / 1024:.1f} KB per messaggio)")
+        results = {}
+        for name, handler in (("json.loads + b64decode", generic_path), ("AudioDownlink", fast_path)):
+            cpu_ms = cpu_per_speech_s(handler, messages, chunk_ms, args.speech_s, args.repeat)
+            peak = peak_memory_per_chunk(handler, messages)
+            results[name] = cpu_ms
+            print(f"  {name:<24} {cpu_ms:7.3f} ms CPU per s di parlato   memoria temporanea {peak / 1024:6.1f} KB/chunk")
+        before, after = results.values()
+        print(f"  → {before / after:.1f}x meno CPU")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+# benchmarks/bench_conversation.py
+"""
+Benchmark end-to-end della conversazione, senza account e senza scheda audio.
+
+Avvia in locale i sostituti di ElevenLabs, Spotify e OpenAI (`fake_services`) con
+latenze configurabili, sostituisce `sounddevice` con dispositivi virtuali
+(`fake_sounddevice`) e fa girare il vero `ConversationalAgent`, il `Jukebox` e i tool
+Spotify su una sessione scriptata: intro, chiacchiera, "metti X" con nome storpiato
+(ricerca → correttore fonetico), accodamento, domanda sul brano corrente e un secondo
+"metti X" che solo GPT sa correggere. I tool playlist/artista non sono nello script: non
+passano dal Jukebox, quindi il microfono resterebbe chiuso fino al timeout.
+
+Riporta, per confrontare due versioni del codice sulla stessa macchina:
+  - latenza dei turni: fine del parlato dell'utente → primo suono dallo speaker virtuale,
+    e trascrizione → primo audio (metrica del ConversationalAgent);
+  - durata dei tool e delle chiamate Spotify/OpenAI (dalle metriche);
+  - throughput del websocket (messaggi e KB nei due sensi, frame del microfono);
+  - blocchi dell'event loop (ritardo di un timer da 10 ms) e CPU del processo;
+  - numero di chiamate per endpoint ricevute dai server finti.
+
+Uso: python -m benchmarks.bench_conversation [--rounds N] [--spotify-latency-ms MS]
+       [--openai-latency-ms MS] [--llm-latency-ms MS] [--track-s S] [--json PATH] [--verbose]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fake_sounddevice  # noqa: E402
+
+# I moduli audio importano `sounddevice` al caricamento: i dispositivi virtuali vanno installati prima.
+sys.modules["sounddevice"] = fake_sounddevice
+
+import config  # noqa: E402
+import loop_watchdog  # noqa: E402
+import metrics  # noqa: E402
+import spotify_config  # noqa: E402
+from audio_capture import CaptureBus  # noqa: E402
+from benchmarks.fake_services import FakeConvaiServer, FakeOpenAI, FakeSpotifyAPI, Turn  # noqa: E402
+from conversational import ConversationalAgent  # noqa: E402
+from jukebox import Jukebox  # noqa: E402
+from toggle_event import ToggleEvent  # noqa: E402
+from tools import spotify_tools  # noqa: E402
+
+logger = logging.getLogger("bench.conversation")
+
+DEFAULT_TURNS = [
+    Turn("Ciao Capitano, come stai?", speech_s=1.2, reply_s=2.0),
+    Turn("Metti Bohemian Rapsodi dei Queen", speech_s=1.5, reply_s=1.0,
+         tool_name="play_specific_spotify_track", tool_params={"track_name": "Bohemian Rapsodi", "artist_name": "Queen"}),
+    Turn("Aggiungi Imagine di John Lennon alla coda", speech_s=1.5, reply_s=1.0,
+         tool_name="add_to_queue", tool_params={"track_name": "Imagine", "artist_name": "John Lennon"}),
+    Turn("Che canzone sta suonando?", speech_s=1.0, reply_s=1.5, tool_name="GetCurrentSongInfo"),
+    # Brano assente dal dizionario fonetico: la correzione passa da GPT.
+    Turn("Metti Volari di Domenico Modunio", speech_s=1.5, reply_s=1.0,
+         tool_name="play_specific_spotify_track", tool_params={"track_name": "Volari", "artist_name": "Domenico Modunio"}),
+]
+
+
+class ServiceLoop:
+    """
+    Event loop in un thread separato per i server finti, come se fossero remoti: una
+    chiamata bloccante nel loop dell'assistente non ferma anche il "server" che aspetta
+    (altrimenti si bloccherebbe tutto), e la sonda del loop misura solo il codice del progetto.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="FakeServices", daemon=True)
+        self._thread.start()
+
+    async def run(self, coro):
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5.0)
+
+
+class LoopLagProbe:
+    """Misura il ritardo di un timer periodico: ogni ritardo oltre `stall_s` è un blocco del loop."""
+
+    def __init__(self, interval_s: float = 0.01, stall_s: float = 0.05):
+        self.interval_s = interval_s
+        self.stall_s = stall_s
+        self.lags: List[float] = []
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval_s)
+            self.lags.append(max(0.0, time.perf_counter() - start - self.interval_s))
+
+    def stats(self) -> Dict[str, Any]:
+        lags = sorted(self.lags)
+        if not lags:
+            return {}
+        return {
+            "samples": len(lags),
+            "stalls": sum(1 for lag in lags if lag >= self.stall_s),
+            "p99_ms": round(lags[int(len(lags) * 0.99) - 1] * 1000, 1),
+            "max_ms": round(lags[-1] * 1000, 1),
+        }
+
+
+def _percentiles(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50_ms": round(values[len(values) // 2] * 1000),
+        "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))] * 1000),
+        "max_ms": round(values[-1] * 1000),
+    }
+
+
+async def _wait_until(condition: Callable[[], bool], timeout_s: float, what: str):
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timeout in attesa di: {what}")
+        await asyncio.sleep(0.02)
+
+
+def _write_token_cache(path: str):
+    """Token già valido per SpotifyOAuth: l'autenticazione reale parte senza rete né login."""
+    with open(path, "w") as f:
+        json.dump({"access_token": "bench", "token_type": "Bearer", "expires_in": 3600, "refresh_token": "bench",
+                   "scope": spotify_config.SCOPE, "expires_at": int(time.time()) + 86400}, f)
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    tmp_dir = tempfile.mkdtemp(prefix="bench_conversation_")
+    turns = DEFAULT_TURNS * args.rounds
+    convai = FakeConvaiServer(turns, latency_s=args.eleven_latency_ms / 1000, llm_latency_s=args.llm_latency_ms / 1000)
+    spotify = FakeSpotifyAPI(latency_s=args.spotify_latency_ms / 1000, jitter_s=args.spotify_latency_ms / 2000,
+                             track_duration_s=args.track_s)
+    openai = FakeOpenAI(latency_s=args.openai_latency_ms / 1000)
+    services = ServiceLoop()
+    config.ELEVEN_API_KEY = config.ELEVEN_AGENT_ID = "bench"
+    config.ELEVEN_API_BASE_URL = await services.run(convai.start())
+    spotify_url = await services.run(spotify.start("/v1/"))
+    openai_url = await services.run(openai.start("/v1"))
+
+    cache_path = os.path.join(tmp_dir, ".spotipy_cache")
+    _write_token_cache(cache_path)
+    if not await spotify_tools.initialize_spotify("bench", "bench", "http://127.0.0.1:8888/callback", spotify_config.SCOPE,
+                                                  cache_path, api_base_url=spotify_url):
+        raise RuntimeError("Inizializzazione Spotify fallita contro il server finto.")
+    spotify_tools.initialize_openai_client("bench", base_url=openai_url)
+    spotify_tools.initialize_search_cache(os.path.join(tmp_dir, "search_cache.sqlite"), 3600, 500)
+    spotify_tools.initialize_phonetic_corrector()
+
+    hotword_event = asyncio.Event()
+    hotword_event.set()
+    playback_event = ToggleEvent()
+    injection_q: asyncio.Queue = asyncio.Queue()
+    polling_q: asyncio.Queue = asyncio.Queue()
+    capture_bus = CaptureBus(samplerate=16000)
+    agent = ConversationalAgent(injection_q, polling_q, hotword_event, playback_event, capture_bus=capture_bus)
+    jukebox = Jukebox(injection_q, polling_q, spotify_tools.get_spotify_client(), playback_event,
+                      monitor_mode=config.JUKEBOX_MONITOR_MODE, playback_state=spotify_tools.get_playback_state_service())
+    probe = LoopLagProbe()
+    watchdog = loop_watchdog.initialize_loop_watchdog(threshold_s=0.1, report_interval_s=0)
+
+    started = time.monotonic()
+    cpu_started = time.process_time()
+    tasks = [asyncio.create_task(coro) for coro in (agent.start(), jukebox.monitor_playback(), probe.run(), watchdog.run())]
+    mouth_to_ear: List[float] = []
+    try:
+        await _wait_until(lambda: convai.replies >= 1, 30, "intro dell'agente")
+        for i, turn in enumerate(turns, 1):
+            # L'utente parla solo quando il Capitano ha finito e il microfono è riaperto
+            # (dopo un "metti X" succede alla fine del brano, notificata dal Jukebox).
+            await _wait_until(lambda: convai.idle.is_set() and not agent.audio_output.is_playing
+                              and agent.user_can_speak.is_set(), args.track_s + 30, "microfono riaperto")
+            await asyncio.sleep(args.think_s)
+            replies_before = convai.replies
+            speech_end = fake_sounddevice.microphone.say(turn.speech_s)
+            await _wait_until(lambda: convai.replies > replies_before, 60, f"risposta al turno {i}")
+            await agent.audio_output.drain()
+            onset = fake_sounddevice.speaker.first_onset_after(speech_end)
+            if onset is not None:
+                mouth_to_ear.append(onset - speech_end)
+            logger.info(f"Turno {i}/{len(turns)} '{turn.user_text}': "
+                        f"{(onset - speech_end) * 1000 if onset else float('nan'):.0f} ms fino al primo suono.")
+    finally:
+        wall_s = time.monotonic() - started
+        cpu_s = time.process_time() - cpu_started
+        agent.stop()
+        jukebox.stop()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        capture_bus.close()
+        sp = spotify_tools.get_spotify_client()
+        if sp:
+            await sp.aclose()
+        for service in (convai, spotify, openai):
+            await services.run(service.close())
+        services.close()
+
+    snapshot = metrics.snapshot()
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "verbose")},
+        "duration_s": round(wall_s, 1),
+        "cpu_percent": round(cpu_s / wall_s * 100, 1),
+        "turns": {"mouth_to_ear": _percentiles(mouth_to_ear),
+                  "transcript_to_first_audio": snapshot.get("convai_turn_latency_seconds", {}),
+                  "tool_roundtrip": _percentiles(convai.tool_roundtrips)},
+        "tools": snapshot.get("tool_duration_seconds", {}),
+        "spotify_requests": snapshot.get("spotify_request_seconds", {}),
+        "openai_requests": snapshot.get("openai_request_seconds", {}),
+        "throughput": {
+            "ws_messages_in": dict(convai.messages_in),
+            "ws_messages_out": dict(convai.messages_out),
+            "ws_kbytes_in_per_s": round(convai.bytes_in / 1024 / wall_s, 1),
+            "ws_kbytes_out_per_s": round(convai.bytes_out / 1024 / wall_s, 1),
+            "uplink": agent.mic_uplink.stats(),
+            "audio_output": agent.audio_output.stats(),
+            "speaker_audible_s": round(fake_sounddevice.speaker.samples_audible / 16000, 1),
+        },
+        "event_loop": probe.stats(),
+        "blocking_sites": [{k: s[k] for k in ("site", "stalls", "blocked_ms", "max_ms", "leaf")} for s in watchdog.top_sites()],
+        "api_calls": {"elevenlabs": dict(convai.requests), "spotify": dict(spotify.requests), "openai": dict(openai.requests)},
+    }
+
+
+def _print_report(report: Dict[str, Any]):
+    print(f"\nDurata {report['duration_s']} s, CPU {report['cpu_percent']}%")
+    print("\nTurni")
+    for name, stats in report["turns"].items():
+        print(f"  {name:<28} {stats}")
+    print("\nTool (durata per tool,esito)")
+    for name, stats in report["tools"].items():
+        print(f"  {name:<40} {stats}")
+    print("\nChiamate Spotify (metodo,endpoint,status)")
+    for name, stats in report["spotify_requests"].items():
+        print(f"  {name:<40} {stats}")
+    for name, stats in report["openai_requests"].items():
+        print(f"  OpenAI {name:<33} {stats}")
+    print("\nThroughput")
+    for name, stats in report["throughput"].items():
+        print(f"  {name:<20} {stats}")
+    print(f"\nEvent loop (ritardo di un timer da 10 ms): {report['event_loop']}")
+    for site in report["blocking_sites"]:
+        print(f"  bloccato da {site['site']}: {site['stalls']} volte, {site['blocked_ms']} ms ← {site['leaf']}")
+    print("\nChiamate ricevute dai server finti")
+    for service, counts in report["api_calls"].items():
+        print(f"  {service:<12} {counts}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=1, help="ripetizioni della sessione scriptata")
+    parser.add_argument("--eleven-latency-ms", type=float, default=50, help="latenza HTTP del signed URL")
+    parser.add_argument("--llm-latency-ms", type=float, default=400, help="tempo di 'pensiero' dell'agente finto")
+    parser.add_argument("--spotify-latency-ms", type=float, default=80, help="latenza media della Web API finta")
+    parser.add_argument("--openai-latency-ms", type=float, default=600, help="latenza di chat.completions finto")
+    parser.add_argument("--track-s", type=float, default=6.0, help="durata dei brani finti")
+    parser.add_argument("--think-s", type=float, default=0.3, help="pausa dell'utente prima di parlare")
+    parser.add_argument("--json", help="scrive il report anche in questo file JSON")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logger.setLevel(logging.INFO)
+    report = asyncio.run(run_benchmark(args))
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
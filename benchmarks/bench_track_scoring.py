@@ -0,0 +1,160 @@
+# benchmarks/bench_track_scoring.py
+"""
+Micro-benchmark del ranking dei risultati di ricerca (`_find_best_track_match`).
+
+Confronta la vecchia implementazione a cicli annidati con il motore `TrackScorer`
+su pagine di 20, 50 e 100 candidati e verifica che scelgano la stessa traccia.
+
+Sorgenti dei payload, in ordine di preferenza:
+  --from-cache PATH   pagine registrate nella cache ricerche SQLite (.spotify_search_cache.sqlite)
+  --payload-dir DIR   file JSON con risposte di `search` della Web API (o liste di tracce)
+  (nessuna)           pagine sintetiche con titoli e artisti realistici
+
+Uso: python -m benchmarks.bench_track_scoring [--from-cache PATH] [--payload-dir DIR] [--repeat N]
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import time
+from typing import Optional, Dict, Any, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.spotify_tools.scoring import TrackScorer, UNDESIRED_KEYWORDS, UNDESIRED_ARTISTS  # noqa: E402
+
+logger = logging.getLogger("bench.track_scoring")
+
+
+def legacy_find_best_track_match(tracks: List[Dict[str, Any]], search_track: str,
+                                 original_artist_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Copia della vecchia implementazione (log di debug compresi), usata come riferimento."""
+    best_track, best_score = None, -999
+    logger.debug(f"Inizio analisi di {len(tracks)} tracce per '{search_track}'. ID artista rif: {original_artist_id or 'N/A'}")
+    for track in tracks:
+        current_score = 0
+        track_name_lower = track['name'].lower()
+        track_artists = track.get('artists', [])
+        if original_artist_id:
+            if original_artist_id in {artist['id'] for artist in track_artists}:
+                current_score += 500
+            else:
+                logger.debug(f"SCARTATA (ID Artista non corrispondente): '{track_name_lower}'.")
+                continue
+        current_score += track.get('popularity', 0)
+        for keyword in UNDESIRED_KEYWORDS:
+            if keyword in track_name_lower: current_score -= 250
+        for artist in track_artists:
+            for undesired in UNDESIRED_ARTISTS:
+                if undesired in artist.get('name', '').lower(): current_score -= 300
+        if search_track.lower() in track_name_lower: current_score += 50
+        if track.get('album', {}).get('album_type') == 'album': current_score += 25
+        elif track.get('album', {}).get('album_type') == 'compilation': current_score -= 25
+        logger.debug(f"Valutazione finale per '{track_name_lower}': Score={current_score}")
+        if current_score > best_score:
+            best_score, best_track = current_score, track
+    return best_track
+
+
+def _pages_from_cache(path: str) -> List[List[Dict[str, Any]]]:
+    conn = sqlite3.connect(path)
+    try:
+        return [json.loads(payload) for (payload,) in conn.execute("SELECT payload FROM track_searches")]
+    finally:
+        conn.close()
+
+
+def _pages_from_dir(directory: str) -> List[List[Dict[str, Any]]]:
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        pages.append(data.get("tracks", {}).get("items", []) if isinstance(data, dict) else data)
+    return [p for p in pages if p]
+
+
+def _synthetic_pages(count: int = 40) -> List[List[Dict[str, Any]]]:
+    rng = random.Random(42)
+    titles = ["Wonderwall", "Bohemian Rhapsody", "Billie Jean", "Hotel California", "Yesterday",
+              "Drunken Sailor", "Smells Like Teen Spirit", "Sweet Child O' Mine"]
+    suffixes = ["", "", "", " - Remastered 2011", " - Live", " (Acoustic Version)", " - Karaoke Version",
+                " (Made Popular By The Original Artist)", " - Radio Edit", " (Symphony Orchestra Version)"]
+    artists = [("a1", "Oasis"), ("a2", "Queen"), ("a3", "Michael Jackson"), ("a4", "Party Tyme Karaoke"),
+               ("a5", "The Tribute Band All Stars"), ("a6", "Royal Philharmonic Orchestra"), ("a7", "Ameritz")]
+    pages = []
+    for n in range(count):
+        title = rng.choice(titles)
+        page = []
+        for i in range(20):
+            artist_id, artist_name = rng.choice(artists)
+            page.append({
+                "id": f"t{n}_{i}", "uri": f"spotify:track:t{n}_{i}", "name": title + rng.choice(suffixes),
+                "popularity": rng.randint(0, 90),
+                "artists": [{"id": artist_id, "name": artist_name}],
+                "album": {"album_type": rng.choice(["album", "single", "compilation"])},
+            })
+        pages.append(page)
+    return pages
+
+
+def _resize(page: List[Dict[str, Any]], size: int) -> List[Dict[str, Any]]:
+    return [page[i % len(page)] for i in range(size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from-cache")
+    parser.add_argument("--payload-dir")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.from_cache:
+        pages, source = _pages_from_cache(args.from_cache), args.from_cache
+    elif args.payload_dir:
+        pages, source = _pages_from_dir(args.payload_dir), args.payload_dir
+    else:
+        pages, source = _synthetic_pages(), "sintetiche"
+    if not pages:
+        sys.exit("Nessun payload trovato.")
+    print(f"Pagine: {len(pages)} ({source}), ripetizioni: {args.repeat}")
+
+    scorer = TrackScorer()
+    for size in (20, 50, 100):
+        resized = [_resize(page, size) for page in pages]
+        queries = [(page, page[0]['name'].split(" - ")[0].split(" (")[0], (page[0].get('artists') or [{}])[0].get('id'))
+                   for page in resized]
+
+        mismatches = 0
+        for page, search_track, artist_id in queries:
+            for aid in (None, artist_id):
+                expected = legacy_find_best_track_match(page, search_track, aid)
+                result = scorer.best(page, search_track, aid)
+                if (result[0] if result else None) is not expected:
+                    mismatches += 1
+
+        timings = {}
+        def engine_cold(p, s, a):
+            scorer.clear_cache()
+            return scorer.best(p, s, a)
+
+        for label, func in (("legacy", lambda p, s, a: legacy_find_best_track_match(p, s, a)),
+                            ("engine", lambda p, s, a: scorer.best(p, s, a)),
+                            ("cold", engine_cold)):
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                for page, search_track, artist_id in queries:
+                    func(page, search_track, artist_id)
+            timings[label] = (time.perf_counter() - start) / (args.repeat * len(queries)) * 1e6
+
+        print(f"  {size:>3} candidati: legacy {timings['legacy']:7.1f} µs/pagina | "
+              f"engine {timings['engine']:7.1f} µs/pagina (x{timings['legacy'] / timings['engine']:.2f}) | "
+              f"engine a cache vuota {timings['cold']:7.1f} µs/pagina (x{timings['legacy'] / timings['cold']:.2f}) | "
+              f"scelte diverse: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+# benchmarks/fake_services.py
+"""
+Sostituti locali di ElevenLabs (signed URL + websocket convai), della Web API di Spotify
+e di OpenAI, con latenze configurabili e conteggio delle chiamate per endpoint.
+
+Sono server veri su 127.0.0.1 (HTTP/1.1 keep-alive e websocket): il client HTTP, il
+rate limiter e il client websocket del progetto lavorano come in produzione.
+"""
+import asyncio
+import base64
+import collections
+import difflib
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import websockets
+
+logger = logging.getLogger("bench.fake_services")
+
+
+def spotify_id(text: str) -> str:
+    """ID base62 di 22 caratteri, stabile per lo stesso testo."""
+    alphabet = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+    n = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest(), "big")
+    chars = []
+    for _ in range(22):
+        n, r = divmod(n, 62)
+        chars.append(alphabet[r])
+    return "".join(chars)
+
+
+class FakeHTTPService:
+    """Server HTTP/1.1 minimale con keep-alive. Le sottoclassi implementano `handle`."""
+
+    def __init__(self, latency_s: float = 0.0, jitter_s: float = 0.0):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.requests: collections.Counter = collections.Counter()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Set[asyncio.Task] = set()
+        self.base_url = ""
+
+    async def start(self, prefix: str = "") -> str:
+        self._server = await asyncio.start_server(self._serve_client, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}{prefix}"
+        return self.base_url
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+        # Le connessioni keep-alive restano aperte in lettura: vanno chiuse esplicitamente.
+        for task in list(self._clients):
+            task.cancel()
+        await asyncio.gather(*self._clients, return_exceptions=True)
+
+    async def handle(self, method: str, path: str, query: Dict[str, str], body: Any) -> Tuple[int, Any, Dict[str, str]]:
+        raise NotImplementedError
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._clients.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                raw_body = await reader.readexactly(length) if length else b""
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                parts = urlsplit(target)
+                query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+                body = json.loads(raw_body) if raw_body else None
+
+                delay = self.latency_s + random.uniform(0, self.jitter_s)
+                if delay:
+                    await asyncio.sleep(delay)
+                status, payload, extra_headers = await self.handle(method, parts.path, query, body)
+                data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+                head = [f"HTTP/1.1 {status} X", f"Content-Length: {len(data)}", "Connection: keep-alive"]
+                if payload is not None:
+                    head.append("Content-Type: application/json")
+                head += [f"{k}: {v}" for k, v in extra_headers.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._clients.discard(task)
+            writer.close()
+
+
+# --- Spotify ---
+
+CATALOGUE = [
+    ("Bohemian Rhapsody", "Queen"), ("Another One Bites the Dust", "Queen"), ("Imagine", "John Lennon"),
+    ("Hotel California", "Eagles"), ("Stairway to Heaven", "Led Zeppelin"), ("Billie Jean", "Michael Jackson"),
+    ("Smells Like Teen Spirit", "Nirvana"), ("Volare", "Domenico Modugno"), ("Azzurro", "Adriano Celentano"),
+    ("Shape of You", "Ed Sheeran"), ("Someone Like You", "Adele"), ("Yesterday", "The Beatles"),
+]
+_VARIANTS = ("", " - Live", " - Remastered 2011", " (Karaoke Version)", " - Cover", " - Instrumental")
+
+
+class FakeSpotifyAPI(FakeHTTPService):
+    """
+    Web API con un piccolo catalogo: la ricerca trova solo i titoli esatti (così un nome
+    storpiato passa per correttore fonetico e GPT), la riproduzione avanza col tempo reale
+    e un brano dura `track_duration_s` secondi, così il Jukebox ne vede la fine.
+    """
+
+    def __init__(self, latency_s: float = 0.08, jitter_s: float = 0.04, track_duration_s: float = 8.0):
+        super().__init__(latency_s, jitter_s)
+        self.track_duration_ms = int(track_duration_s * 1000)
+        self.device = {"id": "benchdevice0000000001", "name": "Bench Speaker", "type": "Speaker",
+                       "is_active": True, "volume_percent": 60}
+        self._playing: Optional[Dict[str, Any]] = None
+        self._started_at = 0.0
+        self._queue: List[Dict[str, Any]] = []
+        self._by_uri: Dict[str, Dict[str, Any]] = {}
+
+    def _artist(self, name: str) -> Dict[str, Any]:
+        return {"id": spotify_id("artist:" + name), "name": name, "uri": f"spotify:artist:{spotify_id('artist:' + name)}"}
+
+    def _track(self, name: str, artist: str, popularity: int = 70) -> Dict[str, Any]:
+        track_id = spotify_id(f"track:{name}:{artist}")
+        track = {"id": track_id, "uri": f"spotify:track:{track_id}", "name": name, "popularity": popularity,
+                 "duration_ms": self.track_duration_ms, "artists": [self._artist(artist)],
+                 "album": {"name": f"{name} (Album)", "id": spotify_id("album:" + name)}}
+        self._by_uri[track["uri"]] = track
+        return track
+
+    def _search_tracks(self, q: str) -> List[Dict[str, Any]]:
+        track = re.search(r'track:"([^"]*)"', q)
+        artist = re.search(r'artist:"([^"]*)"', q)
+        title = (track.group(1) if track else q).lower()
+        wanted_artist = artist.group(1).lower() if artist else None
+        results = []
+        for name, author in CATALOGUE:
+            if name.lower() != title or (wanted_artist and author.lower() != wanted_artist):
+                continue
+            for i, suffix in enumerate(_VARIANTS):
+                results.append(self._track(name + suffix, author, popularity=80 - i * 7))
+            results += [self._track(name, f"{author} Tribute Band {i}", popularity=20 + i) for i in range(14)]
+        return results[:20]
+
+    def _playback(self) -> Optional[Dict[str, Any]]:
+        if not self._playing:
+            return None
+        progress = int((time.monotonic() - self._started_at) * 1000)
+        while progress >= self.track_duration_ms and self._queue:
+            self._playing = self._queue.pop(0)
+            self._started_at += self.track_duration_ms / 1000
+            progress -= self.track_duration_ms
+        is_playing = progress < self.track_duration_ms
+        return {"is_playing": is_playing, "progress_ms": min(progress, self.track_duration_ms),
+                "item": self._playing, "device": self.device, "currently_playing_type": "track"}
+
+    def _play(self, track: Dict[str, Any]):
+        self._playing = track
+        self._started_at = time.monotonic()
+
+    async def handle(self, method, path, query, body):
+        path = path.split("/v1", 1)[-1]
+        endpoint = re.sub(r"/[0-9A-Za-z]{22}(?=/|$)", "/{id}", path)
+        self.requests[f"{method} {endpoint}"] += 1
+
+        if path == "/me":
+            return 200, {"id": "bench", "display_name": "Bench", "country": "IT"}, {}
+        if path == "/me/player/devices":
+            return 200, {"devices": [self.device]}, {}
+        if path == "/me/player" and method == "GET":
+            playback = self._playback()
+            return (200, playback, {}) if playback else (204, None, {})
+        if path == "/me/player/play":
+            uris = (body or {}).get("uris") or []
+            self._play(self._by_uri.get(uris[0]) if uris and uris[0] in self._by_uri else self._track(*CATALOGUE[0]))
+            return 204, None, {}
+        if path == "/me/player/queue":
+            self._queue.append(self._by_uri.get(query.get("uri", "")) or self._track(*CATALOGUE[2]))
+            return 204, None, {}
+        if path == "/search":
+            kind = query.get("type", "track")
+            q = query.get("q", "")
+            if kind == "track":
+                return 200, {"tracks": {"items": self._search_tracks(q), "next": None}}, {}
+            if kind == "artist":
+                name = re.sub(r'^artist:"|"$', "", q)
+                hits = [self._artist(a) for _, a in CATALOGUE if a.lower() == name.lower()][:1]
+                return 200, {"artists": {"items": hits}}, {}
+            if kind == "playlist":
+                return 200, {"playlists": {"items": [{"name": q, "uri": f"spotify:playlist:{spotify_id('pl:' + q)}"}]}}, {}
+        if re.fullmatch(r"/artists/[^/]+/top-tracks", path):
+            return 200, {"tracks": [self._track(n, a) for n, a in CATALOGUE[:10]]}, {}
+        if path in ("/me/playlists", "/me/tracks") or path.endswith("/tracks"):
+            return 200, {"items": [], "next": None, "total": 0}, {}
+        return 404, {"error": {"status": 404, "message": f"Endpoint finto non gestito: {method} {path}"}}, {}
+
+
+# --- OpenAI ---
+
+class FakeOpenAI(FakeHTTPService):
+    """`/v1/chat/completions` che corregge la trascrizione sul catalogo finto (difflib)."""
+
+    def __init__(self, latency_s: float = 0.6, jitter_s: float = 0.2):
+        super().__init__(latency_s, jitter_s)
+
+    async def handle(self, method, path, query, body):
+        self.requests[f"{method} {path}"] += 1
+        text = (body or {}).get("messages", [{}])[-1].get("content", "")
+        match = re.search(r"'(.*)'", text)
+        transcript = (match.group(1) if match else text).lower()
+        # La trascrizione contiene spesso anche l'artista: vince la coppia titolo + artista più simile.
+        name, artist = max(CATALOGUE, key=lambda c: difflib.SequenceMatcher(None, transcript, f"{c[0]} {c[1]}".lower()).ratio())
+        content = json.dumps({"artist_name": artist, "track_name": name})
+        return 200, {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": "gpt-3.5-turbo",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+        }, {}
+
+
+# --- ElevenLabs ---
+
+@dataclass
+class Turn:
+    """Un turno dell'utente nella sessione scriptata."""
+    user_text: str
+    speech_s: float = 1.2
+    reply_s: float = 1.5
+    tool_name: Optional[str] = None
+    tool_params: Dict[str, Any] = field(default_factory=dict)
+
+
+class FakeConvaiServer(FakeHTTPService):
+    """
+    Endpoint del signed URL più un server websocket che parla il protocollo convai usato
+    da `ConversationalAgent`:
+      - `conversation_initiation_client_data` → `conversation_initiation_metadata`;
+      - `user_message` (es. l'intro) → risposta parlata;
+      - `user_audio_chunk`: un turno finisce dopo `end_of_speech_s` di silenzio (RMS sotto
+        `speech_rms`) → `user_transcript`, eventuale `client_tool_call` (attende il
+        `client_tool_result`) e risposta: chunk `audio` PCM 16 kHz più `agent_response`.
+    La sintesi produce audio `tts_speed` volte più veloce del tempo reale, a chunk di `tts_chunk_ms`.
+    """
+
+    def __init__(self, turns: List[Turn], latency_s: float = 0.05, asr_latency_s: float = 0.15,
+                 llm_latency_s: float = 0.4, tts_first_chunk_s: float = 0.25, tts_chunk_ms: int = 250,
+                 tts_speed: float = 3.0, end_of_speech_s: float = 0.5, speech_rms: float = 500.0):
+        super().__init__(latency_s)
+        self.turns = turns
+        self.asr_latency_s = asr_latency_s
+        self.llm_latency_s = llm_latency_s
+        self.tts_first_chunk_s = tts_first_chunk_s
+        self.tts_chunk_samples = int(16000 * tts_chunk_ms / 1000)
+        self.tts_speed = tts_speed
+        self.end_of_speech_s = end_of_speech_s
+        self.speech_rms = speech_rms
+        self.ws_url = ""
+        self._ws_server = None
+        self.turn_index = 0
+        self.idle = asyncio.Event()
+        self.replies = 0
+        self.messages_in: collections.Counter = collections.Counter()
+        self.messages_out: collections.Counter = collections.Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.tool_roundtrips: List[float] = []
+        t = np.arange(self.tts_chunk_samples) / 16000
+        self._tone = (4000 * np.sin(2 * np.pi * 220 * t)).astype(np.int16).tobytes()
+
+    async def start(self, prefix: str = "") -> str:
+        self._ws_server = await websockets.serve(self._session, "127.0.0.1", 0, max_size=None)
+        self.ws_url = f"ws://127.0.0.1:{self._ws_server.sockets[0].getsockname()[1]}/v1/convai/conversation"
+        return await super().start(prefix)
+
+    async def close(self):
+        if self._ws_server:
+            self._ws_server.close()
+        await super().close()
+
+    async def handle(self, method, path, query, body):
+        self.requests[f"{method} {path}"] += 1
+        if path == "/v1/convai/conversation/get-signed-url":
+            return 200, {"signed_url": f"{self.ws_url}?agent_id={query.get('agent_id', '')}&token=bench"}, {}
+        return 404, {"detail": "not found"}, {}
+
+    async def _send(self, ws, message: Dict[str, Any]):
+        data = json.dumps(message)
+        self.messages_out[message["type"]] += 1
+        self.bytes_out += len(data)
+        await ws.send(data)
+
+    async def _reply(self, ws, text: str, seconds: float):
+        await asyncio.sleep(self.tts_first_chunk_s)
+        chunks = max(1, int(seconds * 16000 / self.tts_chunk_samples))
+        chunk_s = self.tts_chunk_samples / 16000 / self.tts_speed
+        audio_b64 = base64.b64encode(self._tone).decode("ascii")
+        for i in range(chunks):
+            await self._send(ws, {"type": "audio", "audio_event": {"audio_base_64": audio_b64, "event_id": i}})
+            if i == 0:
+                await self._send(ws, {"type": "agent_response", "agent_response_event": {"agent_response": text}})
+            await asyncio.sleep(chunk_s)
+        self.replies += 1
+
+    async def _run_turn(self, ws, pending_results: Dict[str, asyncio.Future]):
+        turn = self.turns[self.turn_index % len(self.turns)]
+        self.turn_index += 1
+        await asyncio.sleep(self.asr_latency_s)
+        await self._send(ws, {"type": "user_transcript", "user_transcription_event": {"user_transcript": turn.user_text}})
+        await asyncio.sleep(self.llm_latency_s)
+        if turn.tool_name:
+            call_id = f"call_{self.turn_index}"
+            future = asyncio.get_running_loop().create_future()
+            pending_results[call_id] = future
+            sent_at = time.monotonic()
+            await self._send(ws, {"type": "client_tool_call", "client_tool_call": {
+                "tool_name": turn.tool_name, "tool_call_id": call_id, "parameters": turn.tool_params}})
+            try:
+                await asyncio.wait_for(future, timeout=30.0)
+                self.tool_roundtrips.append(time.monotonic() - sent_at)
+            except asyncio.TimeoutError:
+                logger.warning(f"Nessun client_tool_result per {call_id}.")
+            await asyncio.sleep(self.llm_latency_s)
+        await self._reply(ws, f"Risposta a: {turn.user_text}", turn.reply_s)
+
+    async def _session(self, ws):
+        pending_results: Dict[str, asyncio.Future] = {}
+        in_speech = False
+        last_speech_at = 0.0
+        busy: Optional[asyncio.Task] = None
+        self.idle.set()
+
+        async def respond(coro):
+            self.idle.clear()
+            try:
+                await coro
+            finally:
+                self.idle.set()
+
+        async def end_of_turn_watch():
+            nonlocal in_speech, busy
+            while True:
+                await asyncio.sleep(0.02)
+                if in_speech and time.monotonic() - last_speech_at >= self.end_of_speech_s:
+                    in_speech = False
+                    busy = asyncio.create_task(respond(self._run_turn(ws, pending_results)))
+
+        watcher = asyncio.create_task(end_of_turn_watch())
+        try:
+            async for raw in ws:
+                self.bytes_in += len(raw)
+                data = json.loads(raw)
+                kind = data.get("type", "user_audio_chunk" if "user_audio_chunk" in data else "?")
+                self.messages_in[kind] += 1
+                if kind == "conversation_initiation_client_data":
+                    await self._send(ws, {"type": "conversation_initiation_metadata",
+                                          "conversation_initiation_metadata_event": {"conversation_id": "bench"}})
+                elif kind == "user_message":
+                    busy = asyncio.create_task(respond(self._reply(ws, "Intro", 1.0)))
+                elif kind == "user_audio_chunk":
+                    pcm = np.frombuffer(base64.b64decode(data["user_audio_chunk"]), dtype=np.int16)
+                    if len(pcm) and np.sqrt(np.mean(pcm.astype(np.float32) ** 2)) >= self.speech_rms:
+                        in_speech = True
+                        last_speech_at = time.monotonic()
+                elif kind == "client_tool_result":
+                    future = pending_results.pop(data.get("tool_call_id"), None)
+                    if future and not future.done():
+                        future.set_result(data)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            watcher.cancel()
+            if busy:
+                busy.cancel()
@@ -0,0 +1,141 @@
+# benchmarks/fake_sounddevice.py
+"""
+Dispositivi audio virtuali con la stessa interfaccia di `sounddevice` usata dal progetto
+(`InputStream`, `OutputStream`, `CallbackFlags`), per i benchmark senza scheda audio.
+
+Gli stream chiamano il callback da un thread dedicato con la cadenza reale dei blocchi,
+come farebbe PortAudio: i tempi della pipeline restano quelli veri. Se il callback
+accumula più di un blocco di ritardo viene segnalato over/underflow.
+
+- `microphone`: rumore di fondo più, a comando (`say`), un segnale vocale sintetico.
+- `speaker`: registra quando l'uscita passa dal silenzio al suono (`onsets`).
+
+Uso: `sys.modules["sounddevice"] = fake_sounddevice` prima di importare i moduli audio.
+"""
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+import numpy as np
+
+
+class CallbackFlags:
+    def __init__(self, input_overflow: bool = False, output_underflow: bool = False):
+        self.input_overflow = input_overflow
+        self.output_underflow = output_underflow
+
+
+class VirtualMicrophone:
+    def __init__(self, samplerate: int = 16000, noise_level: float = 30.0, speech_level: float = 3000.0, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.samplerate = samplerate
+        # Un secondo di rumore precalcolato, letto in loop: il thread audio non genera numeri casuali.
+        self._noise = (rng.standard_normal(samplerate) * noise_level).astype(np.float32)
+        t = np.arange(samplerate, dtype=np.float32) / samplerate
+        # "Voce": due armoniche modulate in ampiezza a 4 Hz, più il rumore.
+        envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+        self._speech = (speech_level * envelope * (np.sin(2 * np.pi * 180 * t) + 0.5 * np.sin(2 * np.pi * 360 * t))).astype(np.float32)
+        self._pos = 0
+        self._lock = threading.Lock()
+        self._speech_window: Tuple[float, float] = (0.0, 0.0)
+        self.utterances: List[Tuple[float, float]] = []
+
+    def say(self, duration_s: float) -> float:
+        """Inizia subito un'emissione vocale di `duration_s` secondi. Ritorna l'istante di fine."""
+        start = time.monotonic()
+        with self._lock:
+            self._speech_window = (start, start + duration_s)
+            self.utterances.append(self._speech_window)
+        return start + duration_s
+
+    def fill(self, out: np.ndarray):
+        frames = len(out)
+        idx = (self._pos + np.arange(frames)) % self.samplerate
+        self._pos = (self._pos + frames) % self.samplerate
+        block = self._noise[idx]
+        start, end = self._speech_window
+        if start <= time.monotonic() < end:
+            block = block + self._speech[idx]
+        out[:, 0] = np.clip(block, -32768, 32767).astype(np.int16)
+
+
+class VirtualSpeaker:
+    def __init__(self, threshold: int = 200):
+        self.threshold = threshold
+        self.onsets: List[float] = []
+        self.samples_played = 0
+        self.samples_audible = 0
+        self._sounding = False
+
+    def consume(self, block: np.ndarray):
+        self.samples_played += len(block)
+        audible = bool(len(block)) and int(np.abs(block).max()) > self.threshold
+        if audible:
+            self.samples_audible += len(block)
+            if not self._sounding:
+                self.onsets.append(time.monotonic())
+        self._sounding = audible
+
+    def first_onset_after(self, t: float) -> Optional[float]:
+        return next((onset for onset in self.onsets if onset >= t), None)
+
+
+microphone = VirtualMicrophone()
+speaker = VirtualSpeaker()
+
+
+class _VirtualStream:
+    def __init__(self, samplerate: float = 16000, channels: int = 1, dtype: str = 'int16', blocksize: int = 0,
+                 callback: Optional[Callable[..., None]] = None, latency: Any = None, device: Any = None, **kwargs: Any):
+        self.samplerate = int(samplerate)
+        self.channels = channels
+        self.blocksize = blocksize or int(self.samplerate * 0.02)
+        self.callback = callback
+        self._buffer = np.zeros((self.blocksize, channels), dtype=np.int16)
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self.late_blocks = 0
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+    def close(self):
+        self.stop()
+
+    def _run(self):
+        period = self.blocksize / self.samplerate
+        next_at = time.perf_counter()
+        late = False
+        while self._running:
+            self._process(late)
+            next_at += period
+            delay = next_at - time.perf_counter()
+            late = delay < -period
+            if late:
+                self.late_blocks += 1
+                next_at = time.perf_counter()
+            elif delay > 0:
+                time.sleep(delay)
+
+    def _process(self, late: bool):
+        raise NotImplementedError
+
+
+class InputStream(_VirtualStream):
+    def _process(self, late: bool):
+        microphone.fill(self._buffer)
+        self.callback(self._buffer, self.blocksize, None, CallbackFlags(input_overflow=late))
+
+
+class OutputStream(_VirtualStream):
+    def _process(self, late: bool):
+        out = np.zeros((self.blocksize, self.channels), dtype=np.int16)
+        self.callback(out, self.blocksize, None, CallbackFlags(output_underflow=late))
+        speaker.consume(out[:, 0])
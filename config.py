@@ -20,19 +20,103 @@ ELEVEN_AGENT_ID = os.getenv("ELEVEN_AGENT_ID")
 # Aumentalo se la connessione fallisce per timeout.
 ELEVEN_WEBSOCKET_TIMEOUT = 30 # AUMENTATO A 30 SECONDI PER MAGGIORE ROBUSTezza
 ELEVEN_VOICE_ID = os.getenv("ELEVEN_VOICE_ID")
+# Indirizzo delle API ElevenLabs (da cambiare solo per i benchmark con server locali).
+ELEVEN_API_BASE_URL = os.getenv("ELEVEN_API_BASE_URL", "https://api.elevenlabs.io")
+# Il signed URL della connessione successiva viene richiesto in anticipo; oltre questa età
+# viene considerato scaduto e ne viene chiesto uno nuovo.
+ELEVEN_SIGNED_URL_MAX_AGE_S = 600
+# Connessione di riserva già aperta, promossa subito se quella attiva cade (costa un
+# secondo websocket sempre aperto durante le sessioni).
+ELEVEN_WARM_STANDBY = os.getenv("ELEVEN_WARM_STANDBY", "false").lower() == "true"
+ELEVEN_STANDBY_MAX_AGE_S = 60
+# Backoff esponenziale con jitter tra un tentativo di connessione fallito e il successivo.
+ELEVEN_RECONNECT_BACKOFF_BASE_S = 0.5
+ELEVEN_RECONNECT_BACKOFF_MAX_S = 30
 
 # Impostazione per il rilevamento del silenzio nel ConversationalAgent.
 # Questo valore (RMS) determina la soglia sotto la quale un chunk audio è considerato silenzioso.
 # Un valore più basso rende il sistema meno sensibile al silenzio (potrebbe rilevare rumori di fondo).
 # Un valore più alto rende il sistema più sensibile al silenzio (potrebbe tagliare l'inizio delle parole).
 # Si consiglia di partire da 200 e aggiustare in base al proprio ambiente.
+# Con il VAD attivo è la soglia iniziale: dopo VAD_CALIBRATION_MS viene sostituita da
+# VAD_NOISE_RATIO × rumore di fondo misurato (mai sotto VAD_MIN_THRESHOLD).
 SILENCE_THRESHOLD = 200
 
+# --- VAD lato client ---
+# I frame di silenzio non vengono inviati: restano solo il parlato (con padding prima
+# e hangover dopo), una coda di silenzio per la fine turno e un keepalive periodico.
+VAD_ENABLED = os.getenv("VAD_ENABLED", "true").lower() == "true"
+VAD_MIN_THRESHOLD = 50
+VAD_NOISE_RATIO = 3.0
+VAD_CALIBRATION_MS = 1000
+VAD_HANGOVER_MS = 300
+VAD_PADDING_MS = 200
+VAD_TRAILING_SILENCE_MS = 1000
+VAD_KEEPALIVE_MS = 1000
+
 
 # Costante per 20ms di silenzio PCM 16kHz, 1 canale, Base64 encoded, senza wrap.
 # Generata con i comandi sox e base64.
 B64_SILENCE_20MS = "AQAAAAAA//8AAAEAAAAAAAAAAAAAAAAA//8AAP///////wAAAQD//wAAAQAAAAAAAQD//wAA//8AAAAAAAAAAAEAAAD//wAAAAAAAAAAAAAAAAAAAAAAAP//AAAAAAAA/////wAAAAABAAAAAQAAAAEAAAD//wAAAAAAAP//AAAAAAAAAQAAAAEAAAAAAAEAAAAAAAAAAAAAAAAA////////AQD//wAA//8AAAAA//8AAAAAAAAAAAAAAAAAAP//AQAAAAAA/////wEAAAD//wAA//8AAAAAAAABAAAAAAAAAAAAAQAAAAAAAAAAAAAAAAAAAAAA//8AAAAA//8BAAAAAAABAAAAAAD//wAAAQAAAAAAAAAAAAAA//////////8AAAAAAAABAAAAAAAAAAAAAAAAAP//AAABAAAAAAAAAAAAAQAAAAAA//8AAAAAAAAAAAAAAAAAAAAAAAD//wAAAAD//wAAAQAAAAEA//8AAAAA//8AAAAAAAAAAAEAAAAAAP//AAD//wAAAAD//wAAAAAAAAAAAQAAAAAAAAAAAAAAAAABAAEAAAAAAAAAAQD//wEAAAAAAP//AQABAAAAAAAAAAAAAAAAAP//AAAAAAAAAAAAAAAA//8AAP//AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABAAAAAAAAAAAAAAABAAAAAAAAAAAAAAD//wAAAAD/////AAAAAAAAAAAAAAAAAAAAAAAA//8AAAAA//8AAAEAAAAAAP//AAABAAAAAAAAAAAAAAAAAP//AAAAAP////8AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABAAAAAAABAA=="
 
+# --- Hotword e sessione ---
+# Porcupine ascolta la hotword "Capitano" sul dispositivo. Senza access key la sessione
+# parte all'avvio e resta sempre aperta, come prima.
+PORCUPINE_ACCESS_KEY = os.getenv("PORCUPINE_ACCESS_KEY")
+PORCUPINE_KEYWORD_PATH = os.getenv("PORCUPINE_KEYWORD_PATH", "Capitano_it_raspberry-pi_v3_0_0.ppn")
+PORCUPINE_MODEL_PATH = os.getenv("PORCUPINE_MODEL_PATH", "porcupine_params_it.pv")
+# Secondi senza trascrizioni dell'utente né tool dopo i quali la sessione con ElevenLabs
+# viene chiusa e si torna ad aspettare la hotword (0 = mai).
+SESSION_IDLE_TIMEOUT_S = float(os.getenv("SESSION_IDLE_TIMEOUT_S", "120"))
+
+# --- Audio dell'agente ---
+# Lo stream di uscita resta aperto per tutta la sessione e legge da un buffer circolare.
+# AUDIO_OUTPUT_PREROLL_MS è il jitter buffer: quanto audio accumulare prima di iniziare
+# (o riprendere) a parlare. Valori più alti evitano scatti su reti lente ma aggiungono ritardo.
+AUDIO_OUTPUT_BLOCK_MS = 20
+AUDIO_OUTPUT_PREROLL_MS = float(os.getenv("AUDIO_OUTPUT_PREROLL_MS", "120"))
+AUDIO_OUTPUT_BUFFER_S = 60
+
+# --- Uplink microfono ---
+# Durata di ogni frame audio inviato a ElevenLabs (20, 40, 100 ms...). Frame più lunghi
+# riducono messaggi e CPU, ma aggiungono fino a un frame di ritardo sulla voce dell'utente.
+UPLINK_FRAME_MS = float(os.getenv("UPLINK_FRAME_MS", "40"))
+# Audio massimo in attesa di invio: oltre questa soglia si scarta il più vecchio.
+UPLINK_MAX_BUFFER_MS = 1000
+
+# --- Musica di sottofondo ---
+BACKGROUND_MUSIC_PATH = os.getenv("BACKGROUND_MUSIC_PATH", "/home/omar/TRACCIASOTTOFONDO.mp3")
+# "ffplay" avvia un processo ffplay esterno a volume fisso; "mixer" decodifica il brano
+# una sola volta in una cache PCM e lo riproduce in-process, abbassandolo mentre parla
+# il Capitano e sfumandolo quando parte Spotify (richiede ffmpeg solo per la prima decodifica).
+BACKGROUND_MUSIC_MODE = os.getenv("BACKGROUND_MUSIC_MODE", "ffplay")
+BACKGROUND_MUSIC_VOLUME_PERCENT = 60
+BACKGROUND_MUSIC_DUCK_PERCENT = 20
+BACKGROUND_MUSIC_DUCK_MS = 300
+BACKGROUND_MUSIC_FADE_MS = 1500
+
+# --- Jukebox ---
+# Modalità di rilevamento della fine del brano: "deadline" pianifica i controlli in base
+# alla durata del brano (poche chiamate a Spotify per traccia), "polling" ripristina il
+# vecchio controllo a intervallo fisso di 2 secondi.
+JUKEBOX_MONITOR_MODE = os.getenv("JUKEBOX_MONITOR_MODE", "deadline")
+
+# --- Metriche ---
+# Latenze e contatori della pipeline (turni, tool, Spotify, OpenAI, riconnessioni, audio)
+# esposti in formato Prometheus su http://METRICS_HOST:METRICS_PORT/metrics (0 = disattivato)
+# e, se METRICS_JSON_PATH è impostato, scritti in JSON ogni METRICS_JSON_INTERVAL_S secondi.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+METRICS_JSON_PATH = os.getenv("METRICS_JSON_PATH", "")
+METRICS_JSON_INTERVAL_S = 60
+
+# --- Watchdog dell'event loop ---
+# Un ritardo del loop oltre LOOP_WATCHDOG_THRESHOLD_MS (es. una chiamata sincrona a Spotify,
+# OpenAI o a un processo esterno) fa campionare lo stack del thread principale: i blocchi
+# sono contati per punto del codice, nei log e nelle metriche event_loop_* (0 = disattivato).
+LOOP_WATCHDOG_THRESHOLD_MS = int(os.getenv("LOOP_WATCHDOG_THRESHOLD_MS", "100"))
+LOOP_WATCHDOG_REPORT_INTERVAL_S = 300
+
 # --- Credenziali OpenAI (per risposte dinamiche future) ---
 # AI-COMMENT: Abbiamo aggiunto questa variabile in previsione della futura
 # implementazione delle risposte dinamiche del "Capitano" tramite GPT-4.
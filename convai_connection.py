@@ -0,0 +1,188 @@
+# convai_connection.py
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+import metrics
+import startup_timing
+
+logger = logging.getLogger("ConvaiConnection")
+
+ELEVEN_API_BASE_URL = "https://api.elevenlabs.io"
+
+_RECONNECT_SECONDS = metrics.histogram("convai_reconnect_seconds", "Dalla perdita della sessione alla nuova sessione avviata")
+_SIGNED_URL_SECONDS = metrics.histogram("convai_signed_url_seconds", "Richiesta del signed URL a ElevenLabs")
+
+
+def _is_open(websocket: Any) -> bool:
+    from websockets.protocol import State  # già caricato: la connessione esiste
+    return websocket.state is State.OPEN
+
+
+class Backoff:
+    """Backoff esponenziale con tetto e jitter completo: attesa casuale in [0, min(cap, base·2^n)]."""
+
+    def __init__(self, base_s: float = 0.5, cap_s: float = 30.0):
+        self.base_s = base_s
+        self.cap_s = cap_s
+        self.attempt = 0
+
+    def next_delay(self) -> float:
+        delay = random.uniform(0, min(self.cap_s, self.base_s * 2 ** self.attempt))
+        self.attempt += 1
+        return delay
+
+    def reset(self):
+        self.attempt = 0
+
+
+class ConvaiConnectionManager:
+    """
+    Apertura delle connessioni websocket verso l'agente conversazionale ElevenLabs.
+
+    - Un solo `httpx.AsyncClient` in keep-alive per tutte le richieste di signed URL.
+    - Il signed URL della prossima connessione viene richiesto in anticipo, appena
+      quello precedente è stato usato, e scartato se più vecchio di `signed_url_max_age_s`.
+    - Con `warm_standby` viene tenuta aperta una seconda connessione (senza avviare la
+      conversazione) da promuovere subito quando quella attiva si chiude; oltre
+      `standby_max_age_s` viene sostituita, per non consegnare un socket chiuso dal server.
+    """
+
+    def __init__(self, api_key: str, agent_id: str, base_url: str = ELEVEN_API_BASE_URL,
+                 open_timeout: float = 20.0, signed_url_max_age_s: float = 600.0,
+                 warm_standby: bool = False, standby_max_age_s: float = 30.0):
+        self.agent_id = agent_id
+        self.open_timeout = open_timeout
+        self.signed_url_max_age_s = signed_url_max_age_s
+        self.warm_standby = warm_standby
+        self.standby_max_age_s = standby_max_age_s
+        self._http = httpx.AsyncClient(
+            base_url=base_url, timeout=10.0, headers={"xi-api-key": api_key or ""},
+            limits=httpx.Limits(max_connections=2, max_keepalive_connections=2, keepalive_expiry=300.0),
+        )
+        self._prefetch_task: Optional[asyncio.Task] = None
+        self._standby_task: Optional[asyncio.Task] = None
+        self._standby: Optional[Tuple[Any, float]] = None
+        # Contatori
+        self.connections = 0
+        self.prefetched_urls_used = 0
+        self.standby_promotions = 0
+        self.reconnects = 0
+        self.reconnect_total_s = 0.0
+        self.reconnect_max_s = 0.0
+
+    # --- Signed URL ---
+    async def _fetch_signed_url(self) -> Tuple[str, float]:
+        with _SIGNED_URL_SECONDS.time():
+            response = await self._http.get("/v1/convai/conversation/get-signed-url", params={"agent_id": self.agent_id})
+        response.raise_for_status()
+        return response.json()["signed_url"], time.monotonic()
+
+    def prefetch(self):
+        """Avvia in background la richiesta del prossimo signed URL, se non è già in corso."""
+        if self._prefetch_task is None:
+            self._prefetch_task = asyncio.create_task(self._fetch_signed_url())
+
+    async def _take_signed_url(self) -> str:
+        task, self._prefetch_task = self._prefetch_task, None
+        if task is not None:
+            try:
+                url, fetched_at = await task
+                if time.monotonic() - fetched_at <= self.signed_url_max_age_s:
+                    self.prefetched_urls_used += 1
+                    return url
+            except Exception as e:
+                logger.warning(f"Signed URL anticipato non disponibile ({e}), ne chiedo uno nuovo.")
+        url, _ = await self._fetch_signed_url()
+        return url
+
+    async def _open(self) -> Any:
+        # websockets si carica al primo collegamento, in parallelo alla richiesta del signed URL.
+        websockets, url = await asyncio.gather(startup_timing.import_in_thread("websockets"), self._take_signed_url())
+        websocket = await websockets.connect(url, open_timeout=self.open_timeout, max_size=None)
+        self.prefetch()
+        return websocket
+
+    # --- Connessione di riserva ---
+    def _ensure_standby(self):
+        if self.warm_standby and self._standby is None and self._standby_task is None:
+            self._standby_task = asyncio.create_task(self._open_standby())
+
+    async def _open_standby(self):
+        try:
+            self._standby = (await self._open(), time.monotonic())
+            logger.info("Connessione di riserva pronta.")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Impossibile aprire la connessione di riserva: {e}")
+        finally:
+            self._standby_task = None
+
+    async def _take_standby(self) -> Optional[Any]:
+        standby, self._standby = self._standby, None
+        if standby is None:
+            return None
+        websocket, opened_at = standby
+        if _is_open(websocket) and time.monotonic() - opened_at <= self.standby_max_age_s:
+            return websocket
+        await websocket.close()
+        return None
+
+    async def release_standby(self):
+        """Chiude la connessione di riserva (es. quando la sessione va in pausa per inattività)."""
+        if self._standby_task:
+            self._standby_task.cancel()
+            self._standby_task = None
+        standby, self._standby = self._standby, None
+        if standby:
+            await standby[0].close()
+
+    async def refresh_standby(self):
+        """Sostituisce la connessione di riserva se è troppo vecchia o chiusa."""
+        if self._standby and (not _is_open(self._standby[0])
+                              or time.monotonic() - self._standby[1] > self.standby_max_age_s):
+            await self.release_standby()
+        self._ensure_standby()
+
+    # --- API ---
+    async def connect(self) -> Any:
+        """Ritorna una connessione aperta: quella di riserva se disponibile, altrimenti una nuova."""
+        websocket = await self._take_standby()
+        if websocket is not None:
+            self.standby_promotions += 1
+            logger.info("⚡ Promossa la connessione di riserva.")
+        else:
+            websocket = await self._open()
+        self.connections += 1
+        self._ensure_standby()
+        return websocket
+
+    def record_reconnect(self, elapsed_s: float):
+        self.reconnects += 1
+        self.reconnect_total_s += elapsed_s
+        self.reconnect_max_s = max(self.reconnect_max_s, elapsed_s)
+        _RECONNECT_SECONDS.observe(elapsed_s)
+        logger.info(f"⏱️ Riconnessione completata in {elapsed_s * 1000:.0f} ms "
+                    f"(media {self.reconnect_total_s / self.reconnects * 1000:.0f} ms su {self.reconnects}).")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": self.connections,
+            "prefetched_urls_used": self.prefetched_urls_used,
+            "standby_promotions": self.standby_promotions,
+            "reconnects": self.reconnects,
+            "reconnect_avg_ms": round(self.reconnect_total_s / self.reconnects * 1000) if self.reconnects else None,
+            "reconnect_max_ms": round(self.reconnect_max_s * 1000) if self.reconnects else None,
+        }
+
+    async def aclose(self):
+        await self.release_standby()
+        if self._prefetch_task:
+            self._prefetch_task.cancel()
+            self._prefetch_task = None
+        await self._http.aclose()
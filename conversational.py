@@ -1,23 +1,40 @@
 # conversational.py (VERSIONE DEFINITIVA E CORRETTA)
 import asyncio
-import websockets
 import json
 import base64
+import inspect
 import logging
-import sounddevice as sd
+import time
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
 import numpy as np
-import httpx
-from typing import Any
 import config
+import metrics
+import startup_timing
+from audio_capture import CaptureBus
+from audio_downlink import AudioDownlink
+from audio_output import AudioOutput
+from audio_uplink import MicUplink
+from audio_vad import EnergyVAD
+from convai_connection import Backoff, ConvaiConnectionManager
 from tools import spotify_tools
+from tools.registry import ToolRegistry
+
+if TYPE_CHECKING:
+    from websockets.asyncio.client import ClientConnection
 
 logger = logging.getLogger("conversational")
+# Una sessione più lunga di così è considerata riuscita e azzera il backoff di riconnessione.
+_STABLE_SESSION_S = 10.0
 B64_SILENCE_20MS = getattr(config, 'B64_SILENCE_20MS', "AQAAAA...")
+SILENCE_THRESHOLD = getattr(config, 'SILENCE_THRESHOLD', 200)
+
+_TURN_LATENCY = metrics.histogram("convai_turn_latency_seconds", "Dalla trascrizione finale dell'utente al primo audio della risposta")
 
 class ConversationalAgent:
     def __init__(self, injection_queue: asyncio.Queue, spotify_polling_queue: asyncio.Queue,
                  hotword_detected_event: asyncio.Event, spotify_playback_event: asyncio.Event,
-                 text_only_mode: bool = False):
+                 text_only_mode: bool = False, capture_bus: Optional[CaptureBus] = None,
+                 idle_timeout_s: float = 0.0, tools: Optional[ToolRegistry] = None):
         self.api_key = config.ELEVEN_API_KEY
         self.agent_id = config.ELEVEN_AGENT_ID
         self.stop_event = asyncio.Event()
@@ -29,74 +46,164 @@ class ConversationalAgent:
         self.spotify_playback_event = spotify_playback_event
         self.text_only_mode = text_only_mode
         self.request_lock = asyncio.Lock()
+        self.tools = tools or ToolRegistry(spotify_tools.spotify_tool_specs())
+        # Politica di inattività: dopo `idle_timeout_s` senza trascrizioni dell'utente né tool
+        # la sessione viene chiusa e il microfono torna alla hotword (0 = mai).
+        self.idle_timeout_s = idle_timeout_s
+        self._last_activity = time.monotonic()
+        self._session_idle = False
+        self._first_audio_received = False
+        self._turn_started_at: Optional[float] = None
+        self.connections = ConvaiConnectionManager(
+            self.api_key, self.agent_id,
+            base_url=config.ELEVEN_API_BASE_URL,
+            open_timeout=config.ELEVEN_WEBSOCKET_TIMEOUT,
+            signed_url_max_age_s=config.ELEVEN_SIGNED_URL_MAX_AGE_S,
+            warm_standby=config.ELEVEN_WARM_STANDBY,
+            standby_max_age_s=config.ELEVEN_STANDBY_MAX_AGE_S,
+        )
+        self.reconnect_backoff = Backoff(config.ELEVEN_RECONNECT_BACKOFF_BASE_S, config.ELEVEN_RECONNECT_BACKOFF_MAX_S)
+        self.audio_output = AudioOutput(
+            samplerate=16000,
+            block_ms=config.AUDIO_OUTPUT_BLOCK_MS,
+            preroll_ms=config.AUDIO_OUTPUT_PREROLL_MS,
+            buffer_s=config.AUDIO_OUTPUT_BUFFER_S,
+        )
+        self.audio_downlink = AudioDownlink()
+        frame_samples = int(16000 * config.UPLINK_FRAME_MS / 1000)
+        vad = EnergyVAD(
+            samplerate=16000,
+            frame_samples=frame_samples,
+            initial_threshold=SILENCE_THRESHOLD,
+            min_threshold=config.VAD_MIN_THRESHOLD,
+            noise_ratio=config.VAD_NOISE_RATIO,
+            calibration_ms=config.VAD_CALIBRATION_MS,
+            hangover_ms=config.VAD_HANGOVER_MS,
+            padding_ms=config.VAD_PADDING_MS,
+            trailing_silence_ms=config.VAD_TRAILING_SILENCE_MS,
+            keepalive_ms=config.VAD_KEEPALIVE_MS,
+        ) if config.VAD_ENABLED else None
+        self.mic_uplink = MicUplink(
+            samplerate=16000,
+            frame_ms=config.UPLINK_FRAME_MS,
+            max_buffer_ms=config.UPLINK_MAX_BUFFER_MS,
+            vad=vad,
+            silence_b64=B64_SILENCE_20MS,
+        )
+        # Il microfono è condiviso con gli altri consumatori (hotword) tramite il bus di cattura;
+        # l'uplink tiene l'audio solo mentre l'utente può parlare.
+        self._owns_capture_bus = capture_bus is None
+        self.capture_bus = capture_bus or CaptureBus(samplerate=16000)
+        self.mic_uplink.attach(self.capture_bus, gate=self.user_can_speak.is_set)
 
     async def speak(self, text: str):
         await self.injection_queue.put({"text": text})
 
-    async def _get_signed_websocket_url(self) -> str:
-        url = f"https://api.elevenlabs.io/v1/convai/conversation/get-signed-url?agent_id={self.agent_id}"
-        headers = {"xi-api-key": self.api_key}
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.get(url, headers=headers)
-            response.raise_for_status()
-            return response.json()["signed_url"]
-
-    async def _play_chunk(self, audio_chunk_bytes: bytes):
-        loop = asyncio.get_running_loop()
-        audio_data = np.frombuffer(audio_chunk_bytes, dtype=np.int16)
-        if audio_data.size > 0:
-            await loop.run_in_executor(None, sd.play, audio_data, 16000)
-            await loop.run_in_executor(None, sd.wait)
-
     # Anche se non credi sia necessario, ripristino un anti-eco MINIMO (0.2s)
     # come best practice per la stabilità, per evitare che l'agente senta se stesso.
+    # L'audio dell'agente viene solo accodato: prima di riaprire il microfono
+    # aspettiamo che lo stream di uscita abbia riprodotto tutto.
     async def _delayed_enable_mic(self, delay: float):
+        await self.audio_output.drain()
         await asyncio.sleep(delay)
+        if self.audio_output.is_playing:
+            return
         if not self.spotify_playback_event.is_set():
             self.user_can_speak.set()
             logger.info(">> Microfono riattivato.")
 
-    async def _handle_agent_messages(self, websocket: websockets.WebSocketClientProtocol):
-        async for message_str in websocket:
-            if self.stop_event.is_set() or self.restart_event.is_set(): break
-            data = json.loads(message_str)
-            msg_type = data.get('type')
-
-            if msg_type == 'conversation_initiation_metadata':
-                self.user_can_speak.set()
-            elif msg_type == 'user_transcript':
-                logger.info(f"✅ Trascrizione Utente: '{data.get('user_transcription_event', {}).get('user_transcript', '')}'")
-            elif msg_type == 'client_tool_call':
-                self.user_can_speak.clear()
-                asyncio.create_task(self.handle_tool_call(websocket, data.get('client_tool_call', {})))
-            elif msg_type == 'agent_response':
-                if text := data.get('agent_response_event', {}).get('agent_response', ''):
-                    logger.info(f"📝 Testo Risposta Agente: '{text}'")
-                if self.request_lock.locked(): self.request_lock.release()
-                asyncio.create_task(self._delayed_enable_mic(0.2))
-            elif msg_type == 'audio':
-                self.user_can_speak.clear()
-                if audio_chunk_b64 := data.get('audio_event', {}).get('audio_base_64'):
-                    await self._play_chunk(base64.b64decode(audio_chunk_b64))
+    def _on_agent_audio(self, samples: np.ndarray):
+        self.user_can_speak.clear()
+        if samples.size == 0:
+            return
+        self.audio_output.enqueue_samples(samples)
+        if self._turn_started_at is not None:
+            _TURN_LATENCY.observe(time.monotonic() - self._turn_started_at)
+            self._turn_started_at = None
+        if not self._first_audio_received:
+            self._first_audio_received = True
+            startup_timing.mark("primo audio dell'agente")
+            startup_timing.log_report_once()
 
-    async def handle_tool_call(self, websocket: websockets.WebSocketClientProtocol, tool_call: dict):
+    @staticmethod
+    def _bytes_receiver(websocket: "ClientConnection") -> Callable[[], Awaitable[bytes]]:
+        """
+        `recv` che ritorna i messaggi come bytes. Con websockets >= 14 il testo non viene
+        nemmeno decodificato da UTF-8; con l'API legacy (`recv()` senza `decode`) viene
+        ricodificato, così il percorso veloce dell'audio funziona con entrambe.
+        """
+        if "decode" in inspect.signature(websocket.recv).parameters:
+            return lambda: websocket.recv(decode=False)
+
+        async def recv() -> bytes:
+            message = await websocket.recv()
+            return message.encode("utf-8") if isinstance(message, str) else message
+        return recv
+
+    async def _handle_agent_messages(self, websocket: "ClientConnection"):
+        downlink = self.audio_downlink
+        recv = self._bytes_receiver(websocket)
+        from websockets.exceptions import ConnectionClosedOK  # già caricato con la connessione
+        try:
+            while True:
+                # Messaggi come bytes: i chunk audio (quasi tutto il traffico) saltano la
+                # decodifica UTF-8 e `json.loads`; gli altri tipi passano dal percorso generico.
+                try:
+                    message = await recv()
+                except ConnectionClosedOK:
+                    break
+                if self.stop_event.is_set() or self.restart_event.is_set(): break
+                samples = downlink.parse_audio(message)
+                if samples is not None:
+                    self._on_agent_audio(samples)
+                    continue
+                data = json.loads(message)
+                msg_type = data.get('type')
+
+                if msg_type == 'conversation_initiation_metadata':
+                    self.user_can_speak.set()
+                elif msg_type == 'user_transcript':
+                    self._mark_activity()
+                    self._turn_started_at = time.monotonic()
+                    logger.info(f"✅ Trascrizione Utente: '{data.get('user_transcription_event', {}).get('user_transcript', '')}'")
+                elif msg_type == 'client_tool_call':
+                    self._mark_activity()
+                    self.user_can_speak.clear()
+                    asyncio.create_task(self.handle_tool_call(websocket, data.get('client_tool_call', {})))
+                elif msg_type == 'agent_response':
+                    if text := data.get('agent_response_event', {}).get('agent_response', ''):
+                        logger.info(f"📝 Testo Risposta Agente: '{text}'")
+                    if self.request_lock.locked(): self.request_lock.release()
+                    asyncio.create_task(self._delayed_enable_mic(0.2))
+                elif msg_type == 'audio':
+                    audio_chunk_b64 = data.get('audio_event', {}).get('audio_base_64') or ""
+                    self._on_agent_audio(np.frombuffer(base64.b64decode(audio_chunk_b64), dtype=np.int16))
+                elif msg_type == 'interruption':
+                    self.audio_output.flush()
+        finally:
+            logger.info(f"Statistiche downlink audio: {downlink.stats()}")
+
+    async def handle_tool_call(self, websocket: "ClientConnection", tool_call: dict):
         tool_name, tool_params, tool_call_id = tool_call.get('tool_name'), tool_call.get('parameters', {}), tool_call.get('tool_call_id')
         logger.info(f"Esecuzione tool: '{tool_name}' con parametri: {tool_params}")
         try:
-            tool_function = getattr(spotify_tools, tool_name)
-            is_music_tool = "spotify" in tool_name.lower()
-            if is_music_tool:
+            spec = self.tools.get(tool_name)
+            if spec is None:
+                raise ValueError(f"Tool '{tool_name}' non registrato.")
+            context = {"spotify_polling_queue": self.spotify_polling_queue}
+            if spec.starts_playback:
                 self.spotify_playback_event.set()
+            if spec.fire_and_forget:
                 await websocket.send(json.dumps({"type": "client_tool_result", "tool_call_id": tool_call_id, "result": json.dumps({"status": "success"}), "is_error": False}))
-                asyncio.create_task(tool_function(**tool_params, spotify_polling_queue=self.spotify_polling_queue))
+                self.tools.submit(tool_name, tool_params, context)
             else:
-                tool_result = await tool_function(**tool_params)
+                tool_result = await self.tools.call(tool_name, tool_params, context)
                 await websocket.send(json.dumps({"type": "client_tool_result", "tool_call_id": tool_call_id, "result": json.dumps(tool_result), "is_error": tool_result.get("status") != "success"}))
         except Exception as e:
             logger.error(f"Errore gestione tool '{tool_name}': {e}", exc_info=True)
             await websocket.send(json.dumps({"type": "client_tool_result", "tool_call_id": tool_call_id, "result": json.dumps({"status": "error", "message": str(e)}), "is_error": True}))
 
-    async def _listen_for_injections(self, websocket: websockets.WebSocketClientProtocol):
+    async def _listen_for_injections(self, websocket: "ClientConnection"):
         while not self.stop_event.is_set() and not self.restart_event.is_set():
             injection_data = await self.injection_queue.get()
             if injection_data.get("type") == "jukebox_notification":
@@ -108,60 +215,160 @@ class ConversationalAgent:
             await self.request_lock.acquire()
             await websocket.send(json.dumps({"type": "user_message", "text": injection_data.get("text", "")}))
 
-    async def _stream_user_audio(self, websocket: websockets.WebSocketClientProtocol):
-        audio_queue = asyncio.Queue(maxsize=50)
-        loop = asyncio.get_running_loop()
+    def _mark_activity(self):
+        self._last_activity = time.monotonic()
 
-        # VERSIONE CORRETTA E THREAD-SAFE (dal tuo backup)
-        def audio_callback(indata: np.ndarray, frames: int, time_info: Any, status: Any):
-            if status:
-                loop.call_soon_threadsafe(logger.warning, f"Errore callback audio: {status}")
-            if self.user_can_speak.is_set():
-                try:
-                    loop.call_soon_threadsafe(audio_queue.put_nowait, indata.copy())
-                except asyncio.QueueFull:
-                    pass # Se la coda è piena, scarta il nuovo chunk per non bloccare l'audio
+    async def _watch_idle(self, websocket: "ClientConnection"):
+        """Chiude la sessione dopo `idle_timeout_s` senza attività dell'utente."""
+        self._mark_activity()
+        while not self.stop_event.is_set() and not self.restart_event.is_set():
+            # Mentre l'agente parla, o se la politica è disattivata, la sessione non è inattiva.
+            if self.idle_timeout_s <= 0 or self.audio_output.is_playing:
+                self._mark_activity()
+                await asyncio.sleep(1.0)
+                continue
+            remaining = self._last_activity + self.idle_timeout_s - time.monotonic()
+            if remaining <= 0:
+                logger.info(f"💤 Nessuna attività da {self.idle_timeout_s:.0f}s: chiudo la sessione e torno in ascolto della hotword.")
+                self._session_idle = True
+                return
+            await asyncio.sleep(min(remaining, 1.0))
 
-        logger.info(f"Avvio stream audio utente a 16000 Hz...")
-        with sd.InputStream(samplerate=16000, channels=1, dtype='int16', callback=audio_callback, blocksize=int(16000 * 0.02)):
+    async def _maintain_standby(self):
+        """Tiene pronta (e fresca) la connessione di riserva finché la sessione è attiva."""
+        while True:
+            await self.connections.refresh_standby()
+            await asyncio.sleep(self.connections.standby_max_age_s / 2)
+
+    async def _wait_for_wakeup(self):
+        """
+        Sessione chiusa per inattività: il microfono è di Porcupine. Nel frattempo le
+        notifiche del Jukebox vengono gestite qui; un messaggio da pronunciare riapre la sessione.
+        """
+        hotword_task = asyncio.create_task(self.hotword_detected_event.wait())
+        try:
+            while not self.hotword_detected_event.is_set() and not self.stop_event.is_set():
+                injection_task = asyncio.create_task(self.injection_queue.get())
+                done, _ = await asyncio.wait({hotword_task, injection_task}, return_when=asyncio.FIRST_COMPLETED)
+                if injection_task not in done:
+                    injection_task.cancel()
+                    break
+                injection_data = injection_task.result()
+                if injection_data.get("type") == "jukebox_notification":
+                    logger.info("Jukebox ha notificato la fine del brano a sessione chiusa. Ripristino stato.")
+                    self.spotify_playback_event.clear()
+                    continue
+                # Testo da far dire all'agente: lo rimettiamo in coda e riapriamo la sessione.
+                self.injection_queue.put_nowait(injection_data)
+                self.hotword_detected_event.set()
+        finally:
+            hotword_task.cancel()
+
+    async def _stream_user_audio(self, websocket: "ClientConnection"):
+        uplink = self.mic_uplink
+        uplink.reset()
+        logger.info(f"Avvio stream audio utente a 16000 Hz (frame uplink da {uplink.frame_ms:.0f} ms)...")
+        try:
             while not self.stop_event.is_set() and not self.restart_event.is_set():
                 if self.user_can_speak.is_set():
-                    try:
-                        chunk = await asyncio.wait_for(audio_queue.get(), timeout=0.5)
-                        await websocket.send(json.dumps({"type": "user_audio_chunk", "user_audio_chunk": base64.b64encode(chunk.tobytes()).decode('utf-8')}))
-                    except asyncio.TimeoutError:
-                        continue
+                    await uplink.send_next(websocket, timeout=0.5)
                 else:
+                    # Il microfono è stato disattivato: l'audio rimasto non va più inviato.
+                    uplink.reset()
                     await asyncio.sleep(0.05)
+        finally:
+            logger.info(f"Statistiche uplink microfono: {uplink.stats()}")
 
     def stop(self):
         if not self.stop_event.is_set():
             self.stop_event.set()
+            self.tools.cancel_all()
+            self.audio_output.close()
+            if self._owns_capture_bus:
+                self.capture_bus.close()
             logger.info("Segnale di stop inviato al ConversationalAgent.")
 
+    async def _run_session(self, websocket: "ClientConnection"):
+        """Esegue una sessione finché uno dei suoi task termina (socket chiuso, riavvio o inattività)."""
+        coros = [self._handle_agent_messages(websocket), self._listen_for_injections(websocket),
+                 self._stream_user_audio(websocket), self._watch_idle(websocket)]
+        if self.connections.warm_standby:
+            coros.append(self._maintain_standby())
+        tasks = [asyncio.create_task(c) for c in coros]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.user_can_speak.clear()
+            # Una richiesta rimasta in attesa di risposta non deve bloccare la sessione successiva.
+            if self.request_lock.locked(): self.request_lock.release()
+
     async def start(self):
         logger.info("🚀 Avvio del ConversationalAgent...")
+        # sounddevice (e l'inizializzazione di PortAudio) si carica in un thread: intanto il
+        # loop prosegue con le altre inizializzazioni avviate da main.
+        await startup_timing.import_in_thread("sounddevice")
+        self.audio_output.start()
+        self.capture_bus.start()
         await self.hotword_detected_event.wait()
         logger.info("Hotword rilevata dall'agente. Avvio ciclo di conversazione.")
 
         is_first_run = True
-        while not self.stop_event.is_set():
-            self.restart_event.clear()
-            if is_first_run:
-                from intro_lines import get_random_intro
-                await self.speak(get_random_intro())
-                is_first_run = False
-            try:
-                ws_url = await self._get_signed_websocket_url()
-                async with websockets.connect(ws_url, open_timeout=20, max_size=None) as websocket:
-                    init_msg = {"type": "conversation_initiation_client_data", "conversation_config_override": {"tts": {"output_format": "pcm_16000"}}}
-                    await websocket.send(json.dumps(init_msg))
-                    tasks = [self._handle_agent_messages(websocket), self._listen_for_injections(websocket), self._stream_user_audio(websocket)]
-                    await asyncio.gather(*tasks)
-            except Exception as e:
-                logger.error(f"Errore nel ciclo principale: {e}", exc_info=True)
-                await asyncio.sleep(5)
-
-            if self.restart_event.is_set():
-                logger.info("Riavvio della connessione richiesto...")
-                continue
+        lost_at = None
+        self.connections.prefetch()
+        startup_timing.mark("agente avviato")
+        try:
+            while not self.stop_event.is_set():
+                self.restart_event.clear()
+                if self._session_idle:
+                    self._session_idle = False
+                    lost_at = None
+                    await self.connections.release_standby()
+                    self.hotword_detected_event.clear()
+                    await self._wait_for_wakeup()
+                    if self.stop_event.is_set():
+                        break
+                    logger.info("🗣️ Riapertura della sessione di conversazione.")
+                if is_first_run:
+                    from intro_lines import get_random_intro
+                    await self.speak(get_random_intro())
+                    is_first_run = False
+
+                session_started = None
+                try:
+                    websocket = await self.connections.connect()
+                    try:
+                        init_msg = {"type": "conversation_initiation_client_data", "conversation_config_override": {"tts": {"output_format": "pcm_16000"}}}
+                        await websocket.send(json.dumps(init_msg))
+                        session_started = time.monotonic()
+                        startup_timing.mark("prima connessione all'agente")
+                        if lost_at is not None:
+                            self.connections.record_reconnect(session_started - lost_at)
+                        await self._run_session(websocket)
+                    finally:
+                        await websocket.close()
+                except Exception as e:
+                    logger.error(f"Errore nel ciclo principale: {e}", exc_info=True)
+
+                if self.stop_event.is_set() or self._session_idle:
+                    continue
+                if lost_at is None or session_started is not None:
+                    lost_at = time.monotonic()
+                if self.restart_event.is_set():
+                    logger.info("Riavvio della connessione richiesto...")
+                    continue
+                # Sessione caduta: riconnessione immediata se era stabile, altrimenti backoff con jitter.
+                if session_started is not None and time.monotonic() - session_started >= _STABLE_SESSION_S:
+                    self.reconnect_backoff.reset()
+                    continue
+                delay = self.reconnect_backoff.next_delay()
+                logger.info(f"Nuovo tentativo di connessione tra {delay:.1f}s (tentativo {self.reconnect_backoff.attempt}).")
+                await asyncio.sleep(delay)
+        finally:
+            logger.info(f"Statistiche connessioni ElevenLabs: {self.connections.stats()}")
+            logger.info(f"Statistiche tool: {self.tools.stats()}")
+            await self.connections.aclose()
@@ -2,49 +2,73 @@
 import asyncio
 import logging
 from typing import Optional
-import spotipy
 
-from tools.spotify_tools.auth import _update_active_device
+from tools.spotify_tools.async_client import AsyncSpotify
+from tools.spotify_tools.auth import ensure_active_device
+from tools.spotify_tools.playback_state import PlaybackSnapshot, PlaybackStateService
+from tools.spotify_tools.rate_limit import background_requests, is_rate_limited, retry_after_s
 
 logger = logging.getLogger("jukebox")
 
+# Parametri della modalità "deadline": invece di interrogare Spotify ogni 2 secondi,
+# si dorme fino a poco prima della fine prevista del brano (con qualche controllo
+# intermedio per accorgersi di skip e pause) e si conferma la fine con pochi
+# controlli ravvicinati.
+DEADLINE_CHECKPOINT_S = 45.0    # distanza massima tra due controlli durante il brano
+DEADLINE_LEAD_MS = 1200         # anticipo sulla fine prevista con cui inizia la raffica
+DEADLINE_BURST_INTERVAL_S = 0.3 # intervallo tra i controlli della raffica finale
+DEADLINE_END_TOLERANCE_MS = 400 # sotto questo tempo residuo il brano è considerato finito
+DEADLINE_PAUSED_RECHECK_S = 5.0 # ricontrollo quando la riproduzione è in pausa
+_LOCAL_WAKE_S = 0.5             # granularità dei controlli locali (senza rete) durante l'attesa
+
 class Jukebox:
-    def __init__(self, injection_queue: asyncio.Queue, spotify_polling_queue: asyncio.Queue, sp_client: spotipy.Spotify, spotify_playback_event: asyncio.Event):
+    def __init__(self, injection_queue: asyncio.Queue, spotify_polling_queue: asyncio.Queue, sp_client: AsyncSpotify, spotify_playback_event: asyncio.Event,
+                 monitor_mode: str = "deadline", playback_state: Optional[PlaybackStateService] = None):
         self.injection_queue = injection_queue
         self.spotify_polling_queue = spotify_polling_queue
         self.sp = sp_client
+        # Lo stato di riproduzione è condiviso con i tool: le letture concorrenti
+        # diventano una sola chiamata e i tool possono riusare lo snapshot del Jukebox.
+        self.playback_state = playback_state or PlaybackStateService(sp_client)
         self.current_playing_uri: Optional[str] = None
         self.stop_event = asyncio.Event()
         self.spotify_playback_event = spotify_playback_event
+        # "deadline" (default) oppure "polling" per il vecchio controllo ogni 2 secondi.
+        self.monitor_mode = monitor_mode
 
     async def monitor_playback(self):
         logger.info("🎶 Jukebox avviato e in attesa di un URI sulla coda...")
-        while not self.stop_event.is_set():
-            try:
-                uri_to_monitor = await self.spotify_polling_queue.get()
-                self.current_playing_uri = uri_to_monitor
+        # Il monitoraggio è traffico di background: cede il budget Spotify ai comandi dell'utente.
+        with background_requests():
+            while not self.stop_event.is_set():
+                try:
+                    uri_to_monitor = await self.spotify_polling_queue.get()
+                    self.current_playing_uri = uri_to_monitor
                 
-                logger.info(f"▶️ Nuovo URI ricevuto: {uri_to_monitor}. Inizio monitoraggio.")
+                    logger.info(f"▶️ Nuovo URI ricevuto: {uri_to_monitor}. Inizio monitoraggio.")
                 
-                song_ended_naturally = await self._monitor_specific_uri(uri_to_monitor)
-
-                if song_ended_naturally:
-                    logger.info(f"Brano {uri_to_monitor} terminato. Invio notifica.")
-                    await self.injection_queue.put({
-                        "type": "jukebox_notification",
-                        "text": "La canzone che stavi ascoltando è finita."
-                    })
+                    if self.monitor_mode == "polling":
+                        song_ended_naturally = await self._monitor_specific_uri(uri_to_monitor)
+                    else:
+                        song_ended_naturally = await self._monitor_specific_uri_deadline(uri_to_monitor)
+
+                    if song_ended_naturally:
+                        logger.info(f"Brano {uri_to_monitor} terminato. Invio notifica.")
+                        await self.injection_queue.put({
+                            "type": "jukebox_notification",
+                            "text": "La canzone che stavi ascoltando è finita."
+                        })
                 
-                self.current_playing_uri = None
-                logger.info("🎶 Monitoraggio traccia terminato. Jukebox torna in attesa di un nuovo URI.")
+                    self.current_playing_uri = None
+                    logger.info("🎶 Monitoraggio traccia terminato. Jukebox torna in attesa di un nuovo URI.")
 
-            except asyncio.CancelledError:
-                logger.info("Task Jukebox cancellato.")
-                break
-            except Exception as e:
-                logger.error(f"❌ Errore critico nel ciclo principale del Jukebox: {e}", exc_info=True)
-                self.current_playing_uri = None
-                await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    logger.info("Task Jukebox cancellato.")
+                    break
+                except Exception as e:
+                    logger.error(f"❌ Errore critico nel ciclo principale del Jukebox: {e}", exc_info=True)
+                    self.current_playing_uri = None
+                    await asyncio.sleep(5)
 
     async def _monitor_specific_uri(self, uri_to_monitor: str) -> bool:
         """Monitora un URI. Ritorna True se la canzone finisce naturalmente, False altrimenti."""
@@ -54,11 +78,11 @@ class Jukebox:
                     logger.warning("Evento di playback disattivato, il monitoraggio viene interrotto.")
                     return False
 
-                if not _update_active_device():
+                if not await ensure_active_device():
                     await asyncio.sleep(5)
                     continue
 
-                playback_info = self.sp.current_playback()
+                playback_info = (await self.playback_state.get(max_age_s=0)).data
                 
                 if not playback_info or not playback_info.get('item') or playback_info['item']['uri'] != uri_to_monitor:
                     return True
@@ -74,11 +98,131 @@ class Jukebox:
                 
                 await asyncio.sleep(2)
             except Exception as e:
+                if is_rate_limited(e):
+                    # Un 429 non è un errore del brano: si riprende dopo il Retry-After.
+                    wait_s = retry_after_s(e, default=5.0)
+                    logger.warning(f"Spotify limita le richieste: monitoraggio di {uri_to_monitor} ripreso tra {wait_s:.0f}s.")
+                    await asyncio.sleep(wait_s)
+                    continue
                 logger.error(f"Errore durante il monitoraggio dell'URI {uri_to_monitor}: {e}")
                 await asyncio.sleep(10)
                 return False
         return False
 
+    async def _wait_while_monitoring(self, uri_to_monitor: str, seconds: float,
+                                     changes: Optional[asyncio.Queue] = None) -> bool:
+        """
+        Attende `seconds` secondi controllando solo lo stato locale (nessuna chiamata
+        di rete). Ritorna False se il monitoraggio va interrotto: stop, evento di
+        playback disattivato o un nuovo URI arrivato sulla coda.
+
+        Con `changes` (coda di `PlaybackStateService.subscribe`) l'attesa finisce in
+        anticipo, con True, quando una lettura fatta da altri (tool, conferme di
+        riproduzione) segnala un cambio di brano o di `is_playing`.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + seconds
+        while True:
+            if self.stop_event.is_set() or self.current_playing_uri != uri_to_monitor:
+                return False
+            if not self.spotify_playback_event.is_set():
+                logger.warning("Evento di playback disattivato, il monitoraggio viene interrotto.")
+                return False
+            if not self.spotify_polling_queue.empty():
+                logger.info(f"Nuovo URI in coda: il monitoraggio di {uri_to_monitor} viene sostituito.")
+                return False
+            remaining_s = deadline - loop.time()
+            if remaining_s <= 0:
+                return True
+            if changes is None:
+                await asyncio.sleep(min(remaining_s, _LOCAL_WAKE_S))
+                continue
+            try:
+                previous, current = await asyncio.wait_for(changes.get(), min(remaining_s, _LOCAL_WAKE_S))
+            except asyncio.TimeoutError:
+                continue
+            logger.info(f"Stato di riproduzione cambiato ({previous.uri if previous else None} → {current.uri}, "
+                        f"in riproduzione: {current.is_playing}): nuovo controllo anticipato.")
+            return True
+
+    async def _monitor_specific_uri_deadline(self, uri_to_monitor: str) -> bool:
+        """
+        Come `_monitor_specific_uri`, ma pianifica i controlli a partire da
+        `duration_ms` e `progress_ms`: pochi controlli sparsi durante il brano e una
+        breve raffica vicino alla fine. Ritorna True se la canzone finisce naturalmente.
+
+        Con un solo URI, a fine brano Spotify resta sullo stesso URI ma non in
+        riproduzione: lo stop è considerato una fine (e non una pausa) se il progresso
+        è arrivato alla durata, se è tornato a zero durante la raffica finale o se la
+        fine prevista è già passata quando lo stop viene visto per la prima volta.
+        """
+        loop = asyncio.get_running_loop()
+        api_calls = 0
+        sleep_s = 0.0
+        predicted_end: Optional[float] = None  # loop.time() della fine prevista, finché il brano suona
+        in_burst = False
+        # Le letture degli altri (tool, conferme) svegliano l'attesa quando cambiano brano o pausa.
+        changes = self.playback_state.subscribe()
+        try:
+            while await self._wait_while_monitoring(uri_to_monitor, sleep_s, changes):
+                if not await ensure_active_device():
+                    sleep_s = 5
+                    continue
+
+                fetches_before = self.playback_state.fetch_count
+                try:
+                    playback = await self.playback_state.get(max_age_s=DEADLINE_BURST_INTERVAL_S / 2)
+                except Exception as e:
+                    if not is_rate_limited(e):
+                        raise
+                    # Un 429 non è un errore del brano: si riprende dopo il Retry-After.
+                    sleep_s = retry_after_s(e, default=5.0)
+                    logger.warning(f"Spotify limita le richieste: monitoraggio di {uri_to_monitor} ripreso tra {sleep_s:.0f}s.")
+                    continue
+                finally:
+                    api_calls += self.playback_state.fetch_count - fetches_before
+                    # Le notifiche arrivate fin qui sono già comprese in questa lettura.
+                    while not changes.empty():
+                        changes.get_nowait()
+
+                if playback.uri != uri_to_monitor:
+                    return True
+
+                if not playback.is_playing:
+                    if self._stopped_at_end(playback, in_burst, predicted_end, loop.time()):
+                        return True
+                    # Pausa vera: la fine prevista non vale più, si ricalcola alla ripresa.
+                    predicted_end, in_burst = None, False
+                    sleep_s = DEADLINE_PAUSED_RECHECK_S
+                    continue
+
+                remaining_ms = playback.duration_ms - playback.progress_ms
+                if remaining_ms <= DEADLINE_END_TOLERANCE_MS:
+                    return True
+                predicted_end = loop.time() + remaining_ms / 1000
+                in_burst = remaining_ms <= DEADLINE_LEAD_MS
+                if in_burst:
+                    sleep_s = min(DEADLINE_BURST_INTERVAL_S, remaining_ms / 1000)
+                else:
+                    sleep_s = min(DEADLINE_CHECKPOINT_S, (remaining_ms - DEADLINE_LEAD_MS) / 1000)
+            return False
+        except Exception as e:
+            logger.error(f"Errore durante il monitoraggio dell'URI {uri_to_monitor}: {e}")
+            await asyncio.sleep(10)
+            return False
+        finally:
+            self.playback_state.unsubscribe(changes)
+            logger.info(f"Monitoraggio di {uri_to_monitor}: {api_calls} chiamate a current_playback.")
+
+    @staticmethod
+    def _stopped_at_end(playback: PlaybackSnapshot, in_burst: bool, predicted_end: Optional[float], now: float) -> bool:
+        """True se un brano non in riproduzione sull'URI monitorato è arrivato alla fine."""
+        if playback.duration_ms and playback.progress_ms >= playback.duration_ms - DEADLINE_END_TOLERANCE_MS:
+            return True
+        if in_burst and playback.progress_ms == 0:
+            return True
+        return predicted_end is not None and now >= predicted_end
+
     def stop(self):
         self.stop_event.set()
         logger.info("Jukebox: segnale di stop ricevuto.")
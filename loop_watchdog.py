@@ -0,0 +1,200 @@
+# loop_watchdog.py
+import asyncio
+import collections
+import logging
+import math
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger("LoopWatchdog")
+
+_PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+_THIS_FILE = os.path.abspath(__file__)
+
+_LAG = metrics.histogram("event_loop_lag_seconds", "Ritardo di pianificazione dell'event loop",
+                         buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+_STALLS = metrics.counter("event_loop_stalls_total", "Blocchi dell'event loop oltre la soglia", ("site",))
+_BLOCKED = metrics.counter("event_loop_blocked_seconds_total", "Tempo di event loop bloccato", ("site",))
+
+UNKNOWN_SITE = "sconosciuto"
+
+
+def _is_project_file(filename: str) -> bool:
+    path = os.path.abspath(filename)
+    return (path.startswith(_PROJECT_ROOT + os.sep) and path != _THIS_FILE
+            and "site-packages" not in path and "dist-packages" not in path)
+
+
+def _describe(frame) -> Tuple[str, str, List[str]]:
+    """(punto del progetto, chiamata più interna, ultime righe dello stack) per il frame del loop."""
+    stack = traceback.extract_stack(frame)
+    leaf = stack[-1]
+    index = next((i for i in range(len(stack) - 1, -1, -1) if _is_project_file(stack[i].filename)), None)
+    if index is None:
+        site_name, frames = UNKNOWN_SITE, stack[-8:]
+    else:
+        site = stack[index]
+        site_name = f"{os.path.relpath(site.filename, _PROJECT_ROOT)}:{site.lineno} {site.name}"
+        # Dal punto del progetto in giù: il chiamante, l'inizio e la fine della libreria.
+        frames = stack[max(0, index - 1):]
+        if len(frames) > 10:
+            frames = frames[:4] + frames[-6:]
+    leaf_name = f"{os.path.basename(leaf.filename)}:{leaf.lineno} {leaf.name}"
+    return site_name, leaf_name, traceback.format_list(frames)
+
+
+class _Site:
+    __slots__ = ("stalls", "blocked_s", "max_s", "leaf", "stack", "last_at")
+
+    def __init__(self):
+        self.stalls = 0
+        self.blocked_s = 0.0
+        self.max_s = 0.0
+        self.leaf = ""
+        self.stack: List[str] = []
+        self.last_at = 0.0
+
+
+class LoopWatchdog:
+    """
+    Sorveglia il ritardo dell'event loop e individua le chiamate che lo bloccano.
+
+    Un battito nel loop si ripianifica ogni `interval_s` e misura di quanto arriva in
+    ritardo. Un thread di guardia controlla il battito: se manca da più di `threshold_s`
+    il loop è bloccato, e il thread campiona lo stack del thread del loop
+    (`sys._current_frames`) finché il blocco dura. Alla ripresa, il blocco viene
+    attribuito al punto del progetto campionato più spesso, con conteggi e tempo totale
+    per punto (log, `stats()` e metriche `event_loop_*`).
+    """
+
+    def __init__(self, threshold_s: float = 0.1, interval_s: float = 0.05, report_interval_s: float = 300.0):
+        self.threshold_s = threshold_s
+        self.interval_s = interval_s
+        self.report_interval_s = report_interval_s
+        self._check_interval_s = max(0.005, threshold_s / 4)
+        self._loop_thread_id: Optional[int] = None
+        # (numero del battito, istante atteso): una sola assegnazione, letta dal thread di guardia.
+        self._beat: Tuple[int, float] = (0, 0.0)
+        self._samples: Dict[int, List[Tuple[str, str, List[str]]]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._sites: Dict[str, _Site] = {}
+        self.ticks = 0
+        self.stalls = 0
+        self.blocked_s = 0.0
+        self.max_lag_s = 0.0
+
+    async def run(self):
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="LoopWatchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"🩺 Watchdog dell'event loop attivo (soglia {self.threshold_s * 1000:.0f} ms).")
+        next_report = time.monotonic() + self.report_interval_s
+        seq = 0
+        try:
+            while True:
+                expected = time.perf_counter() + self.interval_s
+                self._beat = (seq, expected)
+                await asyncio.sleep(self.interval_s)
+                lag = max(0.0, time.perf_counter() - expected)
+                self._beat = (seq, math.inf)  # il loop è ripartito: niente più campioni per questo battito
+                self.ticks += 1
+                _LAG.observe(lag)
+                if lag > self.max_lag_s:
+                    self.max_lag_s = lag
+                samples = self._samples.pop(seq, None)
+                self._samples.clear()
+                if lag >= self.threshold_s:
+                    self._record_stall(lag, samples)
+                seq += 1
+                if self.report_interval_s and time.monotonic() >= next_report:
+                    next_report = time.monotonic() + self.report_interval_s
+                    if self.stalls:
+                        self.log_report()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self._check_interval_s):
+            seq, expected = self._beat
+            if time.perf_counter() - expected < self.threshold_s:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            try:
+                sample = _describe(frame)
+            finally:
+                del frame
+            self._samples.setdefault(seq, []).append(sample)
+
+    def _record_stall(self, lag: float, samples: Optional[List[Tuple[str, str, List[str]]]]):
+        if samples:
+            site_name = collections.Counter(s[0] for s in samples).most_common(1)[0][0]
+            _, leaf, stack = next(s for s in samples if s[0] == site_name)
+        else:
+            # Blocco finito prima del campionamento (o loop bloccato con il GIL tenuto).
+            site_name, leaf, stack = UNKNOWN_SITE, "", []
+        site = self._sites.get(site_name)
+        first_time = site is None
+        if first_time:
+            site = self._sites[site_name] = _Site()
+        site.stalls += 1
+        site.blocked_s += lag
+        site.max_s = max(site.max_s, lag)
+        site.leaf, site.stack, site.last_at = leaf, stack or site.stack, time.time()
+        self.stalls += 1
+        self.blocked_s += lag
+        _STALLS.inc(site=site_name)
+        _BLOCKED.inc(lag, site=site_name)
+        if first_time:
+            logger.warning(f"⚠️ Event loop bloccato per {lag * 1000:.0f} ms da {site_name} ({leaf}). "
+                           f"Stack:\n{''.join(stack)}")
+        else:
+            logger.warning(f"⚠️ Event loop bloccato per {lag * 1000:.0f} ms da {site_name} ({site.stalls}ª volta).")
+
+    def top_sites(self, n: int = 10) -> List[Dict[str, Any]]:
+        """Punti del progetto che hanno bloccato il loop, ordinati per tempo totale."""
+        ranked = sorted(self._sites.items(), key=lambda item: item[1].blocked_s, reverse=True)[:n]
+        return [{"site": name, "stalls": s.stalls, "blocked_ms": round(s.blocked_s * 1000), "max_ms": round(s.max_s * 1000),
+                 "leaf": s.leaf, "stack": s.stack} for name, s in ranked]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ticks": self.ticks,
+            "stalls": self.stalls,
+            "blocked_ms": round(self.blocked_s * 1000),
+            "max_lag_ms": round(self.max_lag_s * 1000),
+            "sites": {s["site"]: {k: s[k] for k in ("stalls", "blocked_ms", "max_ms", "leaf")} for s in self.top_sites()},
+        }
+
+    def log_report(self):
+        lines = [f"  {s['site']:<60} {s['stalls']:>4} blocchi, {s['blocked_ms']:>6} ms (max {s['max_ms']} ms) ← {s['leaf']}"
+                 for s in self.top_sites()]
+        logger.info(f"🩺 Blocchi dell'event loop: {self.stalls}, {self.blocked_s * 1000:.0f} ms in totale.\n" + "\n".join(lines))
+
+
+_watchdog: Optional[LoopWatchdog] = None
+
+
+def initialize_loop_watchdog(threshold_s: float = 0.1, interval_s: float = 0.05, report_interval_s: float = 300.0) -> LoopWatchdog:
+    global _watchdog
+    _watchdog = LoopWatchdog(threshold_s, interval_s, report_interval_s)
+    return _watchdog
+
+
+def get_loop_watchdog() -> Optional[LoopWatchdog]:
+    return _watchdog
@@ -1,4 +1,5 @@
 # main.py (VERSIONE CON MUSICA FISSA AL 60%)
+import startup_timing  # per primo: è il riferimento dei tempi di avvio
 import asyncio
 import logging
 import os
@@ -11,52 +12,152 @@ from jukebox import Jukebox
 from tools import spotify_tools
 import spotify_config
 from background_music_manager import BackgroundMusicManager # RE-INSERITO
+from audio_capture import CaptureBus
+from toggle_event import ToggleEvent
 import config
+import metrics
+import loop_watchdog
+
+startup_timing.mark("moduli importati")
 
 def setup_logging():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)-25s - %(levelname)-8s - %(message)s')
 
+def create_hotword_detector(hotword_event: asyncio.Event, capture_bus: CaptureBus):
+    """Porcupine (import e caricamento del modello) viene preparato in un thread, durante l'avvio."""
+    if not config.PORCUPINE_ACCESS_KEY:
+        return None
+    from tools.hotword.porcupine_hotword import PorcupineHotwordDetector
+    detector = PorcupineHotwordDetector(config.PORCUPINE_ACCESS_KEY, config.PORCUPINE_MODEL_PATH, config.PORCUPINE_KEYWORD_PATH, hotword_event, capture_bus)
+    return detector if detector.available else None
+
+def register_audio_metrics(agent: ConversationalAgent, capture_bus: CaptureBus):
+    """Le perdite audio sono contate nei thread PortAudio: vengono lette solo all'esportazione."""
+    metrics.register_callback("audio_output_dropped_seconds_total", "Audio dell'agente scartato per buffer pieno",
+                              lambda: agent.audio_output.stats()["dropped_s"], type="counter")
+    metrics.register_callback("audio_output_underruns_total", "Interruzioni dell'audio dell'agente per buffer vuoto",
+                              lambda: agent.audio_output.underruns, type="counter")
+    metrics.register_callback("audio_capture_input_overflows_total", "Overflow dello stream del microfono",
+                              lambda: capture_bus.input_overflows, type="counter")
+    metrics.register_callback("audio_capture_overrun_ms_total", "Audio del microfono perso da un consumatore in ritardo",
+                              lambda: {name: c["overrun_ms"] for name, c in capture_bus.stats()["consumers"].items()},
+                              label="consumer", type="counter")
+
 async def main():
     logger = logging.getLogger("MAIN")
     logger.info("🚀 Avvio dell'Assistente Capitano con musica di sottofondo fissa... 🚀")
 
-    # Inizializzazione
-    spotify_tools.initialize_spotify(client_id=spotify_config.SPOTIPY_CLIENT_ID, client_secret=spotify_config.SPOTIPY_CLIENT_SECRET, redirect_uri=spotify_config.SPOTIPY_REDIRECT_URI, scope=spotify_config.SCOPE, cache_path=spotify_config.CACHE_PATH)
-    spotify_tools.initialize_openai_client(os.getenv("OPENAI_API_KEY"))
-    sp_client_instance = spotify_tools.get_spotify_client()
-
     # Creiamo gli eventi necessari
     hotword_event = asyncio.Event()
-    playback_event = asyncio.Event()
+    playback_event = ToggleEvent()  # il manager musicale attende sia l'avvio sia la fine di Spotify
     injection_q = asyncio.Queue()
     polling_q = asyncio.Queue()
 
     # Attivazione immediata per partire subito
     hotword_event.set()
 
-    # Creiamo gli oggetti principali, incluso il manager musicale
-    agent = ConversationalAgent(injection_q, polling_q, hotword_event, playback_event)
-    jukebox = Jukebox(injection_q, polling_q, sp_client_instance, playback_event)
-    music_path = getattr(config, 'BACKGROUND_MUSIC_PATH', "/home/omar/TRACCIASOTTOFONDO.mp3")
-    background_manager = BackgroundMusicManager(track_path=music_path, spotify_playback_event=playback_event, hotword_detected_event=hotword_event, user_can_speak_event=agent.user_can_speak)
+    # Il watchdog parte per primo, così copre anche l'inizializzazione dei servizi
+    watchdog = None
+    watchdog_task = None
+    if config.LOOP_WATCHDOG_THRESHOLD_MS > 0:
+        watchdog = loop_watchdog.initialize_loop_watchdog(config.LOOP_WATCHDOG_THRESHOLD_MS / 1000, report_interval_s=config.LOOP_WATCHDOG_REPORT_INTERVAL_S)
+        watchdog_task = asyncio.create_task(watchdog.run())
 
+    # Tutto ciò che viene creato da qui in poi va fermato anche se l'inizializzazione fallisce
+    capture_bus = agent = agent_task = None
+    search_cache = sp_client_instance = device_registry = token_manager = library_mirror = None
+    hotword_detector = jukebox = background_manager = None
     try:
+        # Un solo stream dal microfono, condiviso da tutti i moduli che ascoltano
+        capture_bus = CaptureBus(samplerate=16000)
+
+        # L'agente non dipende da Spotify: parte subito, così l'introduzione del Capitano
+        # (signed URL, connessione, primo audio) si sovrappone al resto dell'inizializzazione.
+        agent = ConversationalAgent(injection_q, polling_q, hotword_event, playback_event, capture_bus=capture_bus)
+        agent_task = asyncio.create_task(agent.start())
+        register_audio_metrics(agent, capture_bus)
+
+        # Inizializzazione concorrente: Spotify (auth + profilo + dispositivi), OpenAI, correttore
+        # fonetico e hotword. Le parti bloccanti e gli import pesanti girano in thread.
+        search_cache = spotify_tools.initialize_search_cache(spotify_config.SEARCH_CACHE_PATH, spotify_config.SEARCH_CACHE_TTL_S, spotify_config.SEARCH_CACHE_MAX_ENTRIES)
+        spotify_tools.configure_track_scorer(spotify_config.TRACK_SCORING_WEIGHTS)
+        with startup_timing.phase("inizializzazione servizi"):
+            _, _, _, hotword_detector = await asyncio.gather(
+                startup_timing.timed("auth Spotify", spotify_tools.initialize_spotify(client_id=spotify_config.SPOTIPY_CLIENT_ID, client_secret=spotify_config.SPOTIPY_CLIENT_SECRET, redirect_uri=spotify_config.SPOTIPY_REDIRECT_URI, scope=spotify_config.SCOPE, cache_path=spotify_config.CACHE_PATH, device_ttl_s=spotify_config.DEVICE_REGISTRY_TTL_S, playback_freshness_s=spotify_config.PLAYBACK_STATE_FRESHNESS_S, token_refresh_margin_s=spotify_config.SPOTIFY_TOKEN_REFRESH_MARGIN_S, playback_confirm_timeout_s=spotify_config.PLAYBACK_CONFIRM_TIMEOUT_S, rate_limit_per_s=spotify_config.SPOTIFY_RATE_LIMIT_PER_S, rate_limit_burst=spotify_config.SPOTIFY_RATE_LIMIT_BURST, api_base_url=spotify_config.SPOTIFY_API_BASE_URL)),
+                startup_timing.timed("client OpenAI", asyncio.to_thread(spotify_tools.initialize_openai_client, os.getenv("OPENAI_API_KEY"))),
+                startup_timing.timed("correttore fonetico", asyncio.to_thread(spotify_tools.initialize_phonetic_corrector, extra_tracks=search_cache.iter_cached_tracks() if search_cache else ())),
+                startup_timing.timed("hotword Porcupine", asyncio.to_thread(create_hotword_detector, hotword_event, capture_bus)),
+            )
+        sp_client_instance = spotify_tools.get_spotify_client()
+        device_registry = spotify_tools.get_device_registry()
+        token_manager = spotify_tools.get_token_manager()
+        if sp_client_instance:
+            library_mirror = spotify_tools.initialize_library_mirror(sp_client_instance, spotify_config.LIBRARY_MIRROR_PATH, spotify_config.LIBRARY_SYNC_INTERVAL_S, include_saved_tracks="user-library-read" in spotify_config.SCOPE)
+
+        # La hotword riapre la sessione dopo che è stata chiusa per inattività
+        if hotword_detector:
+            agent.idle_timeout_s = config.SESSION_IDLE_TIMEOUT_S
+        else:
+            logger.warning("Hotword non disponibile: la sessione di conversazione resterà sempre aperta.")
+
+        # Creiamo gli altri oggetti principali, incluso il manager musicale
+        jukebox = Jukebox(injection_q, polling_q, sp_client_instance, playback_event, monitor_mode=config.JUKEBOX_MONITOR_MODE, playback_state=spotify_tools.get_playback_state_service())
+        music_path = getattr(config, 'BACKGROUND_MUSIC_PATH', "/home/omar/TRACCIASOTTOFONDO.mp3")
+        if config.BACKGROUND_MUSIC_MODE == "mixer":
+            from background_music_mixer import BackgroundMusicMixer
+            background_manager = BackgroundMusicMixer(track_path=music_path, spotify_playback_event=playback_event, hotword_detected_event=hotword_event, user_can_speak_event=agent.user_can_speak, volume_percent=config.BACKGROUND_MUSIC_VOLUME_PERCENT, duck_percent=config.BACKGROUND_MUSIC_DUCK_PERCENT, duck_ms=config.BACKGROUND_MUSIC_DUCK_MS, fade_ms=config.BACKGROUND_MUSIC_FADE_MS, agent_speaking=lambda: agent.audio_output.is_playing)
+        else:
+            background_manager = BackgroundMusicManager(track_path=music_path, spotify_playback_event=playback_event, hotword_detected_event=hotword_event, user_can_speak_event=agent.user_can_speak, volume_percent=config.BACKGROUND_MUSIC_VOLUME_PERCENT)
+
         # Avviamo tutti i moduli in parallelo
         logger.info("Avvio dei moduli di conversazione, jukebox e musica di sottofondo...")
         main_tasks = asyncio.gather(
-            agent.start(),
+            agent_task,
             jukebox.monitor_playback(),
-            background_manager.start()
+            background_manager.start(),
+            *([hotword_detector.run()] if hotword_detector else []),
+            *([token_manager.run()] if token_manager else []),
+            *([device_registry.run()] if device_registry else []),
+            *([library_mirror.run()] if library_mirror else []),
+            *([watchdog_task] if watchdog_task else []),
+            *([metrics.serve(config.METRICS_HOST, config.METRICS_PORT, config.METRICS_JSON_PATH or None, config.METRICS_JSON_INTERVAL_S)]
+              if config.METRICS_PORT or config.METRICS_JSON_PATH else [])
         )
         await main_tasks
 
     except KeyboardInterrupt:
         logger.info("🔌 Interruzione manuale ricevuta.")
     finally:
-        # Assicuriamoci di fermare tutti i componenti
-        agent.stop()
-        jukebox.stop()
-        background_manager.stop()
+        # Assicuriamoci di fermare tutti i componenti (anche solo in parte creati)
+        if agent:
+            agent.stop()
+        if jukebox:
+            jukebox.stop()
+        if background_manager:
+            background_manager.stop()
+        if hotword_detector:
+            hotword_detector.stop()
+        if capture_bus:
+            capture_bus.close()
+        if token_manager:
+            token_manager.stop()
+            logger.info(f"Statistiche token Spotify: {token_manager.stats()}")
+        if device_registry:
+            device_registry.stop()
+        if library_mirror:
+            library_mirror.stop()
+            logger.info(f"Statistiche mirror libreria: {library_mirror.stats()}")
+        if search_cache:
+            search_cache.close()
+            logger.info(f"Statistiche cache ricerche: {search_cache.stats()}")
+        if sp_client_instance:
+            logger.info(f"Statistiche budget Spotify: {sp_client_instance.rate_limiter.stats()}")
+        pending = [t for t in (agent_task, watchdog_task) if t and not t.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if watchdog:
+            watchdog.log_report()
         logger.info("🛑 Tutti i moduli arrestati.")
 
 if __name__ == "__main__":
@@ -0,0 +1,257 @@
+# metrics.py
+import asyncio
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger("Metrics")
+
+# Bucket (secondi) adatti alle latenze della pipeline: da pochi ms a qualche secondo.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Contatore monotono, opzionalmente con etichette."""
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        if not self.labelnames:
+            return [(self.name, "", self._values.get((), 0.0))]
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in self._values.items()]
+
+    def snapshot(self) -> Any:
+        if not self.labelnames:
+            return self._values.get((), 0.0)
+        return {",".join(key): value for key, value in self._values.items()}
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "sum", "count", "max")
+
+    def __init__(self, n_buckets: int):
+        self.counts = [0] * (n_buckets + 1)  # l'ultimo è +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+
+class Histogram:
+    """
+    Istogramma a bucket fissi: `observe` costa una ricerca binaria e tre somme.
+    I quantili dello snapshot JSON sono stimati per interpolazione dentro il bucket.
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], _HistogramSeries] = {}
+
+    def observe(self, value: float, **labels: Any):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _HistogramSeries(len(self.buckets))
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+        if value > series.max:
+            series.max = value
+
+    @contextmanager
+    def time(self, **labels: Any):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _quantile(self, series: _HistogramSeries, q: float) -> float:
+        rank = q * series.count
+        cumulative = 0
+        for i, count in enumerate(series.counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else series.max
+                return min(series.max, lower + (upper - lower) * (rank - cumulative) / count)
+            cumulative += count
+        return series.max
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        out = []
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series.counts):
+                cumulative += count
+                out.append((f"{self.name}_bucket", _format_labels(self.labelnames, key, ("le", repr(bound))), cumulative))
+            out.append((f"{self.name}_bucket", _format_labels(self.labelnames, key, ("le", "+Inf")), series.count))
+            out.append((f"{self.name}_sum", _format_labels(self.labelnames, key), series.sum))
+            out.append((f"{self.name}_count", _format_labels(self.labelnames, key), series.count))
+        return out
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            ",".join(key) or "all": {
+                "count": series.count,
+                "avg_ms": round(series.sum / series.count * 1000, 1),
+                "p50_ms": round(self._quantile(series, 0.5) * 1000, 1),
+                "p95_ms": round(self._quantile(series, 0.95) * 1000, 1),
+                "max_ms": round(series.max * 1000, 1),
+            }
+            for key, series in self._series.items() if series.count
+        }
+
+
+class CallbackGauge:
+    """
+    Valore letto solo al momento dell'esportazione, da una funzione. Serve per i contatori
+    che vivono già nei moduli audio (aggiornati nei thread PortAudio, senza lock aggiuntivi).
+    La funzione può ritornare un numero o un dizionario {valore etichetta: numero}.
+    """
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Union[float, Dict[str, float]]],
+                 label: Optional[str] = None, type: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.label = label
+        self.type = type
+
+    def _read(self) -> Dict[Tuple[str, ...], float]:
+        try:
+            value = self.fn()
+        except Exception as e:
+            logger.debug(f"Lettura della metrica {self.name} fallita: {e}")
+            return {}
+        if isinstance(value, dict):
+            return {(str(k),): float(v) for k, v in value.items()}
+        return {(): float(value)}
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        names = (self.label,) if self.label else ()
+        return [(self.name, _format_labels(names, key), value) for key, value in self._read().items()]
+
+    def snapshot(self) -> Any:
+        values = self._read()
+        return values.get((), 0.0) if not self.label else {k[0]: v for k, v in values.items()}
+
+
+_registry: Dict[str, Any] = {}
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    """Ritorna il contatore `name`, creandolo al primo uso."""
+    if name not in _registry:
+        _registry[name] = Counter(name, help, labelnames)
+    return _registry[name]
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    """Ritorna l'istogramma `name`, creandolo al primo uso."""
+    if name not in _registry:
+        _registry[name] = Histogram(name, help, labelnames, buckets)
+    return _registry[name]
+
+
+def register_callback(name: str, help: str, fn: Callable[[], Union[float, Dict[str, float]]],
+                      label: Optional[str] = None, type: str = "gauge"):
+    _registry[name] = CallbackGauge(name, help, fn, label, type)
+
+
+def render_prometheus() -> str:
+    """Tutte le metriche nel formato testuale di Prometheus (versione 0.0.4)."""
+    lines = []
+    for metric in _registry.values():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> Dict[str, Any]:
+    """Riepilogo leggibile (contatori e quantili stimati), usato anche per il dump JSON."""
+    return {name: metric.snapshot() for name, metric in _registry.items()}
+
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5.0)
+        # Le intestazioni della richiesta non servono: vengono solo consumate.
+        while (await asyncio.wait_for(reader.readline(), timeout=5.0)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        path = parts[1].split("?")[0] if len(parts) > 1 else "/"
+        if path == "/metrics":
+            status, content_type, body = "200 OK", "text/plain; version=0.0.4; charset=utf-8", render_prometheus()
+        elif path == "/metrics.json":
+            status, content_type, body = "200 OK", "application/json", json.dumps(snapshot(), indent=2)
+        else:
+            status, content_type, body = "404 Not Found", "text/plain; charset=utf-8", "not found\n"
+        payload = body.encode("utf-8")
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+                     f"Connection: close\r\n\r\n".encode("latin-1") + payload)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str = "127.0.0.1", port: int = 9464, json_path: Optional[str] = None,
+                json_interval_s: float = 60.0):
+    """
+    Espone `/metrics` (Prometheus) e `/metrics.json` su un server HTTP minimale nel loop
+    principale; con `json_path` scrive anche il riepilogo JSON ogni `json_interval_s` secondi.
+    """
+    server = None
+    if port:
+        server = await asyncio.start_server(_handle_http, host, port)
+        logger.info(f"📈 Metriche disponibili su http://{host}:{port}/metrics")
+    try:
+        while True:
+            await asyncio.sleep(json_interval_s)
+            if json_path:
+                dump_json(json_path)
+    finally:
+        if json_path:
+            dump_json(json_path)
+        if server:
+            server.close()
+
+
+def dump_json(path: str):
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.time(), "metrics": snapshot()}, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Impossibile scrivere le metriche in {path}: {e}")
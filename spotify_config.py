@@ -24,6 +24,9 @@ SPOTIPY_CLIENT_SECRET = os.getenv("SPOTIPY_CLIENT_SECRET")
 # Carica il Redirect URI configurato nella tua dashboard Spotify dal file .env
 SPOTIPY_REDIRECT_URI = os.getenv("SPOTIPY_REDIRECT_URI")
 
+# Indirizzo della Web API (da cambiare solo per i benchmark con server locali).
+SPOTIFY_API_BASE_URL = os.getenv("SPOTIFY_API_BASE_URL", "https://api.spotify.com/v1/")
+
 
 # --- AI-COMMENT: Inizio Sezione Autorizzazioni (Scope) ---
 # La variabile 'SCOPE' definisce quali permessi l'applicazione richiederà
@@ -55,6 +58,70 @@ SCOPE = (
 CACHE_PATH = ".spotipy_cache_loop"
 
 
+# --- AI-COMMENT: Inizio Sezione Cache Ricerche ---
+# I risultati delle ricerche di brani (e la corrispondenza nome artista → ID)
+# vengono salvati in un piccolo database SQLite locale, così le richieste
+# ripetute durante la serata non rifanno le stesse chiamate alla Web API.
+# SEARCH_CACHE_TTL_S è la durata massima di una voce, SEARCH_CACHE_MAX_ENTRIES
+# il numero di voci per tabella oltre il quale si eliminano le meno usate.
+# ---
+
+SEARCH_CACHE_PATH = ".spotify_search_cache.sqlite"
+SEARCH_CACHE_TTL_S = 7 * 24 * 3600
+SEARCH_CACHE_MAX_ENTRIES = 2000
+
+
+# --- AI-COMMENT: Inizio Sezione Registro Dispositivi ---
+# Il dispositivo Spotify scelto viene tenuto in memoria e riletto in background
+# ogni DEVICE_REGISTRY_TTL_S secondi (o subito, se un comando di riproduzione
+# fallisce con "device not found"), invece di interrogare /me/player/devices
+# prima di ogni operazione.
+# ---
+
+DEVICE_REGISTRY_TTL_S = 60
+
+# Le letture dello stato di riproduzione (/me/player) sono condivise tra Jukebox e
+# tool: una lettura più recente di PLAYBACK_STATE_FRESHNESS_S secondi viene riusata
+# senza nuove chiamate alla Web API.
+PLAYBACK_STATE_FRESHNESS_S = 2.0
+
+# Dopo un comando di riproduzione lo stato viene riletto a intervalli crescenti finché
+# il brano risulta in riproduzione, per al massimo PLAYBACK_CONFIRM_TIMEOUT_S secondi.
+PLAYBACK_CONFIRM_TIMEOUT_S = 5.0
+
+# Budget condiviso per tutte le chiamate alla Web API (tool, Jukebox, dispositivi, libreria):
+# SPOTIFY_RATE_LIMIT_PER_S richieste al secondo con picchi fino a SPOTIFY_RATE_LIMIT_BURST.
+# Quando il budget scarseggia i comandi dell'utente hanno la precedenza sul background.
+SPOTIFY_RATE_LIMIT_PER_S = 10.0
+SPOTIFY_RATE_LIMIT_BURST = 20
+
+# L'access token dura un'ora: viene rinnovato in background SPOTIFY_TOKEN_REFRESH_MARGIN_S
+# secondi prima della scadenza, senza riavviare il programma.
+SPOTIFY_TOKEN_REFRESH_MARGIN_S = 300
+
+
+# --- AI-COMMENT: Inizio Sezione Mirror Libreria ---
+# Copia locale delle playlist dell'account (scope playlist-read-private e
+# playlist-read-collaborative), sincronizzata in background ogni
+# LIBRARY_SYNC_INTERVAL_S secondi: i brani già presenti nelle playlist vengono
+# trovati senza ricerca sulla Web API. I brani salvati ("Mi piace") vengono
+# inclusi solo se aggiungi "user-library-read" a SCOPE (richiede un nuovo login).
+# ---
+
+LIBRARY_MIRROR_PATH = ".spotify_library_mirror.json"
+LIBRARY_SYNC_INTERVAL_S = 15 * 60
+
+
+# --- AI-COMMENT: Inizio Sezione Ranking Risultati ---
+# Pesi usati per scegliere la traccia migliore tra i risultati di ricerca.
+# Lascia il dizionario vuoto per i valori di default; le chiavi possibili sono
+# quelle di ScoringWeights in tools/spotify_tools/scoring.py, ad esempio
+# {"popularity": 1.5, "compilation": -50}.
+# ---
+
+TRACK_SCORING_WEIGHTS = {}
+
+
 # --- AI-COMMENT: Sezione Validazione Avvio ---
 # Questa funzione verifica che tutte le credenziali essenziali siano state
 # caricate correttamente. Se una variabile manca, logga un errore e
@@ -0,0 +1,70 @@
+# startup_timing.py
+import asyncio
+import importlib
+import logging
+import sys
+import time
+from types import ModuleType
+from contextlib import contextmanager
+from typing import Any, Awaitable, Dict, List, Tuple
+
+logger = logging.getLogger("StartupTiming")
+
+# Riferimento: il primo import di questo modulo, che main.py esegue per primo.
+_T0 = time.perf_counter()
+_phases: List[Tuple[str, float, float]] = []
+_marks: Dict[str, float] = {}
+_reported = False
+
+
+def elapsed() -> float:
+    return time.perf_counter() - _T0
+
+
+@contextmanager
+def phase(name: str):
+    """Misura una fase dell'avvio (anche se contiene `await`)."""
+    start = elapsed()
+    try:
+        yield
+    finally:
+        _phases.append((name, start, elapsed()))
+
+
+async def timed(name: str, awaitable: Awaitable) -> Any:
+    """Come `phase`, per un awaitable da eseguire in parallelo ad altri (es. in un gather)."""
+    with phase(name):
+        return await awaitable
+
+
+def mark(name: str):
+    """Registra un istante notevole (solo la prima volta)."""
+    _marks.setdefault(name, elapsed())
+
+
+def report() -> str:
+    lines = ["⏱️ Tempi di avvio:"]
+    for name, start, end in sorted(_phases, key=lambda p: p[1]):
+        lines.append(f"  {name:<28} {start:6.2f}s → {end:6.2f}s  ({end - start:5.2f}s)")
+    for name, at in sorted(_marks.items(), key=lambda m: m[1]):
+        lines.append(f"  {name:<28} a {at:6.2f}s")
+    return "\n".join(lines)
+
+
+async def import_in_thread(name: str) -> ModuleType:
+    """
+    Importa un modulo pesante al primo uso in un thread, così l'event loop continua con le
+    altre inizializzazioni (e le richieste di rete in corso) mentre il modulo si carica.
+    """
+    module = sys.modules.get(name)
+    if module is None:
+        with phase(f"import {name}"):
+            module = await asyncio.to_thread(importlib.import_module, name)
+    return module
+
+
+def log_report_once():
+    global _reported
+    if not _reported:
+        _reported = True
+        logger.info(report())
@@ -0,0 +1,29 @@
+# toggle_event.py
+import asyncio
+
+
+class ToggleEvent(asyncio.Event):
+    """
+    `asyncio.Event` che permette di attendere anche la transizione opposta.
+
+    Si usa al posto di un Event normale quando un componente deve reagire sia
+    all'accensione sia allo spegnimento di uno stato (es. Spotify in riproduzione)
+    senza interrogarlo a intervalli regolari.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._cleared = asyncio.Event()
+        self._cleared.set()
+
+    def set(self):
+        super().set()
+        self._cleared.clear()
+
+    def clear(self):
+        super().clear()
+        self._cleared.set()
+
+    async def wait_cleared(self) -> bool:
+        """Attende che l'evento venga (o sia già) spento."""
+        return await self._cleared.wait()
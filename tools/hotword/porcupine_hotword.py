@@ -1,15 +1,21 @@
 import asyncio
+import threading
 import pvporcupine
-import sounddevice as sd
 import numpy as np
 import logging
 
+from audio_capture import CaptureBus
+
 logger = logging.getLogger("HOTWORD")
 
 class PorcupineHotwordDetector:
-    def __init__(self, access_key, model_path, keyword_path, hotword_detected_event):
+    def __init__(self, access_key, model_path, keyword_path, hotword_detected_event, capture_bus: CaptureBus):
         self._porcupine = None
-        self._stream = None
+        # Protegge _porcupine tra il thread audio (process) e stop() (delete).
+        self._porcupine_lock = threading.Lock()
+        self._consumer = None
+        self._loop = None
+        self._capture_bus = capture_bus
         self._hotword_detected_event = hotword_detected_event
         self.running = True
 
@@ -20,45 +26,57 @@ class PorcupineHotwordDetector:
                 access_key=access_key,
                 keyword_paths=[keyword_path]
             )
-            self._stream = sd.RawInputStream(
-                samplerate=self._porcupine.sample_rate,
-                blocksize=self._porcupine.frame_length,
-                dtype="int16",
-                channels=1,
-                callback=self._audio_callback
-            )
+            if capture_bus.samplerate != self._porcupine.sample_rate:
+                raise ValueError(f"Porcupine richiede {self._porcupine.sample_rate} Hz, il bus di cattura è a {capture_bus.samplerate} Hz.")
             logger.info("✅ Porcupine inizializzato correttamente.")
         except Exception as e:
             logger.critical(f"❌ Errore durante l'inizializzazione di Porcupine: {e}")
             self._porcupine = None
 
-    def _audio_callback(self, indata, frames, time, status):
+    def _is_listening(self) -> bool:
         # Non processare l'audio se siamo in arresto o se la hotword è già stata rilevata
-        if not self.running or self._hotword_detected_event.is_set():
-            return
+        return self.running and not self._hotword_detected_event.is_set()
 
-        pcm = np.frombuffer(indata, dtype=np.int16)
-        result = self._porcupine.process(pcm)
+    @property
+    def available(self) -> bool:
+        return self._porcupine is not None
+
+    def _process_frame(self, pcm: np.ndarray):
+        # Eseguito nel thread audio del bus, con frame da `frame_length` campioni (vista, senza copie).
+        with self._porcupine_lock:
+            if self._porcupine is None:
+                return
+            result = self._porcupine.process(pcm)
 
         if result >= 0:
-            logger.info("🗣️ Hotword rilevata!")
-            self._hotword_detected_event.set()
+            # asyncio.Event non è thread-safe: l'evento va impostato dal thread dell'event loop.
+            self._loop.call_soon_threadsafe(logger.info, "🗣️ Hotword rilevata!")
+            self._loop.call_soon_threadsafe(self._hotword_detected_event.set)
 
     async def run(self):
-        if not self._porcupine or not self._stream:
+        if not self._porcupine:
             logger.error("Porcupine non inizializzato, impossibile avviare.")
             return
-            
-        self._stream.start()
-        logger.info("🎙️ Stream audio attivo per Porcupine.")
+
+        self._loop = asyncio.get_running_loop()
+        self._consumer = self._capture_bus.add_consumer(
+            "porcupine", self._porcupine.frame_length, max_lag_ms=200,
+            gate=self._is_listening, on_frame=self._process_frame
+        )
+        self._capture_bus.start()
+        logger.info("🎙️ Porcupine in ascolto sul bus di cattura.")
         while self.running:
             await asyncio.sleep(0.1)
 
     def stop(self):
         self.running = False
-        if self._stream and self._stream.active:
-            self._stream.stop()
-            self._stream.close()
-        if self._porcupine:
-            self._porcupine.delete()
+        if self._consumer:
+            self._capture_bus.remove_consumer(self._consumer)
+            self._consumer = None
+        # Il callback del bus può essere già dentro process() anche dopo remove_consumer:
+        # il modello si libera solo dopo aver preso il lock condiviso con il callback.
+        with self._porcupine_lock:
+            porcupine, self._porcupine = self._porcupine, None
+            if porcupine:
+                porcupine.delete()
         logger.info("🛑 HotwordDetector arrestato.")
@@ -0,0 +1,183 @@
+# tools/registry.py
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+import metrics
+
+logger = logging.getLogger("tools.registry")
+
+_TOOL_SECONDS = metrics.histogram("tool_duration_seconds", "Esecuzione dei tool dell'agente", ("tool", "outcome"))
+_TOOL_COALESCED = metrics.counter("tool_coalesced_total", "Chiamate unite a una identica già in corso", ("tool",))
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """
+    Dichiarazione di un tool invocabile dall'agente.
+
+    - `fire_and_forget`: l'agente riceve subito un esito positivo e il tool prosegue in background.
+    - `timeout_s`: scadenza oltre la quale l'esecuzione viene annullata.
+    - `max_concurrent`: esecuzioni contemporanee ammesse; le altre attendono il loro turno
+      (entro la stessa scadenza).
+    - `exclusive_group`: tra i tool dello stesso gruppo vince l'ultima richiesta, quelle
+      ancora in corso vengono annullate (es. due "metti X" ravvicinati).
+    - `coalesce`: una chiamata identica (stesso tool, stessi parametri) a una ancora in corso
+      ne condivide il risultato invece di ripetere il lavoro.
+    - `starts_playback`: il tool avvia la riproduzione su Spotify.
+    - `context_args`: argomenti forniti dal chiamante (non dall'agente) che il tool accetta.
+    """
+    name: str
+    func: Callable[..., Awaitable[Dict[str, Any]]]
+    fire_and_forget: bool = False
+    timeout_s: float = 15.0
+    max_concurrent: int = 1
+    exclusive_group: Optional[str] = None
+    coalesce: bool = True
+    starts_playback: bool = False
+    context_args: Tuple[str, ...] = ()
+
+
+class _ToolStats:
+    __slots__ = ("calls", "coalesced", "superseded", "timeouts", "errors", "completed", "total_s", "max_s")
+
+    def __init__(self):
+        self.calls = self.coalesced = self.superseded = self.timeouts = self.errors = self.completed = 0
+        self.total_s = self.max_s = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "superseded": self.superseded,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "avg_ms": round(self.total_s / self.completed * 1000) if self.completed else None,
+            "max_ms": round(self.max_s * 1000) if self.completed else None,
+        }
+
+
+class ToolRegistry:
+    """
+    Esecuzione dei tool dell'agente secondo la semantica dichiarata nelle `ToolSpec`.
+
+    Ogni esecuzione è un task tracciato: `call` ne attende l'esito (sempre un dizionario
+    con "status", anche per timeout, annullamento o eccezione), `submit` la lascia in
+    background. `cancel_all` annulla tutto ciò che è ancora in corso.
+    """
+
+    def __init__(self, specs: Iterable[ToolSpec] = ()):
+        self._specs: Dict[str, ToolSpec] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, _ToolStats] = {}
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._groups: Dict[str, Set[asyncio.Task]] = {}
+        self._background: Set[asyncio.Task] = set()
+        for spec in specs:
+            self.register(spec)
+
+    def register(self, spec: ToolSpec):
+        self._specs[spec.name] = spec
+        self._semaphores[spec.name] = asyncio.Semaphore(spec.max_concurrent)
+        self._stats.setdefault(spec.name, _ToolStats())
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        return self._specs.get(name)
+
+    async def _run(self, spec: ToolSpec, kwargs: Dict[str, Any], stats: _ToolStats) -> Dict[str, Any]:
+        async def limited():
+            async with self._semaphores[spec.name]:
+                return await spec.func(**kwargs)
+
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(limited(), timeout=spec.timeout_s)
+        except asyncio.CancelledError:
+            stats.superseded += 1
+            _TOOL_SECONDS.observe(time.perf_counter() - start, tool=spec.name, outcome="superseded")
+            logger.info(f"Tool '{spec.name}' annullato da una richiesta più recente.")
+            return {"status": "error", "message": "Richiesta sostituita da una più recente."}
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            _TOOL_SECONDS.observe(time.perf_counter() - start, tool=spec.name, outcome="timeout")
+            logger.warning(f"⏱️ Tool '{spec.name}' oltre la scadenza di {spec.timeout_s:.0f}s: annullato.")
+            return {"status": "error", "message": f"Il comando '{spec.name}' ha impiegato troppo tempo."}
+        except Exception as e:
+            stats.errors += 1
+            _TOOL_SECONDS.observe(time.perf_counter() - start, tool=spec.name, outcome="exception")
+            logger.error(f"Errore nel tool '{spec.name}': {e}", exc_info=True)
+            return {"status": "error", "message": str(e)}
+        elapsed = time.perf_counter() - start
+        stats.completed += 1
+        stats.total_s += elapsed
+        stats.max_s = max(stats.max_s, elapsed)
+        outcome = "success" if isinstance(result, dict) and result.get("status") == "success" else "error"
+        _TOOL_SECONDS.observe(elapsed, tool=spec.name, outcome=outcome)
+        logger.info(f"Tool '{spec.name}' completato in {elapsed * 1000:.0f} ms.")
+        return result
+
+    def _forget(self, key: Tuple[str, str], group: Optional[str], task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if group:
+            self._groups[group].discard(task)
+
+    async def call(self, name: str, params: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        spec = self._specs.get(name)
+        if spec is None:
+            return {"status": "error", "message": f"Tool '{name}' sconosciuto."}
+        stats = self._stats[name]
+        stats.calls += 1
+
+        key = (name, json.dumps(params, sort_keys=True, default=str))
+        running = self._inflight.get(key)
+        if spec.coalesce and running is not None and not running.done():
+            stats.coalesced += 1
+            _TOOL_COALESCED.inc(tool=name)
+            logger.info(f"Tool '{name}' già in corso con gli stessi parametri: attendo quell'esito.")
+            return await self._wait(running, stats)
+
+        if spec.exclusive_group:
+            for previous in self._groups.setdefault(spec.exclusive_group, set()):
+                previous.cancel()
+
+        kwargs = dict(params)
+        for arg in spec.context_args:
+            if context and arg in context:
+                kwargs[arg] = context[arg]
+        task = asyncio.create_task(self._run(spec, kwargs, stats))
+        self._inflight[key] = task
+        if spec.exclusive_group:
+            self._groups[spec.exclusive_group].add(task)
+        task.add_done_callback(lambda t: self._forget(key, spec.exclusive_group, t))
+        return await self._wait(task, stats)
+
+    async def _wait(self, task: asyncio.Task, stats: _ToolStats) -> Dict[str, Any]:
+        # Lo shield separa l'esecuzione dal chiamante: se è il chiamante a essere annullato
+        # (es. fine sessione) il tool termina comunque, entro la sua scadenza.
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Annullato prima ancora di partire (sostituito nello stesso giro del loop):
+            # è un esito del tool, non un annullamento del chiamante.
+            if task.cancelled() and not asyncio.current_task().cancelling():
+                stats.superseded += 1
+                return {"status": "error", "message": "Richiesta sostituita da una più recente."}
+            raise
+
+    def submit(self, name: str, params: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> asyncio.Task:
+        """Esecuzione in background (tool fire-and-forget), tracciata fino al termine."""
+        task = asyncio.create_task(self.call(name, params, context))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    def cancel_all(self):
+        for task in list(self._inflight.values()) + list(self._background):
+            task.cancel()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stats.as_dict() for name, stats in self._stats.items() if stats.calls}
@@ -1,15 +1,37 @@
 # tools/spotify_tools/__init__.py (VERSIONE CORRETTA)
 import logging
+from . import errors
+from . import rate_limit
+from . import async_client
+from . import devices
+from . import token_manager
+from . import playback_state
 from . import auth
+from . import search_cache
+from . import scoring
 from . import search
 from . import playlist_artist
 from . import gpt_corrector
+from . import phonetic_corrector
+from . import library
+from . import tool_specs
 
 # Riepiloga le funzioni importanti per un accesso più semplice
 initialize_spotify = auth.initialize_spotify
 initialize_openai_client = auth.initialize_openai_client
 get_spotify_client = auth.get_spotify_client
 get_spotify_device_id = auth.get_spotify_device_id
+get_device_registry = auth.get_device_registry
+get_token_manager = auth.get_token_manager
+get_playback_state_service = auth.get_playback_state_service
+AsyncSpotify = async_client.AsyncSpotify
+SpotifyException = errors.SpotifyException
+initialize_search_cache = search_cache.initialize_search_cache
+get_search_cache = search_cache.get_search_cache
+initialize_phonetic_corrector = phonetic_corrector.initialize_phonetic_corrector
+initialize_library_mirror = library.initialize_library_mirror
+get_library_mirror = library.get_library_mirror
+configure_track_scorer = scoring.configure_track_scorer
 
 play_specific_spotify_track = search.play_specific_spotify_track
 add_to_queue = search.add_to_queue
@@ -20,4 +42,6 @@ PlaySpotifyArtist = playlist_artist.PlaySpotifyArtist
 PlayGenre = playlist_artist.PlayGenre
 PlayMoodOrActivity = playlist_artist.PlayMoodOrActivity
 
+spotify_tool_specs = tool_specs.spotify_tool_specs
+
 logger = logging.getLogger("tools.spotify_tools")
@@ -0,0 +1,191 @@
+# tools/spotify_tools/async_client.py
+import logging
+import re
+import time
+from typing import Callable, Optional, Dict, Any, List, Tuple
+
+import httpx
+
+import metrics
+from .errors import SpotifyException
+from .rate_limit import RateLimiter, PRIORITY_USER, current_priority
+
+logger = logging.getLogger("spotify_tools.async_client")
+
+SPOTIFY_API_BASE_URL = "https://api.spotify.com/v1/"
+
+_REQUEST_SECONDS = metrics.histogram("spotify_request_seconds", "Richieste alla Web API di Spotify", ("method", "endpoint", "status"))
+# ID Spotify (base62, 22 caratteri) e URL assoluti delle pagine successive: l'etichetta
+# "endpoint" resta un insieme piccolo e fisso di percorsi.
+_ID_SEGMENT = re.compile(r"/[0-9A-Za-z]{22}(?=/|$)")
+
+
+def endpoint_label(path: str) -> str:
+    path = "/" + path.split("?", 1)[0].split("/v1/", 1)[-1].lstrip("/")
+    return _ID_SEGMENT.sub("/{id}", path)
+
+
+class AsyncSpotify:
+    """
+    Client asincrono per la Web API di Spotify.
+
+    Espone le stesse operazioni di `spotipy.Spotify` usate dai tool e dal Jukebox,
+    ma ogni chiamata è un `await` su un `httpx.AsyncClient` condiviso: l'event loop
+    non viene mai bloccato e le connessioni HTTP restano in keep-alive tra una
+    richiesta e l'altra. Gli errori HTTP vengono sollevati come `SpotifyException`,
+    come farebbe spotipy, così la gestione degli errori dei chiamanti non cambia.
+
+    Tutte le richieste passano dal `RateLimiter` condiviso. Su un 429 il client rispetta
+    il Retry-After e ritenta (al massimo `max_retries` volte); una richiesta dell'utente
+    ritenta solo se l'attesa non supera `user_max_wait_s`, altrimenti l'errore arriva
+    subito al tool invece di lasciare l'ospite in attesa.
+    """
+
+    def __init__(self, auth: Optional[str] = None, base_url: str = SPOTIFY_API_BASE_URL,
+                 timeout: float = 10.0, max_connections: int = 10,
+                 rate_limiter: Optional[RateLimiter] = None, max_retries: int = 2, user_max_wait_s: float = 3.0):
+        self._auth = auth
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.user_max_wait_s = user_max_wait_s
+        # Richiamata (senza attenderla) quando Spotify rifiuta il token con un 401.
+        self.on_unauthorized: Optional[Callable[[], None]] = None
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=60.0,
+            ),
+        )
+
+    def set_auth(self, access_token: str):
+        """Sostituisce l'access token usato dalle richieste successive."""
+        self._auth = access_token
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None,
+                       payload: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        if params:
+            params = {k: v for k, v in params.items() if v is not None}
+        attempt = 0
+        while True:
+            response = await self._send(method, path, params, payload)
+            if response.status_code != 429:
+                break
+            try:
+                retry_after = max(0.0, float(response.headers.get("retry-after", 1)))
+            except ValueError:
+                retry_after = 1.0
+            self.rate_limiter.block(retry_after)
+            attempt += 1
+            if attempt > self.max_retries or (current_priority() == PRIORITY_USER and retry_after > self.user_max_wait_s):
+                break
+
+        if response.status_code >= 400:
+            message, reason = response.text, None
+            try:
+                error = response.json().get("error", {})
+                if isinstance(error, dict):
+                    message = error.get("message", message)
+                    reason = error.get("reason")
+            except ValueError:
+                pass
+            raise SpotifyException(
+                response.status_code, -1, f"{response.url}:\n {message}",
+                reason=reason, headers=dict(response.headers)
+            )
+
+        if response.status_code == 204 or not response.content:
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+    async def _send(self, method: str, path: str, params: Optional[Dict[str, Any]],
+                    payload: Optional[Dict[str, Any]]) -> httpx.Response:
+        token, response = await self._send_once(method, path, params, payload)
+        if response.status_code == 401:
+            if self._auth != token:
+                # Il token è stato rinnovato mentre la richiesta era in volo: un solo nuovo tentativo,
+                # che passa anch'esso dal budget e dalle metriche.
+                _, response = await self._send_once(method, path, params, payload)
+            elif self.on_unauthorized:
+                self.on_unauthorized()
+        return response
+
+    async def _send_once(self, method: str, path: str, params: Optional[Dict[str, Any]],
+                         payload: Optional[Dict[str, Any]]) -> Tuple[str, httpx.Response]:
+        """Una richiesta con il token corrente, dopo il rate limiter; ritorna anche il token usato."""
+        await self.rate_limiter.acquire()
+        token = self._auth
+        start = time.perf_counter()
+        response = await self._client.request(method, path, params=params, json=payload,
+                                              headers={"Authorization": f"Bearer {token}"})
+        _REQUEST_SECONDS.observe(time.perf_counter() - start, method=method, endpoint=endpoint_label(path),
+                                 status=response.status_code)
+        return token, response
+
+    # --- Profilo utente ---
+    async def current_user(self) -> Optional[Dict[str, Any]]:
+        return await self._request("GET", "me")
+
+    me = current_user
+
+    # --- Ricerca e catalogo ---
+    async def search(self, q: str, limit: int = 10, offset: int = 0, type: str = "track",
+                     market: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        return await self._request("GET", "search", params={"q": q, "limit": limit, "offset": offset, "type": type, "market": market})
+
+    async def artist_top_tracks(self, artist_id: str, country: Optional[str] = "US") -> Optional[Dict[str, Any]]:
+        artist_id = artist_id.split(":")[-1]
+        return await self._request("GET", f"artists/{artist_id}/top-tracks", params={"market": country})
+
+    async def next(self, result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Pagina successiva di un risultato paginato (come `spotipy.Spotify.next`)."""
+        if result and result.get("next"):
+            return await self._request("GET", result["next"])
+        return None
+
+    # --- Libreria e playlist ---
+    async def current_user_playlists(self, limit: int = 50, offset: int = 0) -> Optional[Dict[str, Any]]:
+        return await self._request("GET", "me/playlists", params={"limit": limit, "offset": offset})
+
+    async def playlist_items(self, playlist_id: str, fields: Optional[str] = None, limit: int = 100,
+                             offset: int = 0, market: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        playlist_id = playlist_id.split(":")[-1]
+        return await self._request("GET", f"playlists/{playlist_id}/tracks", params={
+            "fields": fields, "limit": limit, "offset": offset, "market": market, "additional_types": "track"
+        })
+
+    async def current_user_saved_tracks(self, limit: int = 50, offset: int = 0,
+                                        market: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        return await self._request("GET", "me/tracks", params={"limit": limit, "offset": offset, "market": market})
+
+    # --- Player ---
+    async def devices(self) -> Optional[Dict[str, Any]]:
+        return await self._request("GET", "me/player/devices")
+
+    async def current_playback(self, market: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        return await self._request("GET", "me/player", params={"market": market})
+
+    async def start_playback(self, device_id: Optional[str] = None, context_uri: Optional[str] = None,
+                             uris: Optional[List[str]] = None, offset: Optional[Dict[str, Any]] = None,
+                             position_ms: Optional[int] = None) -> None:
+        payload: Dict[str, Any] = {}
+        if context_uri:
+            payload["context_uri"] = context_uri
+        if uris:
+            payload["uris"] = uris
+        if offset is not None:
+            payload["offset"] = offset
+        if position_ms is not None:
+            payload["position_ms"] = position_ms
+        await self._request("PUT", "me/player/play", params={"device_id": device_id}, payload=payload)
+
+    async def add_to_queue(self, uri: str, device_id: Optional[str] = None) -> None:
+        await self._request("POST", "me/player/queue", params={"uri": uri, "device_id": device_id})
@@ -2,30 +2,34 @@
 import logging
 import asyncio
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple, TYPE_CHECKING
 
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-from openai import OpenAI 
+from .async_client import AsyncSpotify, SPOTIFY_API_BASE_URL
+from .rate_limit import RateLimiter
+from .devices import DeviceRegistry
+from .playback_state import PlaybackStateService
+from .token_manager import TokenManager
+
+if TYPE_CHECKING:
+    # spotipy.oauth2 e openai sono import pesanti: vengono caricati solo all'inizializzazione.
+    from spotipy.oauth2 import SpotifyOAuth
+    from openai import OpenAI
 
 logger = logging.getLogger("spotify_tools.auth")
 
-_sp: Optional[spotipy.Spotify] = None
-_auth_manager: Optional[SpotifyOAuth] = None
-_openai_client: Optional[OpenAI] = None
-_spotify_device_id: Optional[str] = None
-_spotify_device_name: str = "N/D"
+_sp: Optional[AsyncSpotify] = None
+_auth_manager: Optional["SpotifyOAuth"] = None
+_token_manager: Optional[TokenManager] = None
+_openai_client: Optional["OpenAI"] = None
+_device_registry: Optional[DeviceRegistry] = None
+_playback_state: Optional[PlaybackStateService] = None
 _user_country_spotify: Optional[str] = None
 
-def initialize_spotify(client_id, client_secret, redirect_uri, scope, cache_path) -> bool:
-    global _sp, _auth_manager, _user_country_spotify
-    logger.info("--- Inizializzazione modulo Spotify (Auth)... ---")
-
-    if not all([client_id, client_secret, redirect_uri]):
-        logger.error("❌ Credenziali Spotify (ID, Secret, URI) mancanti.")
-        return False
+def _authenticate(client_id, client_secret, redirect_uri, scope, cache_path) -> Tuple["SpotifyOAuth", Optional[Dict[str, Any]]]:
+    """Parte bloccante dell'autenticazione (cache del token, refresh o login interattivo): gira in un thread."""
+    from spotipy.oauth2 import SpotifyOAuth
 
-    _auth_manager = SpotifyOAuth(
+    auth_manager = SpotifyOAuth(
         client_id=client_id,
         client_secret=client_secret,
         redirect_uri=redirect_uri,
@@ -34,34 +38,57 @@ def initialize_spotify(client_id, client_secret, redirect_uri, scope, cache_path
         open_browser=False
     )
 
+    token_info = auth_manager.get_cached_token()
+    if token_info:
+        if auth_manager.is_token_expired(token_info):
+            logger.info("Token scaduto, tento il refresh...")
+            token_info = auth_manager.refresh_access_token(token_info['refresh_token'])
+    else:
+        auth_url = auth_manager.get_authorize_url()
+        print(f"\n🔗 Visita questo URL per autorizzare Spotify:\n{auth_url}\n")
+        auth_code_url = input("📥 Incolla qui l’URL reindirizzato: ")
+        code = auth_manager.parse_response_code(auth_code_url)
+        token_info = auth_manager.get_access_token(code, as_dict=True, check_cache=False)
+    return auth_manager, token_info
+
+async def initialize_spotify(client_id, client_secret, redirect_uri, scope, cache_path, device_ttl_s: float = 60.0,
+                             playback_freshness_s: float = 2.0, token_refresh_margin_s: float = 300.0,
+                             playback_confirm_timeout_s: float = 5.0, rate_limit_per_s: float = 10.0,
+                             rate_limit_burst: int = 20, api_base_url: str = SPOTIFY_API_BASE_URL) -> bool:
+    global _sp, _auth_manager, _token_manager, _user_country_spotify, _device_registry, _playback_state
+    logger.info("--- Inizializzazione modulo Spotify (Auth)... ---")
+
+    if not all([client_id, client_secret, redirect_uri]):
+        logger.error("❌ Credenziali Spotify (ID, Secret, URI) mancanti.")
+        return False
+
     try:
-        token_info = _auth_manager.get_cached_token()
-        if token_info:
-            if _auth_manager.is_token_expired(token_info):
-                logger.info("Token scaduto, tento il refresh...")
-                token_info = _auth_manager.refresh_access_token(token_info['refresh_token'])
-            access_token = token_info['access_token']
-        else:
-            auth_url = _auth_manager.get_authorize_url()
-            print(f"\n🔗 Visita questo URL per autorizzare Spotify:\n{auth_url}\n")
-            auth_code_url = input("📥 Incolla qui l’URL reindirizzato: ")
-            code = _auth_manager.parse_response_code(auth_code_url)
-            token_info = _auth_manager.get_access_token(code, as_dict=True, check_cache=False)
-            access_token = token_info.get('access_token')
-
-        if not access_token:
+        _auth_manager, token_info = await asyncio.to_thread(
+            _authenticate, client_id, client_secret, redirect_uri, scope, cache_path
+        )
+        if not token_info or not token_info.get('access_token'):
             raise Exception("Impossibile ottenere un access token valido.")
 
-        _sp = spotipy.Spotify(auth=access_token)
-        user = _sp.current_user()
+        # Profilo (che contiene già il paese) e dispositivi vengono chiesti in parallelo
+        # con il client asincrono, lo stesso usato a runtime. Il token manager lo tiene
+        # autenticato oltre l'ora di validità del token.
+        _sp = AsyncSpotify(base_url=api_base_url, rate_limiter=RateLimiter(rate_per_s=rate_limit_per_s, burst=rate_limit_burst))
+        _token_manager = TokenManager(_auth_manager, _sp, token_info, refresh_margin_s=token_refresh_margin_s)
+        user, devices_info = await asyncio.gather(_sp.current_user(), _sp.devices(), return_exceptions=True)
+        if isinstance(user, Exception):
+            raise user
         logger.info(f"✅ Autenticazione Spotify RIUSCITA per {user['display_name']}!")
 
-        me_info = _sp.me()
-        _user_country_spotify = me_info.get('country')
+        _user_country_spotify = user.get('country')
         if _user_country_spotify:
             logger.info(f"Paese utente: {_user_country_spotify}")
 
-        _update_active_device()
+        _device_registry = DeviceRegistry(_sp, ttl_s=device_ttl_s)
+        _playback_state = PlaybackStateService(_sp, freshness_s=playback_freshness_s, confirm_timeout_s=playback_confirm_timeout_s)
+        if isinstance(devices_info, Exception):
+            logger.error(f"Errore aggiornamento dispositivi: {devices_info}")
+        else:
+            _device_registry.apply(devices_info)
         logger.info("--- Inizializzazione Spotify (Auth) completata ---")
         return True
 
@@ -69,58 +96,43 @@ def initialize_spotify(client_id, client_secret, redirect_uri, scope, cache_path
         logger.error(f"❌ Errore critico autenticazione Spotify: {e}", exc_info=False)
         return False
 
-def initialize_openai_client(api_key: Optional[str]):
+def initialize_openai_client(api_key: Optional[str], base_url: Optional[str] = None):
     global _openai_client
     if api_key:
-        _openai_client = OpenAI(api_key=api_key)
+        from openai import OpenAI
+        _openai_client = OpenAI(api_key=api_key, base_url=base_url)
         logger.info("✅ Client OpenAI inizializzato.")
     else:
         logger.warning("Chiave API di OpenAI non fornita, il correttore GPT non sarà disponibile.")
 
-def get_spotify_client() -> Optional[spotipy.Spotify]:
+def get_spotify_client() -> Optional[AsyncSpotify]:
     return _sp
 
-def get_openai_client() -> Optional[OpenAI]:
+def get_openai_client() -> Optional["OpenAI"]:
     return _openai_client
 
+def get_token_manager() -> Optional[TokenManager]:
+    return _token_manager
+
+def get_device_registry() -> Optional[DeviceRegistry]:
+    return _device_registry
+
+def get_playback_state_service() -> Optional[PlaybackStateService]:
+    return _playback_state
+
 def get_spotify_device_id() -> Optional[str]:
-    return _spotify_device_id
+    return _device_registry.device_id if _device_registry else None
 
 def get_user_country() -> Optional[str]:
     return _user_country_spotify
 
-def _update_active_device() -> bool:
-    global _sp, _spotify_device_id, _spotify_device_name
-    if not _sp: 
+async def ensure_active_device() -> bool:
+    """True se c'è un dispositivo utilizzabile; legge il registro senza chiamate di rete."""
+    if not _sp or not _device_registry:
         logger.warning("Spotify client non inizializzato per aggiornamento dispositivo.")
         return False
-    try:
-        devices_info = _sp.devices()
-        if not devices_info or not devices_info.get('devices'):
-            logger.warning("Nessun dispositivo Spotify trovato nell'account.")
-            _spotify_device_id = None
-            return False
-
-        available_devices = devices_info['devices']
-        active_device = next((d for d in available_devices if d.get('is_active')), None)
-        if not active_device:
-            for dtype in ["Computer", "Smartphone", "Speaker"]:
-                active_device = next((d for d in available_devices if d.get('type') == dtype), None)
-                if active_device: break
-        
-        if not active_device and available_devices:
-            active_device = available_devices[0]
-            
-        if active_device and active_device.get('id'):
-            _spotify_device_id = active_device['id']
-            _spotify_device_name = active_device.get('name', 'N/D')
-            logger.info(f"Dispositivo attivo aggiornato: {_spotify_device_name}")
-            return True
-        
-        logger.warning("Nessun dispositivo Spotify attivo o utilizzabile trovato.")
-        _spotify_device_id = None
-        return False
-    except Exception as e:
-        logger.error(f"Errore aggiornamento dispositivi: {e}")
-        _spotify_device_id = None
-        return False
+    return await _device_registry.ensure_device()
+
+def handle_playback_error(error: Exception) -> bool:
+    """Da chiamare quando un comando di riproduzione fallisce: invalida il dispositivo se serve."""
+    return bool(_device_registry and _device_registry.handle_error(error))
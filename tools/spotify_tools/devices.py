@@ -0,0 +1,143 @@
+# tools/spotify_tools/devices.py
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, Any, List
+
+from .errors import SpotifyException
+
+from .async_client import AsyncSpotify
+from .rate_limit import background_requests
+
+logger = logging.getLogger("spotify_tools.devices")
+
+# Ordine di preferenza quando nessun dispositivo risulta attivo.
+PREFERRED_DEVICE_TYPES = ("Computer", "Smartphone", "Speaker")
+
+
+def select_device(available_devices: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Sceglie il dispositivo attivo o, in mancanza, il primo secondo PREFERRED_DEVICE_TYPES."""
+    active_device = next((d for d in available_devices if d.get('is_active')), None)
+    if not active_device:
+        for dtype in PREFERRED_DEVICE_TYPES:
+            active_device = next((d for d in available_devices if d.get('type') == dtype), None)
+            if active_device: break
+
+    if not active_device and available_devices:
+        active_device = available_devices[0]
+    return active_device
+
+
+def is_device_error(error: Exception) -> bool:
+    """True se l'errore indica che il dispositivo memorizzato non è più valido."""
+    if not isinstance(error, SpotifyException):
+        return False
+    text = f"{error.msg} {error.reason or ''}".lower()
+    return error.http_status == 404 or "device not found" in text or "no_active_device" in text
+
+
+class DeviceRegistry:
+    """
+    Registro del dispositivo Spotify su cui riprodurre.
+
+    I tool leggono il dispositivo memorizzato senza chiamare /me/player/devices:
+    la lista viene riletta in background ogni `ttl_s` secondi (task `run()`) oppure
+    subito dopo `invalidate()`, che va chiamato quando un comando di riproduzione
+    fallisce perché il dispositivo non esiste più.
+    """
+
+    def __init__(self, sp: AsyncSpotify, ttl_s: float = 60.0):
+        self.sp = sp
+        self.ttl_s = ttl_s
+        self.device_id: Optional[str] = None
+        self.device_name: str = "N/D"
+        self._updated_at: float = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._wake_event = asyncio.Event()
+        self._running = False
+
+    @property
+    def is_fresh(self) -> bool:
+        return self.device_id is not None and time.monotonic() - self._updated_at < self.ttl_s
+
+    def apply(self, devices_info: Optional[Dict[str, Any]]) -> bool:
+        """Aggiorna il registro a partire da una risposta di /me/player/devices."""
+        self._updated_at = time.monotonic()
+        if not devices_info or not devices_info.get('devices'):
+            logger.warning("Nessun dispositivo Spotify trovato nell'account.")
+            self.device_id = None
+            return False
+
+        device = select_device(devices_info['devices'])
+        if device and device.get('id'):
+            if device['id'] != self.device_id:
+                logger.info(f"Dispositivo attivo aggiornato: {device.get('name', 'N/D')}")
+            self.device_id = device['id']
+            self.device_name = device.get('name', 'N/D')
+            return True
+
+        logger.warning("Nessun dispositivo Spotify attivo o utilizzabile trovato.")
+        self.device_id = None
+        return False
+
+    async def _fetch(self) -> bool:
+        try:
+            return self.apply(await self.sp.devices())
+        except Exception as e:
+            logger.error(f"Errore aggiornamento dispositivi: {e}")
+            self.device_id = None
+            return False
+
+    async def refresh(self) -> bool:
+        """Rilegge i dispositivi; chiamate concorrenti condividono la stessa richiesta."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._fetch())
+        return await asyncio.shield(self._refresh_task)
+
+    async def ensure_device(self) -> bool:
+        """
+        Ritorna True se c'è un dispositivo utilizzabile. Con un dispositivo in cache
+        non fa alcuna chiamata di rete; solo se il registro è vuoto attende un refresh.
+        """
+        if self.device_id:
+            if not self.is_fresh and not self._running:
+                # Senza il task di background, rinfresca in modo opportunistico.
+                asyncio.create_task(self.refresh())
+            return True
+        return await self.refresh()
+
+    def invalidate(self):
+        """Dimentica il dispositivo corrente e chiede un refresh immediato."""
+        if self.device_id:
+            logger.warning(f"Dispositivo '{self.device_name}' invalidato, verrà riletto.")
+        self.device_id = None
+        self._updated_at = 0.0
+        self._wake_event.set()
+
+    def handle_error(self, error: Exception) -> bool:
+        """Invalida il registro se l'errore riguarda il dispositivo. Ritorna True in quel caso."""
+        if is_device_error(error):
+            self.invalidate()
+            return True
+        return False
+
+    async def run(self):
+        logger.info(f"📱 Registro dispositivi avviato (refresh ogni {self.ttl_s:.0f}s).")
+        self._running = True
+        try:
+            with background_requests():
+                while self._running:
+                    timeout = max(0.0, self.ttl_s - (time.monotonic() - self._updated_at))
+                    try:
+                        await asyncio.wait_for(self._wake_event.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wake_event.clear()
+                    if self._running:
+                        await self.refresh()
+        finally:
+            self._running = False
+
+    def stop(self):
+        self._running = False
+        self._wake_event.set()
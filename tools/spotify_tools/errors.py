@@ -0,0 +1,21 @@
+# tools/spotify_tools/errors.py
+
+
+class SpotifyException(Exception):
+    """
+    Errore HTTP della Web API, con gli stessi attributi di `spotipy.exceptions.SpotifyException`
+    (`http_status`, `code`, `msg`, `reason`, `headers`). È definito qui perché importare
+    anche solo `spotipy.exceptions` carica tutto spotipy (client, oauth2, requests) all'avvio.
+    """
+
+    def __init__(self, http_status: int, code: int, msg: str, reason=None, headers=None):
+        super().__init__(http_status, code, msg)
+        self.http_status = http_status
+        self.code = code
+        self.msg = msg
+        self.reason = reason
+        # Serve per leggere Retry-After dalle risposte 429.
+        self.headers = headers or {}
+
+    def __str__(self):
+        return f"http status: {self.http_status}, code: {self.code} - {self.msg}, reason: {self.reason}"
@@ -1,20 +1,26 @@
 # tools/spotify_tools/gpt_corrector.py
 # --- MODULO AGGIORNATO CON FIX PER OPENAI ---
 
+import asyncio
 import logging
 import json
-from typing import Optional, Dict, Any
-from openai import OpenAI
+from typing import Optional, Dict, TYPE_CHECKING
 
+import metrics
 from .auth import get_openai_client
 
+if TYPE_CHECKING:
+    from openai import OpenAI
+
 logger = logging.getLogger("spotify_tools.gpt_corrector")
 
+_OPENAI_SECONDS = metrics.histogram("openai_request_seconds", "Chiamate alle API di OpenAI", ("operation",))
+
 async def get_corrected_search_terms_from_gpt(transcribed_text: str) -> Optional[Dict[str, str]]:
     """
     Usa OpenAI GPT per correggere e estrarre i termini di ricerca (artista, traccia).
     """
-    openai_client: Optional[OpenAI] = get_openai_client()
+    openai_client: Optional["OpenAI"] = get_openai_client()
 
     if not openai_client:
         logger.warning("OpenAI client non inizializzato, saltando la correzione GPT.")
@@ -71,17 +77,19 @@ async def get_corrected_search_terms_from_gpt(transcribed_text: str) -> Optional
     
     corrected_terms_raw = ""
     try:
-        # --- CORREZIONE APPLICATA QUI ---
-        # La chiamata non è più asincrona nella libreria openai v1.x+
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Trascrizione utente: '{transcribed_text}'"}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.0
-        )
+        # Il client openai v1.x è sincrono: la chiamata gira in un thread, così l'event loop
+        # (microfono e audio dell'agente) non resta fermo per tutta la richiesta.
+        with _OPENAI_SECONDS.time(operation="chat.completions"):
+            response = await asyncio.to_thread(
+                openai_client.chat.completions.create,
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": f"Trascrizione utente: '{transcribed_text}'"}
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.0
+            )
         corrected_terms_raw = response.choices[0].message.content
         corrected_terms = json.loads(corrected_terms_raw)
 
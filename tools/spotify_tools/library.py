@@ -0,0 +1,282 @@
+# tools/spotify_tools/library.py
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Optional, Dict, Any, List, Set, Tuple
+
+from .async_client import AsyncSpotify
+from .rate_limit import background_requests
+from .search_cache import normalize_term, slim_track
+from .phonetic_corrector import get_phonetic_corrector
+
+logger = logging.getLogger("spotify_tools.library")
+
+# Campi richiesti per le tracce delle playlist: solo quelli che servono al mirror.
+_PLAYLIST_ITEM_FIELDS = (
+    "items(track(id,uri,name,popularity,duration_ms,type,is_local,"
+    "artists(id,name),album(id,name,album_type))),next,total"
+)
+# Soglie di accettazione di un risultato locale: sotto queste si passa alla Web API.
+_MIN_NAME_SCORE = 0.85
+_MIN_ARTIST_SCORE = 0.8
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _dice(a: Set[str], b: Set[str]) -> float:
+    return 2 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+
+class _CatalogIndex:
+    """Indice invertito (token e trigrammi di carattere) sui titoli delle tracce del mirror."""
+
+    def __init__(self, tracks: List[Dict[str, Any]]):
+        self.tracks = tracks
+        self.names: List[str] = []
+        self.name_grams: List[Set[str]] = []
+        self.artist_names: List[List[str]] = []
+        self.by_token: Dict[str, Set[int]] = defaultdict(set)
+        self.by_trigram: Dict[str, Set[int]] = defaultdict(set)
+        for idx, track in enumerate(tracks):
+            name = normalize_term(track.get('name'))
+            grams = _trigrams(name)
+            self.names.append(name)
+            self.name_grams.append(grams)
+            self.artist_names.append([normalize_term(a.get('name')) for a in track.get('artists', [])])
+            for token in name.split():
+                self.by_token[token].add(idx)
+            for gram in grams:
+                self.by_trigram[gram].add(idx)
+
+    def resolve(self, track_name: str, artist_name: Optional[str]) -> Optional[Tuple[Dict[str, Any], float]]:
+        name = normalize_term(track_name)
+        if not name:
+            return None
+        grams = _trigrams(name)
+
+        votes: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for idx in self.by_trigram.get(gram, ()):
+                votes[idx] += 1
+        # Le corrispondenze esatte su un token raro entrano comunque tra i candidati.
+        for token in name.split():
+            ids = self.by_token.get(token, ())
+            if len(ids) < 50:
+                for idx in ids:
+                    votes[idx] += 1
+        threshold = len(grams) // 2
+
+        artist = normalize_term(artist_name)
+        artist_grams = _trigrams(artist) if artist else set()
+        best: Optional[Tuple[int, float]] = None
+        for idx, count in votes.items():
+            if count < threshold:
+                continue
+            name_score = 1.0 if self.names[idx] == name else _dice(grams, self.name_grams[idx])
+            if name_score < _MIN_NAME_SCORE:
+                continue
+            score = name_score
+            if artist:
+                artist_score = max((1.0 if a == artist else _dice(artist_grams, _trigrams(a)) for a in self.artist_names[idx]), default=0.0)
+                if artist_score < _MIN_ARTIST_SCORE:
+                    continue
+                score += artist_score
+            # A parità di titolo vince la versione più popolare.
+            score += self.tracks[idx].get('popularity', 0) / 1000
+            if best is None or score > best[1]:
+                best = (idx, score)
+        return (self.tracks[best[0]], best[1]) if best else None
+
+
+class LibraryMirror:
+    """
+    Copia locale delle playlist dell'utente (e dei brani salvati, se lo scope lo consente).
+
+    La sincronizzazione gira in background ed è incrementale: una playlist viene
+    riscaricata solo quando il suo `snapshot_id` cambia. Le tracce sono indicizzate
+    in un indice invertito, così `resolve()` trova in locale i brani già presenti
+    nell'account senza chiamare `search` sulla Web API.
+    """
+
+    def __init__(self, sp: AsyncSpotify, path: str, sync_interval_s: float = 900.0,
+                 include_saved_tracks: bool = False):
+        self.sp = sp
+        self.path = path
+        self.sync_interval_s = sync_interval_s
+        self.include_saved_tracks = include_saved_tracks
+        self.hits = 0
+        self.misses = 0
+        self._playlists: Dict[str, Dict[str, Any]] = {}
+        self._saved: Dict[str, Any] = {"first_id": None, "total": 0, "track_ids": []}
+        self._tracks: Dict[str, Dict[str, Any]] = {}
+        self._index: Optional[_CatalogIndex] = None
+        self._running = False
+        self._load()
+
+    # --- Persistenza ---
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self._playlists = data.get("playlists", {})
+            self._saved = data.get("saved", self._saved)
+            self._tracks = data.get("tracks", {})
+            self._index = _CatalogIndex(list(self._tracks.values()))
+            logger.info(f"📚 Mirror libreria caricato: {len(self._playlists)} playlist, {len(self._tracks)} tracce.")
+        except (OSError, ValueError) as e:
+            logger.error(f"Impossibile leggere il mirror della libreria '{self.path}': {e}")
+
+    def _save(self, data: Dict[str, Any]):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    # --- Sincronizzazione ---
+    async def _fetch_all(self, first_page: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        items, page = [], first_page
+        while page:
+            items.extend(page.get('items', []))
+            page = await self.sp.next(page)
+        return items
+
+    async def _fetch_playlist_tracks(self, playlist_id: str) -> List[Dict[str, Any]]:
+        items = await self._fetch_all(await self.sp.playlist_items(playlist_id, fields=_PLAYLIST_ITEM_FIELDS))
+        return [item['track'] for item in items
+                if item.get('track') and item['track'].get('id') and not item['track'].get('is_local')]
+
+    async def sync(self) -> bool:
+        """Sincronizza il mirror. Ritorna True se qualcosa è cambiato."""
+        start = time.monotonic()
+        changed = False
+        new_tracks: Dict[str, Dict[str, Any]] = {}
+        # Gli aggiornamenti restano in copie locali fino alla fine: se una pagina fallisce a
+        # metà, il mirror tiene i vecchi snapshot e il sync successivo riprova quelle playlist.
+        playlists_state = dict(self._playlists)
+        saved_state = self._saved
+
+        playlists = await self._fetch_all(await self.sp.current_user_playlists(limit=50))
+        remote_ids = set()
+        for playlist in playlists:
+            if not playlist or not playlist.get('id'):
+                continue
+            playlist_id = playlist['id']
+            remote_ids.add(playlist_id)
+            local = playlists_state.get(playlist_id)
+            if local and local.get('snapshot_id') == playlist.get('snapshot_id'):
+                continue
+            tracks = await self._fetch_playlist_tracks(playlist_id)
+            for track in tracks:
+                new_tracks[track['id']] = slim_track(track)
+            playlists_state[playlist_id] = {
+                "name": playlist.get('name', ''),
+                "snapshot_id": playlist.get('snapshot_id'),
+                "track_ids": [t['id'] for t in tracks],
+            }
+            changed = True
+            logger.info(f"Playlist '{playlist.get('name')}' sincronizzata ({len(tracks)} tracce).")
+
+        for playlist_id in set(playlists_state) - remote_ids:
+            del playlists_state[playlist_id]
+            changed = True
+
+        if self.include_saved_tracks:
+            first_page = await self.sp.current_user_saved_tracks(limit=50)
+            first_items = (first_page or {}).get('items', [])
+            first_id = first_items[0]['track']['id'] if first_items and first_items[0].get('track') else None
+            if (first_page or {}).get('total') != saved_state.get('total') or first_id != saved_state.get('first_id'):
+                items = await self._fetch_all(first_page)
+                saved = [item['track'] for item in items if item.get('track') and item['track'].get('id')]
+                for track in saved:
+                    new_tracks[track['id']] = slim_track(track)
+                saved_state = {"first_id": first_id, "total": first_page.get('total'), "track_ids": [t['id'] for t in saved]}
+                changed = True
+
+        if changed:
+            await self._rebuild(new_tracks, playlists_state, saved_state)
+            await self._feed_corrector(list(new_tracks.values()))
+        logger.info(f"📚 Sync libreria completata in {time.monotonic() - start:.1f}s "
+                    f"({'aggiornata' if changed else 'nessuna modifica'}, {len(self._tracks)} tracce).")
+        return changed
+
+    async def _rebuild(self, new_tracks: Dict[str, Dict[str, Any]], playlists: Dict[str, Dict[str, Any]],
+                       saved: Dict[str, Any]):
+        referenced = set(saved.get('track_ids', []))
+        for playlist in playlists.values():
+            referenced.update(playlist['track_ids'])
+        tracks = {tid: new_tracks.get(tid) or self._tracks.get(tid) for tid in referenced}
+        tracks = {tid: t for tid, t in tracks.items() if t}
+        data = {"playlists": playlists, "saved": saved, "tracks": tracks}
+
+        def build() -> _CatalogIndex:
+            index = _CatalogIndex(list(tracks.values()))
+            self._save(data)
+            return index
+
+        # Costruzione dell'indice e scrittura su disco fuori dall'event loop.
+        index = await asyncio.to_thread(build)
+        self._playlists, self._saved, self._tracks, self._index = playlists, saved, tracks, index
+
+    async def _feed_corrector(self, tracks: List[Dict[str, Any]], batch_size: int = 200):
+        """Aggiunge le tracce al correttore fonetico a piccoli blocchi, per non bloccare il loop."""
+        corrector = get_phonetic_corrector()
+        if not corrector:
+            return
+        for i in range(0, len(tracks), batch_size):
+            corrector.add_tracks(tracks[i:i + batch_size])
+            await asyncio.sleep(0)
+
+    # --- Risoluzione ---
+    def resolve(self, track_name: str, artist_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Cerca il brano nel mirror. Ritorna la traccia (formato Web API ridotto) o None."""
+        if not self._index:
+            return None
+        result = self._index.resolve(track_name, artist_name)
+        if not result:
+            self.misses += 1
+            return None
+        self.hits += 1
+        track, score = result
+        logger.info(f"📚 Trovato nel mirror locale: '{track['name']}' (score {score:.2f}).")
+        return track
+
+    def stats(self) -> Dict[str, Any]:
+        return {"playlists": len(self._playlists), "tracks": len(self._tracks), "hits": self.hits, "misses": self.misses}
+
+    async def run(self):
+        logger.info(f"📚 Sync libreria avviata (ogni {self.sync_interval_s:.0f}s).")
+        self._running = True
+        with background_requests():
+            while self._running:
+                try:
+                    await self.sync()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Errore durante la sincronizzazione della libreria: {e}")
+                await asyncio.sleep(self.sync_interval_s)
+
+    def stop(self):
+        self._running = False
+
+
+_library_mirror: Optional[LibraryMirror] = None
+
+
+def initialize_library_mirror(sp: AsyncSpotify, path: str, sync_interval_s: float,
+                              include_saved_tracks: bool = False) -> LibraryMirror:
+    global _library_mirror
+    _library_mirror = LibraryMirror(sp, path, sync_interval_s=sync_interval_s, include_saved_tracks=include_saved_tracks)
+    return _library_mirror
+
+
+def get_library_mirror() -> Optional[LibraryMirror]:
+    return _library_mirror
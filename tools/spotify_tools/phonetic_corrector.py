@@ -0,0 +1,260 @@
+# tools/spotify_tools/phonetic_corrector.py
+import json
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Iterable, Set, Tuple
+
+from .search_cache import normalize_term
+
+logger = logging.getLogger("spotify_tools.phonetic_corrector")
+
+DEFAULT_DICTIONARY_PATH = os.path.join(os.path.dirname(__file__), "data", "phonetic_dictionary.json")
+
+# --- Regole fonetiche ---
+# Il riconoscimento vocale trascrive i nomi stranieri "all'italiana" (Maicol Gecson,
+# Ed Shiran, Bon Giovi). Per confrontarli con i nomi originali riduciamo entrambi a
+# uno scheletro consonantico comune, applicando sia le regole di lettura inglesi sia
+# quelle italiane: una trascrizione italiana e il nome inglese corretto finiscono
+# così sulla stessa chiave. Simboli: C = /tʃ/, G = /dʒ/, S = /ʃ/.
+_ENGLISH_RULES = [
+    (r"tch", "C"), (r"ch(?=[rl])", "k"), (r"ch", "C"), (r"sh", "S"), (r"ph", "f"), (r"th", "t"),
+    (r"gh", ""), (r"^kn", "n"), (r"^wr", "r"), (r"ck", "k"), (r"c(?=[eiy])", "s"), (r"c", "k"),
+    (r"qu?", "k"), (r"x", "ks"), (r"j", "G"), (r"g(?=[eiy])", "G"), (r"z", "s"),
+    (r"w", "u"), (r"y", "i"), (r"(?<=[^aeiou])e$", ""),
+]
+_ITALIAN_RULES = [
+    (r"sc(?=[ei])", "S"), (r"sci(?=[aou])", "S"), (r"ci(?=[aou])", "C"), (r"c(?=[ei])", "C"),
+    (r"ch", "k"), (r"gi(?=[aou])", "G"), (r"g(?=[ei])", "G"), (r"gh", "g"), (r"gn", "ni"),
+    (r"gli", "li"), (r"qu", "ku"), (r"c", "k"), (r"z", "s"), (r"x", "ks"), (r"j", "i"),
+    (r"w", "u"), (r"y", "i"),
+]
+_COMPILED_RULES = {
+    "en": [(re.compile(p), r) for p, r in _ENGLISH_RULES],
+    "it": [(re.compile(p), r) for p, r in _ITALIAN_RULES],
+}
+_VOWELS = re.compile(r"[aeiou]+")
+_DOUBLES = re.compile(r"(.)\1+")
+# Parole che il parlato aggiunge o storpia senza cambiare il significato ("di" = "the").
+_STOPWORDS = {"the", "di", "de", "dei", "degli", "i", "il", "la", "lo", "and", "e", "n", "en", "end", "feat", "ft"}
+
+
+def _word_skeleton(word: str, ruleset: str) -> str:
+    for pattern, replacement in _COMPILED_RULES[ruleset]:
+        word = pattern.sub(replacement, word)
+    word = word.replace("h", "")
+    if not word:
+        return ""
+    # La vocale iniziale viene tenuta come marcatore generico: distingue "Eminem" da "Minem".
+    head = "V" if word[0] in "aeiou" else ""
+    return head + _DOUBLES.sub(r"\1", _VOWELS.sub("", word))
+
+
+def phonetic_keys(text: str) -> Set[str]:
+    """Chiavi fonetiche di un nome secondo le regole inglesi e italiane (1 o 2 varianti)."""
+    words = [w for w in normalize_term(text).split() if w not in _STOPWORDS] or normalize_term(text).split()
+    keys = set()
+    for ruleset in _COMPILED_RULES:
+        key = " ".join(filter(None, (_word_skeleton(w, ruleset) for w in words)))
+        if key:
+            keys.add(key)
+    return keys
+
+
+_TITLE_SUFFIX = re.compile(r"\s*(\(.*\)|\[.*\]|\s-\s.*)$")
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def levenshtein(a: str, b: str) -> int:
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def _similarity(a: str, b: str) -> float:
+    if not a or not b:
+        return 0.0
+    return 1.0 - levenshtein(a, b) / max(len(a), len(b))
+
+
+@dataclass(frozen=True)
+class Correction:
+    """Candidato di correzione con punteggio in [0, 1]."""
+    track_name: Optional[str]
+    artist_name: Optional[str]
+    score: float
+
+
+class _PhoneticIndex:
+    """Dizionario di nomi con chiavi fonetiche precalcolate e indice a trigrammi sulle chiavi."""
+
+    def __init__(self):
+        self.entries: List[Tuple[str, str, Optional[str]]] = []  # (nome, nome normalizzato, dato extra)
+        self.entry_keys: List[Set[str]] = []
+        self._seen: Set[Tuple[str, Optional[str]]] = set()
+        self._by_trigram: Dict[str, Set[int]] = defaultdict(set)
+
+    def add(self, name: str, extra: Optional[str] = None):
+        normalized = normalize_term(name)
+        marker = (normalized, normalize_term(extra) if extra else None)
+        if not normalized or marker in self._seen:
+            return
+        self._seen.add(marker)
+        idx = len(self.entries)
+        self.entries.append((name, normalized, extra))
+        # I titoli vengono indicizzati anche senza suffissi come "(Remastered)" o "- Sea Shanty".
+        keys = phonetic_keys(name) | phonetic_keys(_TITLE_SUFFIX.sub("", name))
+        self.entry_keys.append(keys)
+        for key in keys:
+            for gram in _trigrams(key):
+                self._by_trigram[gram].add(idx)
+
+    def search(self, text: str, limit: int, min_score: float) -> List[Tuple[int, float]]:
+        query_keys = phonetic_keys(text)
+        if not query_keys:
+            return []
+        normalized = normalize_term(text)
+
+        votes: Dict[int, int] = defaultdict(int)
+        query_grams = set()
+        for key in query_keys:
+            query_grams |= _trigrams(key)
+        for gram in query_grams:
+            for idx in self._by_trigram.get(gram, ()):
+                votes[idx] += 1
+        # Solo i candidati che condividono abbastanza trigrammi passano al confronto esatto.
+        threshold = max(2, len(query_grams) // 3)
+        candidates = [idx for idx, count in votes.items() if count >= threshold]
+
+        scored = []
+        for idx in candidates:
+            phonetic = max(_similarity(q, k) for q in query_keys for k in self.entry_keys[idx])
+            textual = _similarity(normalized, self.entries[idx][1])
+            score = 0.75 * phonetic + 0.25 * textual
+            if score >= min_score:
+                scored.append((idx, score))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class PhoneticCorrector:
+    """
+    Correttore locale per nomi di artisti e brani storpiati dalla trascrizione.
+
+    Confronta la richiesta con un dizionario di artisti e brani tramite chiavi
+    fonetiche pensate per la pronuncia italiana dei nomi inglesi, più una distanza
+    di edit sulle chiavi. Restituisce candidati ordinati in pochi millisecondi,
+    prima di ricorrere alla correzione via GPT.
+    """
+
+    def __init__(self, min_score: float = 0.6):
+        self.min_score = min_score
+        self._artists = _PhoneticIndex()
+        self._tracks = _PhoneticIndex()
+
+    def add_artist(self, artist_name: str):
+        self._artists.add(artist_name)
+
+    def add_track(self, track_name: str, artist_name: Optional[str] = None):
+        self._tracks.add(track_name, artist_name)
+        if artist_name:
+            self._artists.add(artist_name)
+
+    def add_tracks(self, tracks: Iterable[Dict[str, Any]]):
+        """Aggiunge tracce nel formato della Web API (nome + artisti)."""
+        for track in tracks:
+            artists = track.get('artists') or [{}]
+            if track.get('name'):
+                self.add_track(track['name'], artists[0].get('name'))
+
+    def load_dictionary(self, path: str) -> int:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        for artist in data.get("artists", []):
+            self.add_artist(artist)
+        for track in data.get("tracks", []):
+            self.add_track(track["name"], track.get("artist"))
+        return len(data.get("artists", [])) + len(data.get("tracks", []))
+
+    def correct(self, track_name: str, artist_name: Optional[str] = None, limit: int = 3) -> List[Correction]:
+        """Ritorna fino a `limit` correzioni diverse dalla richiesta originale, dalla più probabile."""
+        start = time.perf_counter()
+        # Chiave normalizzata (artista, titolo) → (punteggio, titolo, artista) del candidato migliore:
+        # "Sweet Child O' Mine" e "Sweet Child o Mine" sono lo stesso candidato.
+        corrections: Dict[Tuple[str, str], Tuple[float, Optional[str], Optional[str]]] = {}
+
+        def keep_best(track: Optional[str], artist: Optional[str], score: float):
+            key = (normalize_term(artist), normalize_term(track))
+            if key not in corrections or score > corrections[key][0]:
+                corrections[key] = (score, track, artist)
+
+        artist_matches = self._artists.search(artist_name, limit, self.min_score) if artist_name else []
+        best_artist = self._artists.entries[artist_matches[0][0]][0] if artist_matches else artist_name
+        best_artist_score = artist_matches[0][1] if artist_matches else 0.0
+
+        for idx, score in self._tracks.search(track_name, limit * 2, self.min_score):
+            name, _, track_artist = self._tracks.entries[idx]
+            if artist_name and track_artist:
+                # Brano riconosciuto: pesa anche la somiglianza con l'artista richiesto.
+                artist_score = max(_similarity(q, k) for q in phonetic_keys(artist_name) for k in phonetic_keys(track_artist))
+                score = 0.6 * score + 0.4 * artist_score
+            keep_best(name, track_artist or best_artist, score)
+
+        for idx, score in artist_matches:
+            keep_best(track_name, self._artists.entries[idx][0], 0.9 * score)
+
+        original = (normalize_term(artist_name), normalize_term(track_name))
+        ranked = [
+            Correction(track, artist, round(score, 3))
+            for key, (score, track, artist) in sorted(corrections.items(), key=lambda item: item[1][0], reverse=True)
+            if key != original and score >= self.min_score
+        ][:limit]
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"Correzione fonetica per '{track_name}' / '{artist_name or 'N/A'}': "
+                    f"{len(ranked)} candidati in {elapsed_ms:.1f} ms (artista migliore: {best_artist} {best_artist_score:.2f}).")
+        return ranked
+
+    @property
+    def size(self) -> Dict[str, int]:
+        return {"artists": len(self._artists), "tracks": len(self._tracks)}
+
+
+_phonetic_corrector: Optional[PhoneticCorrector] = None
+
+
+def initialize_phonetic_corrector(dictionary_path: Optional[str] = DEFAULT_DICTIONARY_PATH,
+                                  extra_tracks: Iterable[Dict[str, Any]] = ()) -> PhoneticCorrector:
+    global _phonetic_corrector
+    corrector = PhoneticCorrector()
+    if dictionary_path:
+        try:
+            corrector.load_dictionary(dictionary_path)
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ Impossibile caricare il dizionario fonetico '{dictionary_path}': {e}")
+    corrector.add_tracks(extra_tracks)
+    _phonetic_corrector = corrector
+    logger.info(f"✅ Correttore fonetico pronto: {corrector.size['artists']} artisti, {corrector.size['tracks']} brani.")
+    return corrector
+
+
+def get_phonetic_corrector() -> Optional[PhoneticCorrector]:
+    return _phonetic_corrector
@@ -0,0 +1,160 @@
+# tools/spotify_tools/playback_state.py
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, Set, Tuple
+
+from .async_client import AsyncSpotify
+
+logger = logging.getLogger("spotify_tools.playback_state")
+
+
+@dataclass(frozen=True)
+class PlaybackSnapshot:
+    """Risposta di /me/player con l'istante (monotonic) in cui è stata richiesta."""
+    data: Optional[Dict[str, Any]]
+    fetched_at: float
+
+    @property
+    def age_s(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+    @property
+    def item(self) -> Optional[Dict[str, Any]]:
+        return self.data.get('item') if self.data else None
+
+    @property
+    def uri(self) -> Optional[str]:
+        item = self.item
+        return item.get('uri') if item else None
+
+    @property
+    def is_playing(self) -> bool:
+        return bool(self.data and self.data.get('is_playing'))
+
+    @property
+    def duration_ms(self) -> int:
+        item = self.item
+        return item.get('duration_ms', 0) if item else 0
+
+    @property
+    def progress_ms(self) -> int:
+        """Avanzamento stimato ad ora: se il brano suona, aggiunge il tempo trascorso dalla lettura."""
+        if not self.data or self.data.get('progress_ms') is None:
+            return 0
+        progress = self.data['progress_ms']
+        if self.is_playing:
+            progress += int(self.age_s * 1000)
+        return min(progress, self.duration_ms) if self.duration_ms else progress
+
+
+class PlaybackStateService:
+    """
+    Unico punto di accesso a `current_playback()`.
+
+    - Le richieste concorrenti vengono unite in una sola chiamata HTTP in volo.
+    - Uno snapshot più giovane di `max_age_s` viene restituito senza andare in rete.
+    - Gli iscritti (`subscribe()`) ricevono sulla propria coda la coppia
+      (precedente, nuovo) ogni volta che cambiano l'URI o `is_playing`.
+    - `confirm_playing()` attende che un brano appena avviato risulti in riproduzione.
+    """
+
+    def __init__(self, sp: AsyncSpotify, freshness_s: float = 2.0, confirm_timeout_s: float = 5.0):
+        self.sp = sp
+        self.freshness_s = freshness_s
+        self.confirm_timeout_s = confirm_timeout_s
+        self.fetch_count = 0
+        self.served_from_cache = 0
+        self._snapshot: Optional[PlaybackSnapshot] = None
+        self._inflight: Optional[asyncio.Task] = None
+        self._inflight_started: float = 0.0
+        self._invalidated_at: float = 0.0
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._last_notified: Optional[PlaybackSnapshot] = None
+
+    @property
+    def snapshot(self) -> Optional[PlaybackSnapshot]:
+        return self._snapshot
+
+    async def get(self, max_age_s: Optional[float] = None) -> PlaybackSnapshot:
+        """
+        Ritorna uno snapshot vecchio al massimo `max_age_s` secondi (default: la finestra
+        di freschezza configurata). Con `max_age_s=0` la lettura parte sempre dopo la chiamata.
+        """
+        max_age_s = self.freshness_s if max_age_s is None else max_age_s
+        now = time.monotonic()
+        if self._snapshot and now - self._snapshot.fetched_at <= max_age_s:
+            self.served_from_cache += 1
+            return self._snapshot
+        if (self._inflight and not self._inflight.done() and max_age_s > 0
+                and now - self._inflight_started <= max_age_s and self._inflight_started >= self._invalidated_at):
+            return await asyncio.shield(self._inflight)
+
+        self._inflight_started = now
+        self._inflight = asyncio.create_task(self._fetch(now))
+        return await asyncio.shield(self._inflight)
+
+    async def _fetch(self, started_at: float) -> PlaybackSnapshot:
+        self.fetch_count += 1
+        snapshot = PlaybackSnapshot(await self.sp.current_playback(), started_at)
+        previous = self._snapshot
+        # Una lettura partita prima non deve sovrascriverne una più recente
+        # né uno snapshot invalidato dopo la sua partenza.
+        if started_at >= self._invalidated_at and (previous is None or previous.fetched_at <= started_at):
+            self._snapshot = snapshot
+            self._notify(snapshot)
+        return snapshot
+
+    def _notify(self, current: PlaybackSnapshot):
+        previous = self._last_notified
+        if previous is not None and previous.uri == current.uri and previous.is_playing == current.is_playing:
+            return
+        self._last_notified = current
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait((previous, current))
+            except asyncio.QueueFull:
+                logger.debug("Coda di un iscritto allo stato di riproduzione piena, notifica scartata.")
+
+    def invalidate(self):
+        """Scarta lo snapshot corrente, ad esempio subito dopo un comando di riproduzione."""
+        self._snapshot = None
+        self._invalidated_at = time.monotonic()
+
+    async def confirm_playing(self, uri: str, timeout_s: Optional[float] = None, first_interval_s: float = 0.15,
+                              growth: float = 1.5, max_interval_s: float = 0.8) -> Tuple[bool, float]:
+        """
+        Interroga lo stato a intervalli crescenti (da `first_interval_s` fino a `max_interval_s`)
+        finché `uri` risulta in riproduzione o scade `timeout_s`. Ritorna (confermato, secondi
+        trascorsi): Spotify di solito cambia brano in poche centinaia di millisecondi.
+        """
+        timeout_s = self.confirm_timeout_s if timeout_s is None else timeout_s
+        start = time.monotonic()
+        deadline = start + timeout_s
+        interval = first_interval_s
+        polls = 0
+        while True:
+            await asyncio.sleep(max(0.0, min(interval, deadline - time.monotonic())))
+            polls += 1
+            try:
+                playback = await self.get(max_age_s=0)
+                if playback.is_playing and playback.uri == uri:
+                    elapsed = time.monotonic() - start
+                    logger.info(f"Riproduzione confermata in {elapsed * 1000:.0f} ms ({polls} letture).")
+                    return True, elapsed
+            except Exception as e:
+                logger.debug(f"Lettura di conferma fallita: {e}")
+            if time.monotonic() >= deadline:
+                elapsed = time.monotonic() - start
+                logger.warning(f"Nessuna conferma di riproduzione dopo {elapsed * 1000:.0f} ms ({polls} letture).")
+                return False, elapsed
+            interval = min(interval * growth, max_interval_s)
+
+    def subscribe(self, maxsize: int = 16) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
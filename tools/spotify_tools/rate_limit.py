@@ -0,0 +1,129 @@
+# tools/spotify_tools/rate_limit.py
+import asyncio
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import metrics
+from .errors import SpotifyException
+
+logger = logging.getLogger("spotify_tools.rate_limit")
+
+PRIORITY_USER = 0
+PRIORITY_BACKGROUND = 1
+
+_THROTTLED = metrics.counter("spotify_throttled_total", "Risposte 429 ricevute da Spotify")
+_DEFERRED = metrics.counter("spotify_deferred_total", "Richieste rimandate per mancanza di budget", ("priority",))
+
+# Priorità delle richieste partite dal task corrente. Il default è "utente": i moduli
+# di background (Jukebox, registro dispositivi, mirror libreria) la abbassano con
+# `background_requests()` all'inizio del proprio ciclo, e i task che creano la ereditano.
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("spotify_request_priority", default=PRIORITY_USER)
+
+
+@contextmanager
+def background_requests():
+    """Le richieste Spotify fatte all'interno del blocco cedono il passo a quelle dell'utente."""
+    token = _priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+def retry_after_s(error: Exception, default: float = 1.0) -> float:
+    """Secondi indicati dall'header Retry-After di una risposta 429 (o `default`)."""
+    headers = getattr(error, "headers", None) or {}
+    for key, value in headers.items():
+        if key.lower() == "retry-after":
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                break
+    return default
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return isinstance(error, SpotifyException) and error.http_status == 429
+
+
+class RateLimiter:
+    """
+    Budget condiviso per tutte le chiamate alla Web API (token bucket).
+
+    - Il bucket si ricarica di `rate_per_s` gettoni al secondo fino a `burst`.
+    - Le ultime `user_reserve` unità sono riservate alle richieste dell'utente: quando il
+      budget è scarso le richieste di background attendono (`deferred_background`).
+    - Dopo un 429 nessuna richiesta parte prima che sia trascorso il Retry-After.
+    """
+
+    def __init__(self, rate_per_s: float = 10.0, burst: int = 20, user_reserve: int = 5):
+        self.rate_per_s = rate_per_s
+        self.burst = burst
+        self.user_reserve = min(user_reserve, burst - 1)
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        # Contatori
+        self.requests = 0
+        self.throttled = 0
+        self.deferred_user = 0
+        self.deferred_background = 0
+        self.wait_total_s = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate_per_s)
+        self._updated_at = now
+
+    @property
+    def blocked_for_s(self) -> float:
+        return max(0.0, self._blocked_until - time.monotonic())
+
+    async def acquire(self, priority: Optional[int] = None):
+        priority = current_priority() if priority is None else priority
+        floor = 1.0 if priority == PRIORITY_USER else 1.0 + self.user_reserve
+        started = time.monotonic()
+        deferred = False
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            wait_s = self._blocked_until - now
+            if wait_s <= 0:
+                if self._tokens >= floor:
+                    self._tokens -= 1.0
+                    break
+                wait_s = (floor - self._tokens) / self.rate_per_s
+            if not deferred:
+                deferred = True
+                if priority == PRIORITY_USER:
+                    self.deferred_user += 1
+                else:
+                    self.deferred_background += 1
+                _DEFERRED.inc(priority="user" if priority == PRIORITY_USER else "background")
+            await asyncio.sleep(wait_s)
+        self.requests += 1
+        if deferred:
+            self.wait_total_s += time.monotonic() - started
+
+    def block(self, seconds: float):
+        """Registra un 429: tutte le richieste attendono almeno `seconds` secondi."""
+        self.throttled += 1
+        _THROTTLED.inc()
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        logger.warning(f"🚦 Spotify ha limitato le richieste (429): pausa di {seconds:.1f}s per tutte le chiamate.")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "deferred_user": self.deferred_user,
+            "deferred_background": self.deferred_background,
+            "wait_total_s": round(self.wait_total_s, 2),
+            "tokens": round(self._tokens, 1),
+        }
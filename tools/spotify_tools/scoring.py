@@ -0,0 +1,168 @@
+# tools/spotify_tools/scoring.py
+import logging
+import re
+from dataclasses import dataclass, fields
+from typing import Optional, Dict, Any, List, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("spotify_tools.scoring")
+
+UNDESIRED_KEYWORDS = (
+    'cover', 'tribute', 'karaoke', 'remix', 're-recorded', 'live', 'acoustic',
+    'instrumental', 'edit', 'version', 'symphony', 'orchestra',
+    'made popular by', 'in the style of'
+)
+UNDESIRED_ARTISTS = (
+    'karaoke', 'tribute band', 'all stars', 'party tyme', 'ameritz',
+    'royal philharmonic orchestra', 'tolga kashif', 'studio group'
+)
+
+
+@dataclass
+class ScoringWeights:
+    """Pesi delle caratteristiche usate per scegliere la traccia migliore."""
+    artist_id_match: float = 500.0   # l'artista della traccia è quello cercato
+    popularity: float = 1.0          # moltiplica la popolarità Spotify (0-100)
+    keyword_penalty: float = -250.0  # per ogni parola indesiderata nel titolo
+    artist_penalty: float = -300.0   # per ogni termine indesiderato nei nomi degli artisti
+    title_match: float = 50.0        # il titolo contiene il testo cercato
+    album: float = 25.0              # album_type == 'album'
+    compilation: float = -25.0       # album_type == 'compilation'
+
+    def as_vector(self) -> np.ndarray:
+        return np.array([getattr(self, f.name) for f in fields(self)], dtype=np.float64)
+
+
+def _compile_matcher(terms: Sequence[str]) -> re.Pattern:
+    # Il lookahead trova anche le occorrenze sovrapposte: ogni termine presente viene
+    # contato una volta, esattamente come il vecchio ciclo `if keyword in name`.
+    alternatives = "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True))
+    return re.compile(f"(?=({alternatives}))")
+
+
+class _TermCounter:
+    """Conta i termini distinti presenti in un testo, con cache sui testi già visti."""
+
+    def __init__(self, terms: Sequence[str], cache_size: int = 4096):
+        self._findall = _compile_matcher(terms).findall
+        self._cache: Dict[str, int] = {}
+        self._cache_size = cache_size
+
+    def clear(self):
+        self._cache.clear()
+
+    def __call__(self, text: str) -> int:
+        hits = self._cache.get(text)
+        if hits is None:
+            if len(self._cache) >= self._cache_size:
+                self._cache.clear()
+            hits = self._cache[text] = len(set(self._findall(text.lower())))
+        return hits
+
+
+# Punteggio minimo (escluso) perché un candidato venga accettato.
+MIN_ACCEPTED_SCORE = -999.0
+_DISCARDED_ROW = (0.0,) * 7 + (1.0,)
+_DISCARD_WEIGHT = -1e12
+_TRACK_CACHE_SIZE = 8192
+
+
+class TrackScorer:
+    """
+    Motore di ranking per una pagina di risultati di ricerca.
+
+    Le liste di parole e artisti indesiderati sono compilate in un'unica regex
+    ciascuna; ogni candidato viene normalizzato una sola volta (e ricordato per URI,
+    visto che le stesse tracce tornano in molte ricerche) e le caratteristiche
+    dell'intera pagina finiscono in una matrice NumPy, così il punteggio di tutti i
+    candidati è un singolo prodotto matrice × pesi.
+    """
+
+    def __init__(self, weights: Optional[ScoringWeights] = None,
+                 undesired_keywords: Sequence[str] = UNDESIRED_KEYWORDS,
+                 undesired_artists: Sequence[str] = UNDESIRED_ARTISTS):
+        self.weights = weights or ScoringWeights()
+        self._weight_vector = np.append(self.weights.as_vector(), _DISCARD_WEIGHT)
+        self._track_cache: Dict[str, Tuple] = {}
+        # Titoli e soprattutto artisti (karaoke, tribute band...) si ripetono tra una
+        # ricerca e l'altra: i conteggi vengono memorizzati per testo.
+        self._count_keywords = _TermCounter(undesired_keywords)
+        self._count_artist_terms = _TermCounter(undesired_artists)
+
+    def clear_cache(self):
+        self._track_cache.clear()
+        self._count_keywords.clear()
+        self._count_artist_terms.clear()
+
+    def _static_features(self, track: Dict[str, Any]) -> Tuple[float, float, float, float, float, str, frozenset]:
+        """Caratteristiche che non dipendono dalla query, calcolate una volta per traccia (URI)."""
+        key = track.get('uri') or track['name']
+        cached = self._track_cache.get(key)
+        if cached is None:
+            if len(self._track_cache) >= _TRACK_CACHE_SIZE:
+                self._track_cache.clear()
+            artists = track.get('artists', [])
+            album_type = (track.get('album') or {}).get('album_type')
+            cached = self._track_cache[key] = (
+                float(track.get('popularity', 0)),
+                float(self._count_keywords(track['name'])),
+                float(sum(self._count_artist_terms(a.get('name', '')) for a in artists)),
+                1.0 if album_type == 'album' else 0.0,
+                1.0 if album_type == 'compilation' else 0.0,
+                track['name'].lower(),
+                frozenset(a.get('id') for a in artists),
+            )
+        return cached
+
+    def features(self, tracks: List[Dict[str, Any]], search_track: str,
+                 original_artist_id: Optional[str]) -> np.ndarray:
+        """
+        Matrice n×8 delle caratteristiche della pagina, nell'ordine di ScoringWeights;
+        l'ultima colonna marca i candidati scartati (artista diverso da quello cercato).
+        """
+        search_lower = search_track.lower()
+        static_features = self._static_features
+        flat: List[float] = []
+        for track in tracks:
+            popularity, keywords, artist_terms, is_album, is_compilation, name_lower, artist_ids = static_features(track)
+            if original_artist_id and original_artist_id not in artist_ids:
+                flat.extend(_DISCARDED_ROW)
+                continue
+            flat.extend((
+                1.0 if original_artist_id else 0.0, popularity, keywords, artist_terms,
+                1.0 if search_lower in name_lower else 0.0, is_album, is_compilation, 0.0,
+            ))
+        return np.array(flat, dtype=np.float64).reshape(len(tracks), 8)
+
+    def score(self, tracks: List[Dict[str, Any]], search_track: str,
+              original_artist_id: Optional[str] = None) -> np.ndarray:
+        """Punteggi della pagina; i candidati scartati valgono circa -1e12."""
+        if not tracks:
+            return np.empty(0)
+        return self.features(tracks, search_track, original_artist_id) @ self._weight_vector
+
+    def best(self, tracks: List[Dict[str, Any]], search_track: str,
+             original_artist_id: Optional[str] = None) -> Optional[Tuple[Dict[str, Any], float]]:
+        scores = self.score(tracks, search_track, original_artist_id)
+        if scores.size == 0:
+            return None
+        # argmax restituisce il primo massimo: a parità vince il risultato più in alto, come prima.
+        best_idx = int(np.argmax(scores))
+        if not scores[best_idx] > MIN_ACCEPTED_SCORE:
+            return None
+        return tracks[best_idx], float(scores[best_idx])
+
+
+_track_scorer = TrackScorer()
+
+
+def configure_track_scorer(weights: Optional[Dict[str, float]] = None) -> TrackScorer:
+    """Sostituisce i pesi di default con quelli indicati (chiavi di ScoringWeights)."""
+    global _track_scorer
+    _track_scorer = TrackScorer(ScoringWeights(**(weights or {})))
+    return _track_scorer
+
+
+def get_track_scorer() -> TrackScorer:
+    return _track_scorer
@@ -0,0 +1,190 @@
+# tools/spotify_tools/search_cache.py
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Optional, Dict, Any, List, Iterator
+
+logger = logging.getLogger("spotify_tools.search_cache")
+
+# Campi delle tracce effettivamente usati da ranking e riproduzione: salvare
+# l'oggetto completo restituito da Spotify gonfierebbe il file senza motivo.
+_TRACK_FIELDS = ("id", "uri", "name", "popularity", "duration_ms", "explicit")
+_ALBUM_FIELDS = ("id", "name", "album_type")
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_term(text: Optional[str]) -> str:
+    """Normalizza un termine di ricerca: minuscolo, senza accenti né punteggiatura."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(" ", text.casefold()).strip()
+
+
+def slim_track(track: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia ridotta di una traccia della Web API con i soli campi usati dai tool."""
+    slim = {k: track[k] for k in _TRACK_FIELDS if k in track}
+    slim["artists"] = [{"id": a.get("id"), "name": a.get("name", "")} for a in track.get("artists", [])]
+    album = track.get("album") or {}
+    slim["album"] = {k: album[k] for k in _ALBUM_FIELDS if k in album}
+    return slim
+
+
+class SearchCache:
+    """
+    Cache su disco (SQLite) dei risultati di ricerca Spotify.
+
+    Contiene due tabelle: le pagine di tracce indicizzate per (traccia, artista, mercato)
+    normalizzati e la corrispondenza nome artista → ID artista. Ogni voce scade dopo
+    `ttl_s` secondi; oltre `max_entries` voci per tabella vengono eliminate quelle
+    usate meno di recente (LRU). Il file sopravvive ai riavvii del processo.
+
+    Un hit è solo una lettura: l'istante di accesso resta in memoria e viene scritto
+    insieme al prossimo inserimento nella stessa tabella (prima dell'eviction LRU)
+    o alla chiusura, così l'event loop non paga una scrittura su disco per ogni hit.
+    """
+
+    def __init__(self, path: str, ttl_s: float = 7 * 24 * 3600, max_entries: int = 2000):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.hits = {"tracks": 0, "artists": 0}
+        self.misses = {"tracks": 0, "artists": 0}
+        self._lock = threading.Lock()
+        # Accessi non ancora scritti: tabella → chiave → istante dell'ultimo hit.
+        self._touched: Dict[str, Dict[str, float]] = {"track_searches": {}, "artist_ids": {}}
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS track_searches (
+                key TEXT PRIMARY KEY, payload TEXT NOT NULL,
+                created_at REAL NOT NULL, last_access REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_track_searches_access ON track_searches(last_access);
+            CREATE TABLE IF NOT EXISTS artist_ids (
+                key TEXT PRIMARY KEY, artist_id TEXT NOT NULL,
+                created_at REAL NOT NULL, last_access REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_artist_ids_access ON artist_ids(last_access);
+        """)
+
+    @staticmethod
+    def _track_key(track: str, artist: Optional[str], market: Optional[str]) -> str:
+        return "\x1f".join((normalize_term(track), normalize_term(artist), (market or "").upper()))
+
+    def _get(self, table: str, column: str, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(f"SELECT {column}, created_at FROM {table} WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl_s:
+                self._touched[table][key] = now
+                return row[0]
+            if row:
+                self._touched[table].pop(key, None)
+                self._conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+        return None
+
+    def _flush_touches(self, table: str):
+        """Scrive gli accessi in sospeso di `table`. Va chiamata con il lock e dentro una transazione."""
+        touched = self._touched[table]
+        if touched:
+            self._conn.executemany(f"UPDATE {table} SET last_access = max(last_access, ?) WHERE key = ?",
+                                   [(at, key) for key, at in touched.items()])
+            touched.clear()
+
+    def _put(self, table: str, column: str, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            # Una sola transazione: accessi in sospeso, inserimento ed eviction LRU sugli accessi aggiornati.
+            self._conn.execute("BEGIN")
+            try:
+                self._touched[table].pop(key, None)
+                self._flush_touches(table)
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO {table} (key, {column}, created_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE key IN (SELECT key FROM {table} ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_tracks(self, track: str, artist: Optional[str], market: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        payload = self._get("track_searches", "payload", self._track_key(track, artist, market))
+        if payload is None:
+            self.misses["tracks"] += 1
+            return None
+        self.hits["tracks"] += 1
+        logger.debug(f"Cache HIT tracce per '{track}' / '{artist or 'N/A'}'.")
+        return json.loads(payload)
+
+    def put_tracks(self, track: str, artist: Optional[str], market: Optional[str], tracks: List[Dict[str, Any]]):
+        payload = json.dumps([slim_track(t) for t in tracks], separators=(",", ":"))
+        self._put("track_searches", "payload", self._track_key(track, artist, market), payload)
+
+    def get_artist_id(self, artist: str) -> Optional[str]:
+        artist_id = self._get("artist_ids", "artist_id", normalize_term(artist))
+        if artist_id is None:
+            self.misses["artists"] += 1
+            return None
+        self.hits["artists"] += 1
+        logger.debug(f"Cache HIT ID artista per '{artist}'.")
+        return artist_id
+
+    def put_artist_id(self, artist: str, artist_id: str):
+        self._put("artist_ids", "artist_id", normalize_term(artist), artist_id)
+
+    def iter_cached_tracks(self, per_search: int = 3) -> Iterator[Dict[str, Any]]:
+        """Le prime `per_search` tracce di ogni ricerca in cache (per alimentare altri indici locali)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT payload FROM track_searches").fetchall()
+        for (payload,) in rows:
+            yield from json.loads(payload)[:per_search]
+
+    def stats(self) -> Dict[str, Any]:
+        """Contatori di hit/miss per tabella e hit ratio complessivo."""
+        hits, misses = sum(self.hits.values()), sum(self.misses.values())
+        return {
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN")
+                for table in self._touched:
+                    self._flush_touches(table)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                logger.warning(f"Accessi recenti della cache ricerche non salvati: {e}")
+            finally:
+                self._conn.close()
+
+
+_search_cache: Optional[SearchCache] = None
+
+
+def initialize_search_cache(path: str, ttl_s: float, max_entries: int) -> Optional[SearchCache]:
+    global _search_cache
+    try:
+        _search_cache = SearchCache(path, ttl_s=ttl_s, max_entries=max_entries)
+        logger.info(f"✅ Cache ricerche Spotify aperta su '{path}'.")
+    except sqlite3.Error as e:
+        logger.error(f"❌ Impossibile aprire la cache ricerche '{path}': {e}. Proseguo senza cache.")
+        _search_cache = None
+    return _search_cache
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    return _search_cache
@@ -0,0 +1,107 @@
+# tools/spotify_tools/token_manager.py
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, Any, TYPE_CHECKING
+
+from .async_client import AsyncSpotify
+
+if TYPE_CHECKING:
+    from spotipy.oauth2 import SpotifyOAuth
+
+logger = logging.getLogger("spotify_tools.token_manager")
+
+
+class TokenManager:
+    """
+    Ciclo di vita dell'access token OAuth di Spotify.
+
+    Il token dura circa un'ora: il manager lo rinnova in background `refresh_margin_s`
+    secondi prima della scadenza, usando il refresh token del `SpotifyOAuth` (che
+    aggiorna anche il file di cache), e lo sostituisce nel client condiviso con
+    `AsyncSpotify.set_auth`. Il refresh gira in un thread e nessuna richiesta lo
+    attende: le chiamate in corso usano il token vecchio, ancora valido, e quelle
+    successive quello nuovo. Se una richiesta riceve comunque un 401 (es. dopo una
+    sospensione del sistema), il client chiama `request_refresh` e il rinnovo parte
+    subito, senza aspettare la scadenza prevista.
+    """
+
+    def __init__(self, auth_manager: "SpotifyOAuth", client: AsyncSpotify, token_info: Dict[str, Any],
+                 refresh_margin_s: float = 300.0, retry_interval_s: float = 30.0):
+        self.auth_manager = auth_manager
+        self.client = client
+        self.refresh_margin_s = refresh_margin_s
+        self.retry_interval_s = retry_interval_s
+        self._token_info = token_info
+        self._wake_event = asyncio.Event()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._running = False
+        # Contatori
+        self.refreshes = 0
+        self.failures = 0
+        self.forced_refreshes = 0
+        client.set_auth(token_info['access_token'])
+        client.on_unauthorized = self.request_refresh
+
+    @property
+    def expires_in_s(self) -> float:
+        return self._token_info.get('expires_at', 0) - time.time()
+
+    def request_refresh(self):
+        """Chiede un rinnovo immediato (non bloccante), es. dopo un 401."""
+        self.forced_refreshes += 1
+        self._wake_event.set()
+
+    def _refresh_blocking(self) -> Dict[str, Any]:
+        return self.auth_manager.refresh_access_token(self._token_info['refresh_token'])
+
+    async def refresh(self) -> bool:
+        """Rinnova il token; le chiamate concorrenti condividono lo stesso rinnovo."""
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(asyncio.to_thread(self._refresh_blocking))
+        task = self._refresh_task
+        try:
+            token_info = await asyncio.shield(task)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"⚠️ Refresh del token Spotify fallito: {e}")
+            return False
+        finally:
+            if self._refresh_task is task and task.done():
+                self._refresh_task = None
+        # Un solo assegnamento sul loop: nessuna richiesta vede un token "a metà".
+        self._token_info = token_info
+        self.client.set_auth(token_info['access_token'])
+        self.refreshes += 1
+        logger.info(f"🔑 Token Spotify rinnovato (scade tra {self.expires_in_s / 60:.0f} min).")
+        return True
+
+    async def run(self):
+        logger.info(f"🔑 Gestione token Spotify avviata (scade tra {self.expires_in_s / 60:.0f} min).")
+        self._running = True
+        try:
+            while self._running:
+                timeout = max(0.0, self.expires_in_s - self.refresh_margin_s)
+                try:
+                    await asyncio.wait_for(self._wake_event.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake_event.clear()
+                if not self._running:
+                    break
+                if not await self.refresh():
+                    await asyncio.sleep(self.retry_interval_s)
+        finally:
+            self._running = False
+
+    def stop(self):
+        self._running = False
+        self._wake_event.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "forced_refreshes": self.forced_refreshes,
+            "expires_in_s": round(self.expires_in_s),
+        }
@@ -0,0 +1,29 @@
+# tools/spotify_tools/tool_specs.py
+from typing import List
+
+from tools.registry import ToolSpec
+from .search import play_specific_spotify_track, add_to_queue, GetCurrentSongInfo
+from .playlist_artist import PlaySpotifyPlaylist, PlaySpotifyArtist, PlayGenre, PlayMoodOrActivity
+
+# Tutti i comandi che avviano una riproduzione appartengono allo stesso gruppo:
+# vince l'ultimo, così due richieste ravvicinate non si contendono start_playback.
+PLAYBACK_GROUP = "playback"
+
+
+def spotify_tool_specs() -> List[ToolSpec]:
+    """Tool Spotify esposti all'agente, con la loro semantica di esecuzione."""
+    return [
+        # La conferma (polling dello stato) e l'eventuale correzione GPT possono richiedere alcuni secondi.
+        ToolSpec("play_specific_spotify_track", play_specific_spotify_track, fire_and_forget=True,
+                 timeout_s=30.0, exclusive_group=PLAYBACK_GROUP, starts_playback=True,
+                 context_args=("spotify_polling_queue",)),
+        ToolSpec("PlaySpotifyPlaylist", PlaySpotifyPlaylist, fire_and_forget=True,
+                 timeout_s=15.0, exclusive_group=PLAYBACK_GROUP, starts_playback=True),
+        ToolSpec("PlaySpotifyArtist", PlaySpotifyArtist, fire_and_forget=True,
+                 timeout_s=15.0, exclusive_group=PLAYBACK_GROUP, starts_playback=True),
+        ToolSpec("PlayGenre", PlayGenre, timeout_s=15.0, exclusive_group=PLAYBACK_GROUP),
+        ToolSpec("PlayMoodOrActivity", PlayMoodOrActivity, timeout_s=15.0, exclusive_group=PLAYBACK_GROUP),
+        # Le aggiunte in coda restano una alla volta, nell'ordine in cui arrivano.
+        ToolSpec("add_to_queue", add_to_queue, timeout_s=15.0),
+        ToolSpec("GetCurrentSongInfo", GetCurrentSongInfo, timeout_s=5.0, max_concurrent=4),
+    ]